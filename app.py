@@ -1,15 +1,24 @@
 #!/usr/bin/python
 import os
+import time
+import atexit
 import traceback
+from threading import Thread
 
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, g
 from flask_restful import Api
 from flask_gzip import Gzip
 
-from config import PORT, ENV, config_get_current_settings_as_list
+from config import PORT, ENV, SERVICE_ROLE, EVENTS_STREAM_PORT, config_get_current_settings_as_list
 from log import error, warn, info, debug
 from ibeacon_scanner.resources import ibeacon_add_http_resources_to_api
-from ibeacon_scanner.services import ibeacon_init_scanner, ibeacon_stop_scanner
+from event.resources import event_add_http_resources_to_api
+from event.stream_server import event_run_stream_server
+from metrics.resources import metrics_add_http_resources_to_api
+from collector.resources import collector_add_http_resources_to_api
+from metrics.services import metrics_register_histogram, metrics_observe
+from ibeacon_scanner.services import ibeacon_init_scanner, ibeacon_stop_scanner, ibeacon_create_supervisor, \
+    ibeacon_get_supervisor_status
 
 
 application = Flask(
@@ -20,6 +29,7 @@ application = Flask(
 flask_restful_api = Api(application)
 flask_gzip = Gzip(application)
 application.config['PROPAGATE_EXCEPTIONS'] = True
+metrics_register_histogram("http_request_duration_seconds", "Time to build the response of each HTTP resource")
 
 
 @application.errorhandler(404)
@@ -38,12 +48,28 @@ def handle_exception(error_msg):
     return jsonify(response), 400
 
 
+@application.before_request
+def before_request():
+    g.request_started_at = time.perf_counter()
+
+
 @application.after_request
 def after_request(response):
+    # streamed responses are measured until their stream starts
+    if 'request_started_at' in g:
+        metrics_observe(
+            "http_request_duration_seconds",
+            time.perf_counter() - g.request_started_at,
+            resource=request.url_rule.rule if request.url_rule else "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE')
-    response.headers.add('Cache-Control', 'no-store, no-cache')
+    # routes that support revalidation set their own cache policy
+    if 'Cache-Control' not in response.headers:
+        response.headers.add('Cache-Control', 'no-store, no-cache')
     return response
 
 
@@ -51,8 +77,10 @@ def after_request(response):
 def status():
     return jsonify({
         "service_name": "beacons-scanner",
+        "role": SERVICE_ROLE,
         "status": "running",
         "env": ENV,
+        "scanner": ibeacon_get_supervisor_status(),
     })
 
 
@@ -81,12 +109,25 @@ def _show_welcome_message():
 def _init_application():
     _show_welcome_message()
     info("Starting to run BLE Service")
+    event_add_http_resources_to_api(flask_restful_api, prefix="/events")
+    metrics_add_http_resources_to_api(flask_restful_api)
+    # a collector only aggregates the reports uploaded by the scanners, it does not scan
+    if SERVICE_ROLE == "collector":
+        collector_add_http_resources_to_api(flask_restful_api, prefix="/collector")
+        return
     ibeacon_add_http_resources_to_api(flask_restful_api, prefix="/ibeacon_scanner")
-    os.system("python bin/run_ibeacon_scanner.py &")
+    # the scanner is forked from this worker, a host lock keeps it single if other workers or instances start one
+    scanner_supervisor = ibeacon_create_supervisor()
+    scanner_supervisor.start()
+    # uWSGI runs the exit handlers of a worker when it stops, with die-on-term on a SIGTERM
+    atexit.register(scanner_supervisor.stop)
 
 
 _init_application()
 
 
 if __name__ == "__main__":
+    # uWSGI starts the events stream server, here it runs once in the process that survives the reloads
+    if EVENTS_STREAM_PORT and os.environ.get('WERKZEUG_RUN_MAIN') != "true":
+        Thread(name="event_stream_server", target=event_run_stream_server, daemon=True).start()
     application.run(host="0.0.0.0", port=PORT, debug=True)
\ No newline at end of file
@@ -1,3 +1,12 @@
-from ibeacon_scanner.services import ibeacon_init_scanner
+import signal
 
-ibeacon_init_scanner()
\ No newline at end of file
+from ibeacon_scanner.services import ibeacon_create_supervisor
+
+
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+
+# runs the scanner supervised in the foreground, stopping it gracefully on SIGTERM
+signal.signal(signal.SIGTERM, _stop)
+ibeacon_create_supervisor().run()
\ No newline at end of file
@@ -0,0 +1,134 @@
+import time
+from threading import Lock
+
+
+PRUNE_INTERVAL = 60
+
+
+class GlobalBeaconIndex:
+    """ Latest reading of each beacon by each scanner of the fleet, keyed by (uuid, major, minor)
+
+    Every beacon keeps the scanner that hears it best, the one with the strongest reading
+    not older than expiry seconds. It is only searched again among the scanners of that
+    beacon when the best reading weakens or expires, so most readings cost one lookup.
+    Beacons that no scanner heard for expiry seconds are removed.
+    """
+
+    def __init__(self, expiry=30.0):
+        self.expiry = expiry
+        # readings by beacon key, each a dict of scanner id to (time, rssi, mac_address, tx_power)
+        self._readings = {}
+        self._best_scanners = {}
+        self._scanners = {}
+        self._lock = Lock()
+        self._pruned_at = time.monotonic()
+
+    def _find_best_scanner(self, readings, now):
+        fresh_readings = [(reading[1], scanner_id) for scanner_id, reading in readings.items()
+            if now - reading[0] <= self.expiry]
+        return max(fresh_readings)[1] if fresh_readings else None
+
+    def _add_reading(self, key, scanner_id, reading, now):
+        readings = self._readings.get(key)
+        if readings is None:
+            readings = self._readings[key] = {}
+        previous_reading = readings.get(scanner_id)
+        # reports of one scanner may arrive late, an older reading never replaces a newer one
+        if previous_reading and previous_reading[0] > reading[0]:
+            return
+        readings[scanner_id] = reading
+        best_scanner = self._best_scanners.get(key)
+        best_reading = readings.get(best_scanner)
+        if best_reading is None or now - best_reading[0] > self.expiry:
+            self._best_scanners[key] = self._find_best_scanner(readings, now)
+        elif scanner_id == best_scanner:
+            if reading[1] < previous_reading[1]:
+                self._best_scanners[key] = self._find_best_scanner(readings, now)
+        elif reading[1] > best_reading[1]:
+            self._best_scanners[key] = scanner_id
+
+    def ingest(self, scanner_id, reports, clock_offset=0.0, now=None):
+        """ Adds the readings of the reports of a scanner, returns how many readings were added
+
+        Each report is {'time': ..., 'beacons': [[mac_address, uuid, major, minor, tx_power, rssi], ...]},
+        its time from the scanner clock, moved by clock_offset seconds to the collector clock.
+        """
+        now = time.time() if now is None else now
+        readings_count = 0
+        with self._lock:
+            for report in reports:
+                report_time = min(report['time'] + clock_offset, now)
+                for mac_address, uuid, major, minor, tx_power, rssi in report['beacons']:
+                    self._add_reading((uuid, major, minor), scanner_id, (report_time, rssi, mac_address, tx_power), now)
+                readings_count += len(report['beacons'])
+            scanner = self._scanners.setdefault(scanner_id, {'reports': 0, 'readings': 0})
+            scanner['reports'] += len(reports)
+            scanner['readings'] += readings_count
+            scanner['last_report_at'] = now
+            scanner['clock_offset'] = clock_offset
+            if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+                self._prune(now)
+        return readings_count
+
+    def _prune(self, now):
+        self._pruned_at = time.monotonic()
+        for key, readings in list(self._readings.items()):
+            for scanner_id in [scanner_id for scanner_id, reading in readings.items() if now - reading[0] > self.expiry]:
+                del readings[scanner_id]
+            if not readings:
+                del self._readings[key]
+                self._best_scanners.pop(key, None)
+            elif self._best_scanners.get(key) not in readings:
+                self._best_scanners[key] = self._find_best_scanner(readings, now)
+
+    def _render_beacon(self, key, readings, now):
+        best_scanner = self._best_scanners.get(key)
+        best_reading = readings.get(best_scanner)
+        if best_reading is None or now - best_reading[0] > self.expiry:
+            best_scanner = self._find_best_scanner(readings, now)
+            best_reading = readings.get(best_scanner)
+        if best_reading is None:
+            return None
+        uuid, major, minor = key
+        return {
+            'uuid': uuid,
+            'major': major,
+            'minor': minor,
+            'mac_address': best_reading[2],
+            'tx_power': best_reading[3],
+            'best_scanner': best_scanner,
+            'rssi': best_reading[1],
+            'last_seen': max(reading[0] for reading in readings.values()),
+            'scanners': {
+                scanner_id: {'rssi': reading[1], 'last_seen': reading[0]}
+                for scanner_id, reading in readings.items() if now - reading[0] <= self.expiry
+            },
+        }
+
+    def get(self, uuid, major, minor, now=None):
+        """ Returns the beacon with its best scanner, or None if no scanner heard it recently """
+        now = time.time() if now is None else now
+        with self._lock:
+            readings = self._readings.get((uuid, major, minor))
+            return self._render_beacon((uuid, major, minor), readings, now) if readings else None
+
+    def beacons(self, uuid=None, major=None, minor=None, scanner_id=None, now=None):
+        """ Returns the beacons heard recently matching the filters given, strongest first """
+        now = time.time() if now is None else now
+        with self._lock:
+            beacons = [
+                self._render_beacon(key, readings, now) for key, readings in self._readings.items()
+                if (uuid is None or key[0] == uuid) and (major is None or key[1] == major)
+                    and (minor is None or key[2] == minor)
+            ]
+        beacons = [beacon for beacon in beacons if beacon and (scanner_id is None or beacon['best_scanner'] == scanner_id)]
+        return sorted(beacons, key=lambda beacon: beacon['rssi'], reverse=True)
+
+    def scanners(self, now=None):
+        """ Returns the reports and readings received from each scanner and the seconds since its last report """
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                scanner_id: dict(scanner, last_report_age=now - scanner['last_report_at'])
+                for scanner_id, scanner in self._scanners.items()
+            }
@@ -0,0 +1,43 @@
+#!/usr/bin/python
+from flask import request
+from flask_restful import Resource
+
+from log import error, warn, info, debug
+from collector.services import collector_ingest_reports, collector_get_beacons, collector_get_beacon, \
+    collector_get_scanners
+
+
+class CollectorReportsResource(Resource):
+
+    def post(self):
+        return collector_ingest_reports(request.get_data(), request.headers.get('Content-Encoding', ''))
+
+
+class CollectorBeaconsResource(Resource):
+
+    def get(self):
+        return collector_get_beacons(**request.args.to_dict())
+
+
+class CollectorBeaconResource(Resource):
+
+    def get(self, uuid, major, minor):
+        beacon = collector_get_beacon(uuid, major, minor)
+        if beacon is None:
+            return {'message': f"No scanner heard beacon {uuid} {major} {minor} recently"}, 404
+        return beacon
+
+
+class CollectorScannersResource(Resource):
+
+    def get(self):
+        return collector_get_scanners()
+
+
+def collector_add_http_resources_to_api(flask_restful_api, prefix=""):
+    info("Adding 'collector_add_http_resources' resources to application")
+    prefix = f"/{prefix}" if prefix and not prefix.startswith("/") else prefix
+    flask_restful_api.add_resource(CollectorReportsResource, f'{prefix}/reports')
+    flask_restful_api.add_resource(CollectorBeaconsResource, f'{prefix}/beacons')
+    flask_restful_api.add_resource(CollectorBeaconResource, f'{prefix}/beacons/<string:uuid>/<int:major>/<int:minor>')
+    flask_restful_api.add_resource(CollectorScannersResource, f'{prefix}/scanners')
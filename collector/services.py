@@ -0,0 +1,103 @@
+import json
+import time
+import zlib
+import socket
+
+from log import error, warn, info, debug
+from config import SCANNER_ID, COLLECTOR_URL, COLLECTOR_UPLOAD_INTERVAL, COLLECTOR_UPLOAD_BATCH_SIZE, \
+    COLLECTOR_UPLOAD_QUEUE_SIZE, COLLECTOR_MAX_BACKOFF, COLLECTOR_BEACON_EXPIRY
+from collector.models import GlobalBeaconIndex
+from collector.uploader import ReportUploader
+from metrics.services import metrics_register_counter, metrics_register_histogram, metrics_inc, metrics_time
+
+
+# decompressed size limit of an uploaded batch of reports
+MAX_REPORTS_BYTES = 16 * 1024 * 1024
+
+_global_beacon_index = GlobalBeaconIndex(expiry=COLLECTOR_BEACON_EXPIRY)
+
+metrics_register_counter("collector_reports_ingested_total", "Scan cycle reports ingested from the scanners, by scanner")
+metrics_register_counter("collector_readings_ingested_total", "Beacon readings ingested from the scanners, by scanner")
+metrics_register_histogram("collector_ingest_seconds", "Time to decompress, decode and index an uploaded batch of reports")
+
+
+def _decode_reports_batch(payload, content_encoding):
+    if content_encoding == "gzip":
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        payload = decompressor.decompress(payload, MAX_REPORTS_BYTES)
+        if decompressor.unconsumed_tail:
+            raise ValueError(f"Reports batch exceeds {MAX_REPORTS_BYTES} bytes once decompressed")
+    elif content_encoding:
+        raise ValueError(f"Unsupported reports batch encoding '{content_encoding}'")
+    reports_batch = json.loads(payload)
+    if not isinstance(reports_batch, dict) or not reports_batch.get('scanner_id') \
+            or not isinstance(reports_batch.get('reports'), list):
+        raise ValueError("Reports batch must have a 'scanner_id' and a list of 'reports'")
+    return reports_batch
+
+
+def collector_get_scanner_id():
+    """ Scanner name sent with the reports, the host name unless SCANNER_ID is set """
+    return SCANNER_ID or socket.gethostname()
+
+
+def collector_create_uploader():
+    """ Starts uploading reports to the collector, or returns None if COLLECTOR_URL is not set """
+    if not COLLECTOR_URL:
+        return None
+    report_uploader = ReportUploader(
+        COLLECTOR_URL,
+        collector_get_scanner_id(),
+        interval=COLLECTOR_UPLOAD_INTERVAL,
+        batch_size=COLLECTOR_UPLOAD_BATCH_SIZE,
+        queue_size=COLLECTOR_UPLOAD_QUEUE_SIZE,
+        max_backoff=COLLECTOR_MAX_BACKOFF,
+    )
+    report_uploader.start()
+    return report_uploader
+
+
+def collector_stop_uploader(report_uploader):
+    """ Stops the uploader after a last attempt of at most COLLECTOR_UPLOAD_INTERVAL to send the queued reports """
+    report_uploader.stop(COLLECTOR_UPLOAD_INTERVAL)
+
+
+def collector_ingest_reports(payload, content_encoding=""):
+    """ Indexes an uploaded batch of reports, raises ValueError if it is not valid """
+    received_at = time.time()
+    with metrics_time("collector_ingest_seconds"):
+        reports_batch = _decode_reports_batch(payload, content_encoding.lower())
+        scanner_id = str(reports_batch['scanner_id'])
+        # report times come from the scanner clock, sent_at tells how far it is from this one
+        sent_at = reports_batch.get('sent_at')
+        clock_offset = received_at - sent_at if isinstance(sent_at, (int, float)) else 0.0
+        try:
+            readings_count = _global_beacon_index.ingest(
+                scanner_id, reports_batch['reports'], clock_offset, received_at)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Malformed report from scanner '{scanner_id}': {e}")
+    metrics_inc("collector_reports_ingested_total", len(reports_batch['reports']), scanner=scanner_id)
+    metrics_inc("collector_readings_ingested_total", readings_count, scanner=scanner_id)
+    return {
+        'scanner_id': scanner_id,
+        'reports': len(reports_batch['reports']),
+        'readings': readings_count,
+    }
+
+
+def collector_get_beacons(**kwargs):
+    """ Returns the beacons heard by the fleet matching uuid, major, minor and best scanner_id """
+    return _global_beacon_index.beacons(
+        uuid=kwargs.get('uuid'),
+        major=None if kwargs.get('major') is None else int(kwargs['major']),
+        minor=None if kwargs.get('minor') is None else int(kwargs['minor']),
+        scanner_id=kwargs.get('scanner_id'),
+    )
+
+
+def collector_get_beacon(uuid, major, minor):
+    return _global_beacon_index.get(uuid, int(major), int(minor))
+
+
+def collector_get_scanners():
+    return _global_beacon_index.scanners()
@@ -0,0 +1,146 @@
+import gzip
+import json
+import time
+import random
+from collections import deque
+from threading import Thread, Condition, Event
+
+import requests
+
+from log import error, warn, info, debug
+from metrics.services import metrics_register_counter, metrics_register_histogram, metrics_inc, metrics_time
+
+
+UPLOAD_GZIP_LEVEL = 6
+RETRY_BACKOFF = 0.5
+
+metrics_register_counter("collector_reports_uploaded_total", "Scan cycle reports accepted by the collector")
+metrics_register_counter("collector_reports_dropped_total", "Scan cycle reports discarded because the upload queue was full")
+metrics_register_counter("collector_upload_failures_total", "Uploads of reports to the collector that failed")
+metrics_register_histogram("collector_upload_seconds", "Time to compress and post a batch of reports to the collector")
+
+
+def encode_report(beacons_list, now):
+    """ One scan cycle as sent to the collector, each beacon as a compact list of its fields """
+    return {
+        'time': now,
+        'beacons': [[b.mac_address, b.uuid, b.major, b.minor, b.tx_power, b.rssi] for b in beacons_list],
+    }
+
+
+class ReportUploader:
+    """ Bounded queue of scan cycle reports posted gzipped to the collector in batches by a background thread
+
+    Reports are sent at most once per interval, batch_size at a time. A failed upload keeps
+    its reports at the head of the queue and the next one waits twice as long, up to
+    max_backoff seconds, with some jitter so a fleet does not retry in lockstep. While the
+    collector is unreachable the oldest reports are dropped beyond queue_size.
+    """
+
+    def __init__(self, url, scanner_id, interval=1.0, batch_size=20, queue_size=300, max_backoff=60, timeout=5):
+        self.url = url
+        self.scanner_id = scanner_id
+        self.interval = interval
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._queue = deque()
+        self._condition = Condition()
+        self._stop_event = Event()
+        self._thread = None
+        self._session = requests.Session()
+        self.failures = 0
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = Thread(name="collector_report_uploader", target=self._run, daemon=True)
+        self._thread.start()
+        info(f"Uploading reports of scanner '{self.scanner_id}' to collector '{self.url}'")
+
+    def stop(self, timeout=None):
+        """ Stops the uploader after a last attempt to send the queued reports """
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, beacons_list, now=None):
+        """ Queues the report of a scan cycle without blocking """
+        report = encode_report(beacons_list, time.time() if now is None else now)
+        with self._condition:
+            if len(self._queue) >= self.queue_size:
+                self._queue.popleft()
+                metrics_inc("collector_reports_dropped_total")
+            self._queue.append(report)
+            self._condition.notify()
+
+    def _encode_batch(self, reports):
+        payload = json.dumps({
+            'scanner_id': self.scanner_id,
+            'sent_at': time.time(),
+            'reports': reports,
+        }, separators=(',', ':')).encode()
+        return gzip.compress(payload, compresslevel=UPLOAD_GZIP_LEVEL)
+
+    def _upload(self, reports):
+        with metrics_time("collector_upload_seconds"):
+            response = self._session.post(
+                self.url,
+                data=self._encode_batch(reports),
+                headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'},
+                timeout=self.timeout,
+            )
+        response.raise_for_status()
+
+    def _remove_uploaded(self, reports):
+        uploaded_reports = {id(report) for report in reports}
+        with self._condition:
+            # the head of the queue may have been dropped while uploading, only sent reports are removed
+            while self._queue and id(self._queue[0]) in uploaded_reports:
+                self._queue.popleft()
+
+    def _retry_later(self, e):
+        self.failures += 1
+        metrics_inc("collector_upload_failures_total")
+        backoff = min(RETRY_BACKOFF * 2 ** (self.failures - 1), self.max_backoff) * random.uniform(0.5, 1)
+        warn(f"Collector '{self.url}' failed: {e}. Retrying in {backoff:.1f}s...")
+        self._stop_event.wait(backoff)
+
+    def _run(self):
+        while 1:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._stop_event.is_set())
+                reports = [self._queue[index] for index in range(min(len(self._queue), self.batch_size))]
+            if not reports:
+                return
+            # stopping after a failure gives up instead of waiting for the collector
+            if self._stop_event.is_set() and self.failures:
+                error(f"Dropping {len(self._queue)} reports, collector '{self.url}' is not reachable")
+                return
+            try:
+                self._upload(reports)
+            except requests.HTTPError as e:
+                # the collector rejected the reports themselves, sending them again would fail the same
+                if 400 <= e.response.status_code < 500 and e.response.status_code != 429:
+                    error(f"Dropping {len(reports)} reports rejected by collector '{self.url}': {e}")
+                    metrics_inc("collector_reports_dropped_total", len(reports))
+                    self._remove_uploaded(reports)
+                    continue
+                self._retry_later(e)
+                continue
+            except Exception as e:
+                self._retry_later(e)
+                continue
+            self.failures = 0
+            metrics_inc("collector_reports_uploaded_total", len(reports))
+            self._remove_uploaded(reports)
+            if self._stop_event.is_set():
+                if not self._queue:
+                    return
+                continue
+            # a full queue is sent right away, otherwise reports are batched for an interval
+            if len(self._queue) < self.batch_size:
+                self._stop_event.wait(self.interval)
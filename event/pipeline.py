@@ -0,0 +1,150 @@
+import time
+from collections import deque
+from threading import Thread, Condition, Event
+
+from log import error, warn, info, debug
+
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+MAX_RETRIES = 5
+RETRY_BACKOFF = 0.5
+MAX_RETRY_BACKOFF = 30
+
+
+class PermanentDeliveryError(Exception):
+    """ Raised by a sink for a batch that would fail again on every retry """
+
+
+class EventSinkWorker:
+    """ Bounded queue of events drained in batches to one sink by a background thread """
+
+    def __init__(self, sink, queue_size=1000, batch_size=50, batch_timeout=1.0, policy=DROP_OLDEST):
+        self.sink = sink
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.policy = policy
+        self._queue = deque()
+        self._condition = Condition()
+        self._stop_event = Event()
+        self._thread = None
+        # delivery statistics
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retries = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+
+    def start(self):
+        self._thread = Thread(name=f"event_sink_{self.sink.name}", target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """ Stops the worker once the queued events are delivered or timeout expires """
+        self._stop_event.set()
+        with self._condition:
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def put(self, event_json):
+        """ Queues the event without blocking, returns False if the event was dropped """
+        with self._condition:
+            if len(self._queue) >= self.queue_size:
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return False
+                self._queue.popleft()
+            self._queue.append((time.monotonic(), event_json))
+            self._condition.notify()
+        return True
+
+    def _next_batch(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._queue or self._stop_event.is_set())
+            # waits for a full batch, but no longer than batch_timeout since the oldest event
+            deadline = self._queue[0][0] + self.batch_timeout if self._queue else 0
+            while len(self._queue) < self.batch_size and not self._stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            batch_size = min(len(self._queue), self.batch_size)
+            return [self._queue.popleft() for _ in range(batch_size)]
+
+    def _deliver(self, batch):
+        events = [event_json for _, event_json in batch]
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                self.sink.deliver(events)
+            except PermanentDeliveryError as e:
+                # retrying would hold the queue behind a batch that never gets through
+                error(f"Dropping {len(events)} events rejected by sink '{self.sink.name}': {e}")
+                self.rejected += len(events)
+                return
+            except Exception as e:
+                if attempt == MAX_RETRIES or self._stop_event.is_set():
+                    error(f"Dropping {len(events)} events, sink '{self.sink.name}' failed: {e}")
+                    self.failed += len(events)
+                    return
+                backoff = min(RETRY_BACKOFF * 2 ** attempt, MAX_RETRY_BACKOFF)
+                warn(f"Sink '{self.sink.name}' failed: {e}. Retrying in {backoff}s...")
+                self.retries += 1
+                self._stop_event.wait(backoff)
+                continue
+            delivered_at = time.monotonic()
+            for queued_at, _ in batch:
+                latency = delivered_at - queued_at
+                self.latency_sum += latency
+                self.latency_max = max(self.latency_max, latency)
+            self.delivered += len(events)
+            return
+
+    def _run(self):
+        while 1:
+            batch = self._next_batch()
+            if batch:
+                self._deliver(batch)
+            elif self._stop_event.is_set():
+                return
+
+    def stats(self):
+        return {
+            'queue_depth': len(self._queue),
+            'queue_size': self.queue_size,
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'retries': self.retries,
+            'delivery_latency_avg': self.latency_sum / self.delivered if self.delivered else 0.0,
+            'delivery_latency_max': self.latency_max,
+        }
+
+
+class EventPipeline:
+    """ Publishes each event to every sink through its own worker, never blocking the caller """
+
+    def __init__(self, sinks, **worker_kwargs):
+        self.workers = [EventSinkWorker(sink, **worker_kwargs) for sink in sinks]
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        info(f"Started events pipeline with sinks: {', '.join(w.sink.name for w in self.workers)}")
+
+    def stop(self, timeout=None):
+        for worker in self.workers:
+            worker.stop(timeout)
+
+    def publish(self, event_json):
+        accepted = True
+        for worker in self.workers:
+            accepted = worker.put(event_json) and accepted
+        return accepted
+
+    def stats(self):
+        return {worker.sink.name: worker.stats() for worker in self.workers}
@@ -0,0 +1,17 @@
+#!/usr/bin/python
+from flask_restful import Resource
+
+from log import error, warn, info, debug
+from event.services import event_get_pipeline_stats
+
+
+class EventPipelineStatsResource(Resource):
+
+    def get(self):
+        return event_get_pipeline_stats()
+
+
+def event_add_http_resources_to_api(flask_restful_api, prefix=""):
+    info("Adding 'event_add_http_resources' resources to application")
+    prefix = f"/{prefix}" if prefix and not prefix.startswith("/") else prefix
+    flask_restful_api.add_resource(EventPipelineStatsResource, f'{prefix}/pipeline_stats')
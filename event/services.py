@@ -1,15 +1,122 @@
+import os
+import time
+import atexit
+from threading import Thread, Lock
+
 from log import *
-from config import EVENTS_TO_OMIT
+from config import EVENTS_TO_OMIT, EVENT_SINKS, EVENTS_FILE, EVENTS_WEBHOOK_URL, \
+    EVENTS_MQTT_BROKER, EVENTS_MQTT_TOPIC, EVENTS_QUEUE_SIZE, EVENTS_QUEUE_POLICY, \
+    EVENTS_BATCH_SIZE, EVENTS_BATCH_TIMEOUT
 from event.models import BaseEvent
+from event.pipeline import EventPipeline
+from event.sinks import LogSink, StreamSink, FileSink, HttpSink, MqttSink
+from persistance.shared_memory import SharedJsonStore, create_shared_store, get_shared_store
+from metrics.services import metrics_register_counter, metrics_inc
+
+
+EVENT_PIPELINE_STATS_SHM = "event_pipeline_stats"
+EVENT_PIPELINE_STATS_SHM_CAPACITY = 4096
+EVENT_PIPELINE_STATS_INTERVAL = 1.0
+EVENT_PIPELINE_STOP_TIMEOUT = 5
+
+_events_to_omit = frozenset(EVENTS_TO_OMIT.replace(" ", "").split(","))
+_event_pipeline = None
+_event_pipeline_lock = Lock()
+
+
+def _restart_event_pipeline_after_fork():
+    # a forked scanner starts its own pipeline, the threads of the parent's one are not copied
+    global _event_pipeline, _event_pipeline_lock
+    _event_pipeline = None
+    _event_pipeline_lock = Lock()
+
+
+os.register_at_fork(after_in_child=_restart_event_pipeline_after_fork)
+
+metrics_register_counter("events_published_total", "Events queued for the sinks, by event class")
+metrics_register_counter("events_omitted_total", "Events discarded because EVENTS_TO_OMIT lists their class")
+
+
+def _create_event_sink(sink_name):
+    if sink_name == "log":
+        return LogSink()
+    if sink_name == "stream":
+        return StreamSink()
+    if sink_name == "file":
+        return FileSink(EVENTS_FILE)
+    if sink_name == "http":
+        return HttpSink(EVENTS_WEBHOOK_URL)
+    if sink_name == "mqtt":
+        host, _, port = EVENTS_MQTT_BROKER.partition(":")
+        return MqttSink(host, int(port or 1883), EVENTS_MQTT_TOPIC)
+    warn(f"Unknown event sink '{sink_name}'")
+    return None
+
+
+def _write_event_pipeline_stats(event_pipeline, stats_store):
+    while 1:
+        time.sleep(EVENT_PIPELINE_STATS_INTERVAL)
+        stats_store.write_dict(event_pipeline.stats())
+
+
+def _stop_event_pipeline_at_exit(event_pipeline, pid):
+    # forked processes inherit the exit handlers, they stop their own pipeline with event_stop_pipeline()
+    if os.getpid() == pid:
+        event_pipeline.stop(EVENT_PIPELINE_STOP_TIMEOUT)
+
+
+def _get_event_pipeline():
+    """ Starts the events pipeline the first time this process publishes an event """
+    global _event_pipeline
+    if _event_pipeline:
+        return _event_pipeline
+    with _event_pipeline_lock:
+        if _event_pipeline:
+            return _event_pipeline
+        sink_names = [name for name in EVENT_SINKS.replace(" ", "").split(",") if name]
+        event_sinks = [sink for sink in map(_create_event_sink, sink_names) if sink]
+        event_pipeline = EventPipeline(
+            event_sinks,
+            queue_size=EVENTS_QUEUE_SIZE,
+            batch_size=EVENTS_BATCH_SIZE,
+            batch_timeout=EVENTS_BATCH_TIMEOUT,
+            policy=EVENTS_QUEUE_POLICY,
+        )
+        event_pipeline.start()
+        atexit.register(_stop_event_pipeline_at_exit, event_pipeline, os.getpid())
+        stats_store = create_shared_store(
+            SharedJsonStore, EVENT_PIPELINE_STATS_SHM, EVENT_PIPELINE_STATS_SHM_CAPACITY)
+        Thread(
+            name="event_pipeline_stats",
+            target=_write_event_pipeline_stats,
+            args=(event_pipeline, stats_store),
+            daemon=True,
+        ).start()
+        _event_pipeline = event_pipeline
+    return _event_pipeline
 
 
 def publish_event(event):
+    """ Queues the event for its sinks, returns False if any sink queue had to drop it """
     if not isinstance(event, BaseEvent):
         error("Event is not instance of event")
-        return
+        return False
     event_class = event.__class__.__name__
-    events_to_omit = EVENTS_TO_OMIT.replace(" ", "").split(",")
-    if event_class in events_to_omit:
-        return
-    info(f"Publishing event '{event.to_json()}'")
-        
+    if event_class in _events_to_omit:
+        metrics_inc("events_omitted_total", event=event_class)
+        return True
+    metrics_inc("events_published_total", event=event_class)
+    return _get_event_pipeline().publish(event.to_json())
+
+
+def event_stop_pipeline():
+    """ Stops the events pipeline of this process, if started, once its queued events are delivered """
+    if _event_pipeline:
+        _event_pipeline.stop(EVENT_PIPELINE_STOP_TIMEOUT)
+
+
+def event_get_pipeline_stats():
+    """ Returns queue depth and delivery stats of each sink of the process publishing events """
+    stats_store = get_shared_store(SharedJsonStore, EVENT_PIPELINE_STATS_SHM)
+    event_pipeline_stats = stats_store.read_dict() if stats_store else None
+    return event_pipeline_stats or {}
@@ -0,0 +1,128 @@
+import os
+import json
+import socket
+import struct
+
+import requests
+
+from log import error, warn, info, debug
+from event.stream import EventStreamPublisher
+from event.pipeline import PermanentDeliveryError
+
+
+class LogSink:
+    """ Writes each event to the service log """
+
+    name = "log"
+
+    def deliver(self, events):
+        for event_json in events:
+            info(f"Publishing event '{event_json}'")
+
+
+class StreamSink:
+    """ Fans events out to the web processes serving the events stream """
+
+    name = "stream"
+
+    def __init__(self):
+        self._publisher = EventStreamPublisher()
+
+    def deliver(self, events):
+        for event_json in events:
+            self._publisher.publish(event_json)
+
+
+class FileSink:
+    """ Appends events as JSON lines to a local file """
+
+    name = "file"
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+
+    def deliver(self, events):
+        lines = "".join(json.dumps(event_json, default=str) + "\n" for event_json in events)
+        with open(self.filepath, 'a') as events_file:
+            events_file.write(lines)
+
+
+class HttpSink:
+    """ Posts each batch of events as a JSON list to a webhook URL
+
+    Connection errors, 5xx and 429 responses are retried, any other 4xx response rejects the batch.
+    """
+
+    name = "http"
+
+    def __init__(self, url, timeout=5):
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def deliver(self, events):
+        response = self._session.post(
+            self.url,
+            data=json.dumps(events, default=str),
+            headers={'Content-Type': 'application/json'},
+            timeout=self.timeout,
+        )
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            raise PermanentDeliveryError(f"Webhook answered {response.status_code} {response.reason}")
+        response.raise_for_status()
+
+
+class MqttSink:
+    """ Publishes each event to an MQTT broker topic, with QoS 0 over MQTT 3.1.1 """
+
+    name = "mqtt"
+
+    def __init__(self, host, port, topic, client_id="gotoiot-beacons-scanner", timeout=5):
+        self.host = host
+        self.port = port
+        self.topic = topic
+        self.client_id = client_id
+        self.timeout = timeout
+        self._socket = None
+
+    @staticmethod
+    def _encode_string(value):
+        value = value.encode()
+        return struct.pack("!H", len(value)) + value
+
+    @staticmethod
+    def _encode_packet(packet_type, body):
+        remaining_length, encoded_length = len(body), bytearray()
+        while 1:
+            remaining_length, digit = divmod(remaining_length, 128)
+            encoded_length.append(digit | 0x80 if remaining_length else digit)
+            if not remaining_length:
+                return bytes([packet_type]) + bytes(encoded_length) + body
+
+    def _connect(self):
+        mqtt_socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        # protocol name, level 4, clean session and keep alive disabled
+        variable_header = self._encode_string("MQTT") + bytes([4, 0x02]) + struct.pack("!H", 0)
+        mqtt_socket.sendall(self._encode_packet(0x10, variable_header + self._encode_string(self.client_id)))
+        connack = mqtt_socket.recv(4)
+        if len(connack) != 4 or connack[0] != 0x20 or connack[3] != 0:
+            mqtt_socket.close()
+            raise ConnectionError(f"MQTT broker '{self.host}:{self.port}' refused the connection")
+        self._socket = mqtt_socket
+        info(f"Connected to MQTT broker '{self.host}:{self.port}'")
+
+    def deliver(self, events):
+        if not self._socket:
+            self._connect()
+        topic = self._encode_string(self.topic)
+        packets = b"".join(
+            self._encode_packet(0x30, topic + json.dumps(event_json, default=str).encode())
+            for event_json in events
+        )
+        try:
+            self._socket.sendall(packets)
+        except OSError:
+            self._socket.close()
+            self._socket = None
+            raise
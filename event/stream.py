@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import socket
+from collections import deque
+from threading import Thread, Condition
+
+from log import error, warn, info, debug
+
+
+DIRECTORY_EVENT_STREAM = "/local/storage/event_stream"
+SUBSCRIBERS_REFRESH_INTERVAL = 1.0
+DATAGRAM_MAX_SIZE = 65536
+EVENTS_KEEPALIVE_INTERVAL = 15
+EVENTS_MAX_POLL_TIMEOUT = 30
+EVENTS_RETRY_AFTER = 5
+
+
+def render_sse_event(seq, event_json):
+    return f"id: {seq}\nevent: {event_json['type']}\ndata: {json.dumps(event_json)}\n\n"
+
+
+class EventStreamPublisher:
+    """ Sends each published event, with a sequence number, to every listening process """
+
+    def __init__(self, directory=DIRECTORY_EVENT_STREAM):
+        self.directory = directory
+        self.seq = 0
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        self._subscribers = []
+        self._refreshed_at = 0
+
+    def _refresh_subscribers(self):
+        now = time.monotonic()
+        if now - self._refreshed_at < SUBSCRIBERS_REFRESH_INTERVAL:
+            return
+        self._refreshed_at = now
+        try:
+            self._subscribers = [
+                entry.path for entry in os.scandir(self.directory) if entry.name.endswith(".sock")
+            ]
+        except FileNotFoundError:
+            self._subscribers = []
+
+    def publish(self, event_json):
+        self.seq += 1
+        self._refresh_subscribers()
+        datagram = json.dumps({'seq': self.seq, 'event': event_json}, default=str).encode()
+        for subscriber in list(self._subscribers):
+            try:
+                self._socket.sendto(datagram, subscriber)
+            except BlockingIOError:
+                # the listening process is behind, it misses this event
+                debug(f"Event stream subscriber '{subscriber}' is full, dropping event {self.seq}")
+            except FileNotFoundError:
+                self._subscribers.remove(subscriber)
+            except ConnectionRefusedError:
+                # nobody listens anymore, the process that bound it is gone
+                self._subscribers.remove(subscriber)
+                try:
+                    os.remove(subscriber)
+                except OSError:
+                    pass
+            except OSError as e:
+                warn(f"Impossible to send event to stream subscriber '{subscriber}': {e}")
+
+
+class EventSubscription:
+    """ Bounded buffer of events pending to be sent to one client """
+
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+        self.events = deque()
+        self.lagged = False
+
+    def push(self, seq, event_json):
+        if len(self.events) >= self.buffer_size:
+            # a client that can not keep up is dropped, it may resume from history
+            self.lagged = True
+            self.events.clear()
+            return
+        self.events.append((seq, event_json))
+
+
+class EventHub:
+    """ Receives the published events in this process and fans them out to clients """
+
+    def __init__(self, directory=DIRECTORY_EVENT_STREAM, history_size=256, buffer_size=64):
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.last_seq = 0
+        self._history = deque(maxlen=history_size)
+        self._subscriptions = set()
+        self._condition = Condition()
+        self._thread = None
+        self._socket_filepath = None
+
+    def _bind(self, socket_filename):
+        os.makedirs(self.directory, exist_ok=True)
+        self._socket_filepath = os.path.join(self.directory, socket_filename)
+        if os.path.exists(self._socket_filepath):
+            os.remove(self._socket_filepath)
+        listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        listen_socket.bind(self._socket_filepath)
+        info(f"Listening events stream at '{self._socket_filepath}'")
+        return listen_socket
+
+    def start(self):
+        """ Starts listening in this process, it is a no-op once started """
+        with self._condition:
+            if self._thread and self._socket_filepath.endswith(f"/{os.getpid()}.sock"):
+                return
+            listen_socket = self._bind(f"{os.getpid()}.sock")
+            self._thread = Thread(name="event_hub", target=self._receive_loop, args=(listen_socket,), daemon=True)
+            self._thread.start()
+
+    def _receive(self, listen_socket):
+        try:
+            message = json.loads(listen_socket.recv(DATAGRAM_MAX_SIZE))
+        except ValueError:
+            warn("Discarding malformed event stream message")
+            return
+        self.put(message['seq'], message['event'])
+
+    def _receive_loop(self, listen_socket):
+        while 1:
+            self._receive(listen_socket)
+
+    def put(self, seq, event_json):
+        with self._condition:
+            # the publisher restarted, so the previous sequence numbers are meaningless
+            if seq <= self.last_seq:
+                self._history.clear()
+            self.last_seq = seq
+            self._history.append((seq, event_json))
+            for subscription in self._subscriptions:
+                subscription.push(seq, event_json)
+            self._condition.notify_all()
+
+    def _events_since(self, since):
+        if since > self.last_seq:
+            since = 0
+        return [(seq, event_json) for seq, event_json in self._history if seq > since]
+
+    def wait_events_since(self, since, timeout):
+        """ Long-poll: returns the events newer than since, waiting up to timeout for one """
+        with self._condition:
+            self._condition.wait_for(lambda: self._events_since(since), timeout)
+            return self.last_seq, self._events_since(since)
+
+    def subscribe(self, since=None):
+        """ Creates a subscription, prefilled from history when resuming after since """
+        subscription = EventSubscription(self.buffer_size)
+        with self._condition:
+            if since is not None:
+                for seq, event_json in self._events_since(since)[-self.buffer_size:]:
+                    subscription.push(seq, event_json)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._condition:
+            self._subscriptions.discard(subscription)
+
+    def next_events(self, subscription, timeout):
+        """ Waits up to timeout and returns the buffered events of the subscription """
+        with self._condition:
+            self._condition.wait_for(lambda: subscription.events or subscription.lagged, timeout)
+            events = list(subscription.events)
+            subscription.events.clear()
+            return events
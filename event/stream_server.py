@@ -0,0 +1,237 @@
+#!/usr/bin/python
+""" Serves the events stream and long polls of every client from one asyncio loop
+
+The web workers hold a thread for as long as a client waits for events, this process holds
+a coroutine. It listens to the published events as any web process does, see event/stream.py.
+Run as `python -m event.stream_server`, uWSGI starts it as an attached daemon.
+"""
+import os
+import json
+import signal
+import asyncio
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from config import EVENTS_STREAM_PORT, EVENTS_STREAM_MAX_CLIENTS
+from log import error, warn, info, debug
+from event.stream import EventHub, DIRECTORY_EVENT_STREAM, EVENTS_KEEPALIVE_INTERVAL, EVENTS_MAX_POLL_TIMEOUT, \
+    EVENTS_RETRY_AFTER, render_sse_event
+
+
+EVENTS_STREAM_PATH = "/ibeacon_scanner/events"
+# seconds a client has to send its request headers
+REQUEST_TIMEOUT = 10
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type,Authorization,Last-Event-ID',
+    'Access-Control-Allow-Methods': 'GET',
+}
+
+
+class AsyncEventHub(EventHub):
+    """ EventHub listening from an asyncio loop, the clients wait for events in coroutines of the same loop """
+
+    def __init__(self, **kwargs):
+        super(AsyncEventHub, self).__init__(**kwargs)
+        self._changed = None
+        self._listen_socket = None
+
+    def start(self):
+        """ Starts listening from the running loop """
+        loop = asyncio.get_running_loop()
+        self._changed = loop.create_future()
+        self._listen_socket = self._bind(f"{os.getpid()}_server.sock")
+        self._listen_socket.setblocking(False)
+        loop.add_reader(self._listen_socket.fileno(), self._receive_ready, self._listen_socket)
+
+    def stop(self):
+        """ Stops listening, the publisher forgets the socket once it is gone """
+        asyncio.get_running_loop().remove_reader(self._listen_socket.fileno())
+        self._listen_socket.close()
+        try:
+            os.remove(self._socket_filepath)
+        except OSError:
+            pass
+
+    def _receive_ready(self, listen_socket):
+        try:
+            while 1:
+                self._receive(listen_socket)
+        except BlockingIOError:
+            pass
+
+    def put(self, seq, event_json):
+        super(AsyncEventHub, self).put(seq, event_json)
+        # every waiting client checks whether the event concerns it
+        self._changed.set_result(None)
+        self._changed = asyncio.get_running_loop().create_future()
+
+    async def _wait_for(self, predicate, timeout):
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not predicate():
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                return
+            try:
+                await asyncio.wait_for(asyncio.shield(self._changed), remaining)
+            except asyncio.TimeoutError:
+                return
+
+    async def wait_events_since_async(self, since, timeout):
+        """ Long-poll: returns the events newer than since, waiting up to timeout for one """
+        await self._wait_for(lambda: self._events_since(since), timeout)
+        return self.last_seq, self._events_since(since)
+
+    async def next_events_async(self, subscription, timeout):
+        """ Waits up to timeout and returns the buffered events of the subscription """
+        await self._wait_for(lambda: subscription.events or subscription.lagged, timeout)
+        events = list(subscription.events)
+        subscription.events.clear()
+        return events
+
+
+def _render_response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    lines += [f"{name}: {value}" for name, value in dict(CORS_HEADERS, Connection='close', **headers).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+
+def _render_json_response(status, body, headers=None):
+    payload = json.dumps(body).encode()
+    return _render_response_head(status, dict({
+        'Content-Type': 'application/json',
+        'Content-Length': len(payload),
+        'Cache-Control': 'no-store, no-cache',
+    }, **(headers or {}))) + payload
+
+
+async def _read_request(reader):
+    """ Returns the method, path, query arguments and lowercase headers of the request """
+    request_head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), REQUEST_TIMEOUT)
+    request_line, *header_lines = request_head.decode('latin-1').split("\r\n")
+    method, target, _ = request_line.split(" ", 2)
+    headers = {}
+    for header_line in header_lines:
+        if header_line:
+            name, _, value = header_line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    url = urlsplit(target)
+    arguments = {name: values[-1] for name, values in parse_qs(url.query).items()}
+    return method, url.path, arguments, headers
+
+
+def _number_argument(arguments, name, default, number_type):
+    try:
+        return number_type(arguments[name])
+    except (KeyError, ValueError):
+        return default
+
+
+class EventStreamServer:
+    """ HTTP server of the events stream and long polls, with the same API as the web workers """
+
+    def __init__(self, host="0.0.0.0", port=EVENTS_STREAM_PORT, directory=DIRECTORY_EVENT_STREAM,
+            max_clients=EVENTS_STREAM_MAX_CLIENTS):
+        self.host = host
+        self.port = port
+        self.max_clients = max_clients
+        self.event_hub = AsyncEventHub(directory=directory)
+        self.waiting_clients = 0
+        self._server = None
+
+    async def start(self):
+        self.event_hub.start()
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        # the port given may be 0, the one the system picked is the one serving
+        self.port = self._server.sockets[0].getsockname()[1]
+        info(f"Serving events stream at port {self.port}")
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            async with self._server:
+                await self._server.serve_forever()
+        finally:
+            self.event_hub.stop()
+
+    async def _handle_client(self, reader, writer):
+        try:
+            try:
+                method, path, arguments, headers = await _read_request(reader)
+            except (ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                method = path = None
+            if method is None:
+                writer.write(_render_json_response(400, {'message': "Malformed request"}))
+            elif path != EVENTS_STREAM_PATH:
+                writer.write(_render_json_response(404, {'message': f"'{path}' not found"}))
+            elif method == "OPTIONS":
+                writer.write(_render_response_head(204, {}))
+            elif method != "GET":
+                writer.write(_render_json_response(405, {'message': f"Method {method} not allowed"}))
+            elif 'text/event-stream' in headers.get('accept', ''):
+                await self._stream_events(writer, arguments, headers)
+            else:
+                await self._poll_events(writer, arguments)
+            await writer.drain()
+        except ConnectionError:
+            debug("Events client left before its response was sent")
+        finally:
+            writer.close()
+
+    async def _stream_events(self, writer, arguments, headers):
+        """ Server-sent events stream, resumable with the standard Last-Event-ID header """
+        if self.waiting_clients >= self.max_clients:
+            writer.write(_render_json_response(
+                503, {'message': "Too many event streams"}, {'Retry-After': EVENTS_RETRY_AFTER}))
+            return
+        since = headers.get('last-event-id', arguments.get('since'))
+        since = int(since) if since and since.isdigit() else None
+        self.waiting_clients += 1
+        subscription = self.event_hub.subscribe(since=since)
+        try:
+            writer.write(_render_response_head(200, {
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+            }))
+            await writer.drain()
+            while not subscription.lagged:
+                events = await self.event_hub.next_events_async(subscription, EVENTS_KEEPALIVE_INTERVAL)
+                if not events and not subscription.lagged:
+                    writer.write(b": keepalive\n\n")
+                for seq, event_json in events:
+                    writer.write(render_sse_event(seq, event_json).encode())
+                await writer.drain()
+            debug("Closing events stream of a client that could not keep up")
+        finally:
+            self.event_hub.unsubscribe(subscription)
+            self.waiting_clients -= 1
+
+    async def _poll_events(self, writer, arguments):
+        """ Long-poll, answered at once with the events already there while too many clients wait """
+        since = _number_argument(arguments, 'since', 0, int)
+        timeout = min(_number_argument(arguments, 'timeout', EVENTS_MAX_POLL_TIMEOUT, float), EVENTS_MAX_POLL_TIMEOUT)
+        waiting = self.waiting_clients < self.max_clients
+        self.waiting_clients += waiting
+        try:
+            last_seq, events = await self.event_hub.wait_events_since_async(since, max(timeout, 0) if waiting else 0)
+        finally:
+            self.waiting_clients -= waiting
+        writer.write(_render_json_response(200, {
+            'last_seq': last_seq,
+            'events': [{'seq': seq, 'event': event_json} for seq, event_json in events],
+        }, {} if waiting else {'Retry-After': EVENTS_RETRY_AFTER}))
+
+
+def event_run_stream_server(**kwargs):
+    """ Serves the events stream from the calling thread until the process ends """
+    asyncio.run(EventStreamServer(**kwargs).serve_forever())
+
+
+if __name__ == "__main__":
+    if EVENTS_STREAM_PORT:
+        event_run_stream_server()
+    else:
+        # uWSGI restarts the daemons that exit, the web workers serve the events stream themselves
+        info("EVENTS_STREAM_PORT is 0, the events stream is served by the web workers")
+        signal.pause()
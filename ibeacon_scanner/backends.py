@@ -0,0 +1,281 @@
+#!/usr/bin/python
+import math
+import mmap
+import time
+import random
+import struct
+from functools import partial
+from threading import Thread, Event
+
+from beacontools import BeaconScanner
+from beacontools import IBeaconFilter, IBeaconAdvertisement
+from beacontools.scanner import Monitor
+
+from log import error, warn, info, debug
+from ibeacon_scanner.hci import IBeaconReportParser, is_advertising_report
+from ibeacon_scanner.capture import read_capture_start, iter_capture_records
+
+
+# Every backend is long-lived: it is built with a callback and started once, then
+# calls callback(mac_address, uuid, major, minor, tx_power, rssi) for each
+# advertisement it hears until it is stopped. Backends that discard advertisements
+# themselves count them in their dropped attribute.
+
+# silences longer than this, like the ones between appended capture sessions, are shortened on replay
+MAX_REPLAY_GAP = 5
+
+
+class BluetoothBeaconScanner:
+    """ Scanner backend that reads advertisements from one HCI device, hci0 by default """
+
+    def __init__(self, callback, uuid_filter=None, bt_device_id=0):
+        # adapts beaconstools callback to the backend callback
+        def _scans_callback(bt_addr, rssi, packet, additional_info):
+            callback(bt_addr, packet.uuid, packet.major, packet.minor, packet.tx_power, rssi)
+        self._beaconstools_scanner = BeaconScanner(
+            _scans_callback,
+            bt_device_id=bt_device_id,
+            # IBeaconFilter needs some value to match, without a UUID any iBeacon packet is passed
+            device_filter=IBeaconFilter(uuid=uuid_filter) if uuid_filter else None,
+            packet_filter=None if uuid_filter else IBeaconAdvertisement,
+        )
+
+    def start(self):
+        self._beaconstools_scanner.start()
+
+    def stop(self):
+        self._beaconstools_scanner.stop()
+
+
+class _RawHciMonitor(Monitor):
+    """ beacontools monitor thread that passes raw HCI events to the iBeacon fast path parser
+
+    capture(packet), if given, gets the HCI event of every advertisement passed to callback.
+    """
+
+    def __init__(self, callback, bt_device_id, uuid_filter, capture=None):
+        super(_RawHciMonitor, self).__init__(callback, bt_device_id, None, None, {})
+        self._parser = IBeaconReportParser(uuid_filter)
+        self._capture = capture
+        self.dropped = 0
+
+    def run(self):
+        self.socket = self.backend.open_dev(self.bt_device_id)
+        self.hci_version = self.get_hci_version()
+        self.set_scan_parameters(**self.scan_parameters)
+        self.toggle_scan(True)
+        parse, callback, capture = self._parser.parse, self.callback, self._capture
+        while self.keep_going:
+            packet = self.socket.recv(255)
+            ibeacon_fields = parse(packet)
+            if ibeacon_fields:
+                if capture:
+                    capture(packet)
+                callback(*ibeacon_fields)
+            elif is_advertising_report(packet):
+                # command completions and other HCI events are not advertisements
+                self.dropped += 1
+        self.socket.close()
+
+
+class RawHciBeaconScanner:
+    """ Scanner backend that reads one HCI device decoding only iBeacon frames, without beacontools parsing """
+
+    def __init__(self, callback, uuid_filter=None, bt_device_id=0, capture=None):
+        self._monitor = _RawHciMonitor(callback, bt_device_id, uuid_filter, capture)
+
+    @property
+    def dropped(self):
+        return self._monitor.dropped
+
+    def start(self):
+        self._monitor.start()
+
+    def stop(self):
+        self._monitor.terminate()
+
+
+class _FakeBeacon:
+    """ State of a simulated beacon: identity, distance to the adapter and pending advertisements """
+
+    __slots__ = ('mac_address', 'minor', 'distance', 'direction', 'credit')
+
+    def __init__(self, number, distance, direction):
+        self.mac_address = "fa:ce:" + ":".join(f"{byte:02x}" for byte in number.to_bytes(4, "big"))
+        self.minor = number & 0xFFFF
+        self.distance = distance
+        self.direction = direction
+        self.credit = 0.0
+
+
+class FakeBeaconScanner:
+    """ Scanner backend that simulates beacons walking around the adapter
+
+    Each beacon advertises advertisement_rate times per second. Its RSSI follows a
+    log-distance path loss model while it walks at mobility m/s, plus gaussian noise.
+    churn is the fraction of beacons replaced by new ones each minute, and packet_loss
+    the fraction of advertisements never heard. The same seed repeats the same run.
+    """
+
+    TX_POWER = -59
+    PATH_LOSS_EXPONENT = 2.0
+    RSSI_NOISE = 2.0
+    MIN_DISTANCE = 0.5
+    MAX_DISTANCE = 30.0
+    # times per second a beacon turns around
+    DIRECTION_CHANGE_RATE = 0.2
+    DEFAULT_UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+    def __init__(self, callback, uuid_filter=None, beacons=3, advertisement_rate=10, churn=0.0,
+            mobility=0.5, packet_loss=0.0, seed=None, step=0.05):
+        self._callback = callback
+        self._uuid = uuid_filter or self.DEFAULT_UUID
+        self.advertisement_rate = advertisement_rate
+        self.churn = churn
+        self.mobility = mobility
+        self.packet_loss = packet_loss
+        self._step = step
+        self._random = random.Random(seed)
+        self._beacons_count = 0
+        self._beacons = [self._new_beacon() for _ in range(beacons)]
+        self._stop_event = Event()
+        self._thread = None
+        self.dropped = 0
+
+    def _new_beacon(self):
+        self._beacons_count += 1
+        distance = self._random.uniform(self.MIN_DISTANCE, self.MAX_DISTANCE)
+        return _FakeBeacon(self._beacons_count, distance, self._random.choice((-1, 1)))
+
+    def _rssi(self, distance):
+        rssi = self.TX_POWER - 10 * self.PATH_LOSS_EXPONENT * math.log10(distance)
+        return round(rssi + self._random.gauss(0, self.RSSI_NOISE))
+
+    def advance(self, elapsed):
+        """ Simulates elapsed seconds, calling back every advertisement heard meanwhile """
+        rnd, callback = self._random, self._callback
+        for index, beacon in enumerate(self._beacons):
+            if self.churn and rnd.random() < self.churn * elapsed / 60:
+                beacon = self._beacons[index] = self._new_beacon()
+            # walks and turns around at the limits of the area
+            if rnd.random() < self.DIRECTION_CHANGE_RATE * elapsed:
+                beacon.direction = -beacon.direction
+            beacon.distance += beacon.direction * self.mobility * elapsed
+            if not self.MIN_DISTANCE <= beacon.distance <= self.MAX_DISTANCE:
+                beacon.direction = -beacon.direction
+                beacon.distance = min(max(beacon.distance, self.MIN_DISTANCE), self.MAX_DISTANCE)
+            beacon.credit += self.advertisement_rate * elapsed
+            advertisements = int(beacon.credit)
+            beacon.credit -= advertisements
+            for _ in range(advertisements):
+                if self.packet_loss and rnd.random() < self.packet_loss:
+                    self.dropped += 1
+                    continue
+                callback(beacon.mac_address, self._uuid, 11, beacon.minor, self.TX_POWER, self._rssi(beacon.distance))
+
+    def _run(self):
+        last_step_at = time.monotonic()
+        while not self._stop_event.wait(self._step):
+            now = time.monotonic()
+            self.advance(now - last_step_at)
+            last_step_at = now
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = Thread(name="fake_beacon_scanner", target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+class ReplayBeaconScanner:
+    """ Scanner backend that replays a capture file, at its recorded pace times speed, or as fast as possible with speed 0
+
+    Advertisements are passed to callback(adapter_id, mac_address, uuid, major, minor, tx_power, rssi)
+    with the adapter that recorded them. The capture is replayed again when it ends.
+    """
+
+    def __init__(self, callback, filepath, uuid_filter=None, speed=1.0):
+        self._callback = callback
+        self.filepath = filepath
+        self.speed = speed
+        self._parser = IBeaconReportParser(uuid_filter)
+        self._stop_event = Event()
+        self._thread = None
+        self.replayed = 0
+        self.dropped = 0
+
+    def _replay(self, capture):
+        parse, callback, stop_event = self._parser.parse, self._callback, self._stop_event
+        adapter_ids = [f"hci{adapter}" for adapter in range(256)]
+        started_at, elapsed, last_timestamp = time.monotonic(), 0, None
+        for timestamp, adapter, packet in iter_capture_records(capture):
+            if self.speed:
+                if last_timestamp is not None:
+                    elapsed += min(max(timestamp - last_timestamp, 0) / 1e9, MAX_REPLAY_GAP)
+                last_timestamp = timestamp
+                delay = started_at + elapsed / self.speed - time.monotonic()
+                if delay > 0 and stop_event.wait(delay):
+                    return
+            elif stop_event.is_set():
+                return
+            ibeacon_fields = parse(packet)
+            if ibeacon_fields:
+                self.replayed += 1
+                callback(adapter_ids[adapter], *ibeacon_fields)
+            else:
+                self.dropped += 1
+
+    def _run(self):
+        try:
+            read_capture_start(self.filepath)
+            with open(self.filepath, 'rb') as capture_file, \
+                    mmap.mmap(capture_file.fileno(), 0, access=mmap.ACCESS_READ) as capture:
+                while not self._stop_event.is_set():
+                    self._replay(capture)
+                    # waits a bit between rounds so an empty capture does not spin
+                    self._stop_event.wait(0.1)
+        except (OSError, ValueError, struct.error) as e:
+            error(f"Impossible to replay capture '{self.filepath}': {e}")
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = Thread(name="replay_beacon_scanner", target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+class MultiAdapterBeaconScanner:
+    """ Scanner backend that runs one backend per adapter, each one with its own thread
+
+    Every backend is built by backend_factory(callback, adapter_id) and the advertisements
+    it hears are passed to callback(adapter_id, mac_address, uuid, major, minor, tx_power, rssi).
+    """
+
+    def __init__(self, callback, backend_factory, adapter_ids):
+        self.adapter_ids = list(adapter_ids)
+        self._backends = [
+            backend_factory(partial(callback, adapter_id), adapter_id)
+            for adapter_id in self.adapter_ids
+        ]
+
+    @property
+    def dropped(self):
+        return sum(getattr(backend, 'dropped', 0) for backend in self._backends)
+
+    def start(self):
+        for backend in self._backends:
+            backend.start()
+
+    def stop(self):
+        for backend in self._backends:
+            backend.stop()
@@ -0,0 +1,72 @@
+import os
+import time
+import struct
+from threading import Lock
+
+from log import error, warn, info, debug
+from ibeacon_scanner.hci import encode_advertising_report
+
+
+CAPTURE_MAGIC = b"IBCP"
+CAPTURE_VERSION = 1
+# magic, version and capture start as unix time in nanoseconds
+CAPTURE_HEADER = struct.Struct("<4sHQ")
+# nanoseconds since capture start, adapter number and length of the raw HCI event that follows
+CAPTURE_RECORD = struct.Struct("<QBB")
+
+
+def read_capture_start(filepath):
+    with open(filepath, 'rb') as capture_file:
+        header = capture_file.read(CAPTURE_HEADER.size)
+    magic, version, capture_start = CAPTURE_HEADER.unpack(header)
+    if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+        raise ValueError(f"'{filepath}' is not a version {CAPTURE_VERSION} advertisements capture")
+    return capture_start
+
+
+def iter_capture_records(capture):
+    """ Yields (nanoseconds since capture start, adapter number, raw HCI event) from capture bytes """
+    offset = CAPTURE_HEADER.size
+    while offset + CAPTURE_RECORD.size <= len(capture):
+        timestamp, adapter, length = CAPTURE_RECORD.unpack_from(capture, offset)
+        offset += CAPTURE_RECORD.size
+        if offset + length > len(capture):
+            # last record was cut while being written
+            return
+        yield timestamp, adapter, capture[offset:offset + length]
+        offset += length
+
+
+class CaptureWriter:
+    """ Appends every advertisement with its timestamp to a binary capture file """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        if os.path.exists(filepath) and os.path.getsize(filepath):
+            self._capture_start = read_capture_start(filepath)
+            self._capture_file = open(filepath, 'ab')
+        else:
+            self._capture_start = time.time_ns()
+            self._capture_file = open(filepath, 'ab')
+            self._capture_file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, self._capture_start))
+        self._lock = Lock()
+        info(f"Capturing advertisements to '{filepath}'")
+
+    def write(self, adapter, packet):
+        adapter_number = int(adapter[3:]) if adapter and adapter.startswith("hci") else 0
+        record = CAPTURE_RECORD.pack(time.time_ns() - self._capture_start, adapter_number, len(packet))
+        with self._lock:
+            self._capture_file.write(record + packet)
+
+    def write_advertisement(self, adapter, mac_address, uuid, major, minor, tx_power, rssi):
+        """ Captures an advertisement already decoded by the backend as its HCI report """
+        self.write(adapter, encode_advertising_report(mac_address, uuid, major, minor, tx_power, rssi))
+
+    def flush(self):
+        with self._lock:
+            self._capture_file.flush()
+
+    def close(self):
+        with self._lock:
+            self._capture_file.close()
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+import os
+import json
+import socket
+import select
+
+from log import error, warn, info, debug
+
+
+class ControlChannel:
+    """ Unix datagram socket where the scanner process receives control messages """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(filepath)
+        self._socket.setblocking(False)
+
+    def wait(self, timeout=None):
+        """ Blocks until a message is pending or the timeout expires, without consuming it """
+        readable, _, _ = select.select([self._socket], [], [], timeout)
+        return bool(readable)
+
+    def receive(self, timeout=None):
+        """ Waits for messages up to timeout (forever if None) and returns all the pending ones """
+        messages = []
+        if not self.wait(timeout):
+            return messages
+        while 1:
+            try:
+                datagram = self._socket.recv(65536)
+            except BlockingIOError:
+                return messages
+            try:
+                messages.append(json.loads(datagram))
+            except ValueError:
+                warn("Discarding malformed scanner control message")
+
+    def close(self):
+        self._socket.close()
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+
+def send_control_message(filepath, message):
+    """ Pushes a message to the scanner process, returns False if it is not listening """
+    control_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        # never blocks the caller, a scanner that stopped reading its socket is not available
+        control_socket.sendto(json.dumps(message).encode(), socket.MSG_DONTWAIT, filepath)
+        return True
+    except (FileNotFoundError, ConnectionRefusedError):
+        debug("Scanner control channel is not listening")
+        return False
+    except BlockingIOError:
+        warn("Scanner control channel is full, the scanner is not reading its messages")
+        return False
+    except OSError as e:
+        warn(f"Impossible to send scanner control message: {e}")
+        return False
+    finally:
+        control_socket.close()
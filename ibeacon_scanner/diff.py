@@ -0,0 +1,64 @@
+import time
+
+from ibeacon_scanner.events import IBeaconChange, IBeaconEnter, IBeaconExit, IBeaconMove
+
+
+class IBeaconDiffEngine:
+    """ Compares each beacons table against the previous one and returns delta events
+
+    A beacon moves when its RSSI drifts rssi_threshold dB away from the last reported
+    value. The nearest beacon only changes when another one is nearest_hysteresis dB
+    stronger during nearest_dwell seconds, or when the current nearest exits.
+    """
+
+    def __init__(self, rssi_threshold=8, nearest_hysteresis=3, nearest_dwell=2.0):
+        self.rssi_threshold = rssi_threshold
+        self.nearest_hysteresis = nearest_hysteresis
+        self.nearest_dwell = nearest_dwell
+        self.nearest = None
+        # last reported reading of each beacon, by key
+        self._reported_beacons = {}
+        self._candidate = None
+        self._candidate_since = None
+
+    def _update_nearest(self, current_beacons, now):
+        strongest = max(current_beacons.values(), key=lambda beacon: beacon.rssi, default=None)
+        nearest = current_beacons.get(self.nearest.key) if self.nearest else None
+        if nearest is None or strongest is None:
+            self._candidate = None
+            return strongest
+        if strongest.key == nearest.key or strongest.rssi < nearest.rssi + self.nearest_hysteresis:
+            self._candidate = None
+            return nearest
+        if self._candidate is None or self._candidate.key != strongest.key:
+            self._candidate, self._candidate_since = strongest, now
+        if now - self._candidate_since < self.nearest_dwell:
+            return nearest
+        self._candidate = None
+        return strongest
+
+    def update(self, beacons_list, now=None):
+        now = time.monotonic() if now is None else now
+        current_beacons = {beacon.key: beacon for beacon in beacons_list}
+        reported_beacons = {}
+        events = []
+        for key, beacon in self._reported_beacons.items():
+            if key not in current_beacons:
+                events.append(IBeaconExit(beacon.to_identity_json()))
+        for key, beacon in current_beacons.items():
+            reported_beacon = self._reported_beacons.get(key)
+            if reported_beacon is None:
+                events.append(IBeaconEnter(beacon.to_json()))
+            elif abs(beacon.rssi - reported_beacon.rssi) >= self.rssi_threshold:
+                events.append(IBeaconMove(dict(beacon.to_identity_json(), rssi=beacon.rssi)))
+            else:
+                # keeps the reported reading, so slow drifts add up until they are reported
+                beacon = reported_beacon
+            reported_beacons[key] = beacon
+        self._reported_beacons = reported_beacons
+        nearest = self._update_nearest(current_beacons, now)
+        nearest_key = nearest.key if nearest else None
+        if nearest_key != (self.nearest.key if self.nearest else None):
+            events.append(IBeaconChange(nearest.to_json() if nearest else None))
+        self.nearest = nearest
+        return events
@@ -22,4 +22,36 @@ class IBeaconRead(BaseEvent):
         self.data = data
         self.time = datetime.now()
         self.type = "IBEACON_READ"
-    
\ No newline at end of file
+
+
+class IBeaconEnter(BaseEvent):
+
+    def __init__(self, data):
+        super(IBeaconEnter, self).__init__()
+        self.actor = "ibeacon_scanner"
+        self.target = "system"
+        self.data = data
+        self.time = datetime.now()
+        self.type = "IBEACON_ENTER"
+
+
+class IBeaconExit(BaseEvent):
+
+    def __init__(self, data):
+        super(IBeaconExit, self).__init__()
+        self.actor = "ibeacon_scanner"
+        self.target = "system"
+        self.data = data
+        self.time = datetime.now()
+        self.type = "IBEACON_EXIT"
+
+
+class IBeaconMove(BaseEvent):
+
+    def __init__(self, data):
+        super(IBeaconMove, self).__init__()
+        self.actor = "ibeacon_scanner"
+        self.target = "system"
+        self.data = data
+        self.time = datetime.now()
+        self.type = "IBEACON_MOVE"
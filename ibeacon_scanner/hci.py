@@ -0,0 +1,74 @@
+import struct
+import uuid
+
+
+# HCI LE meta event and the advertising report subevents carrying advertisements
+HCI_EVENT_PACKET = 0x04
+LE_META_EVENT = 0x3E
+LE_ADVERTISING_REPORT = 0x02
+LE_EXT_ADVERTISING_REPORT = 0x0D
+# AD structure length and type, Apple company id and iBeacon type and length
+IBEACON_PREFIX = b"\x1a\xff\x4c\x00\x02\x15"
+# flags AD structure most beacons advertise before the iBeacon one
+FLAGS_LENGTH = 3
+IBEACON_FIELDS = struct.Struct(">HHb")
+IBEACON_LENGTH = len(IBEACON_PREFIX) + 16 + IBEACON_FIELDS.size
+
+
+class IBeaconReportParser:
+    """ Decodes iBeacon advertisements straight from raw HCI LE advertising report events
+
+    Every check is made at a fixed offset of the received bytes, so frames that are not
+    iBeacons or do not match the UUID filter are rejected without allocating anything.
+    """
+
+    def __init__(self, uuid_filter=None):
+        self.uuid_filter = str(uuid.UUID(uuid_filter)) if uuid_filter else None
+        self._uuid_filter_bytes = uuid.UUID(uuid_filter).bytes if uuid_filter else None
+
+    def parse(self, packet):
+        """ Returns (mac_address, uuid, major, minor, tx_power, rssi) or None if it is not a matching iBeacon """
+        if len(packet) < 19 or packet[0] != HCI_EVENT_PACKET or packet[1] != LE_META_EVENT:
+            return None
+        if packet[3] == LE_ADVERTISING_REPORT:
+            address_offset, payload_offset, rssi = 7, 14, packet[-1]
+        elif packet[3] == LE_EXT_ADVERTISING_REPORT:
+            address_offset, payload_offset, rssi = 8, 29, packet[18]
+        else:
+            return None
+        if packet.startswith(IBEACON_PREFIX, payload_offset + FLAGS_LENGTH):
+            prefix_offset = payload_offset + FLAGS_LENGTH
+        elif packet.startswith(IBEACON_PREFIX, payload_offset):
+            prefix_offset = payload_offset
+        else:
+            return None
+        uuid_offset = prefix_offset + len(IBEACON_PREFIX)
+        if self._uuid_filter_bytes and not packet.startswith(self._uuid_filter_bytes, uuid_offset):
+            return None
+        if len(packet) < prefix_offset + IBEACON_LENGTH:
+            return None
+        major, minor, tx_power = IBEACON_FIELDS.unpack_from(packet, uuid_offset + 16)
+        if self.uuid_filter:
+            beacon_uuid = self.uuid_filter
+        else:
+            uuid_hex = packet[uuid_offset:uuid_offset + 16].hex()
+            beacon_uuid = f"{uuid_hex[:8]}-{uuid_hex[8:12]}-{uuid_hex[12:16]}-{uuid_hex[16:20]}-{uuid_hex[20:]}"
+        # address is sent little endian
+        mac_address = packet[address_offset + 5:address_offset - 1:-1].hex(":")
+        return mac_address, beacon_uuid, major, minor, tx_power, rssi - 256 if rssi > 127 else rssi
+
+
+def is_advertising_report(packet):
+    """ True for the LE advertising report events, the ones carrying advertisements """
+    return len(packet) > 3 and packet[0] == HCI_EVENT_PACKET and packet[1] == LE_META_EVENT and \
+        packet[3] in (LE_ADVERTISING_REPORT, LE_EXT_ADVERTISING_REPORT)
+
+
+def encode_advertising_report(mac_address, beacon_uuid, major, minor, tx_power, rssi):
+    """ Builds the legacy HCI LE advertising report event of an iBeacon advertisement """
+    address = bytes.fromhex(mac_address.replace(":", "")).rjust(6, b"\0")[::-1]
+    payload = b"\x02\x01\x06" + IBEACON_PREFIX + uuid.UUID(beacon_uuid).bytes + \
+        IBEACON_FIELDS.pack(major, minor, tx_power)
+    # event type ADV_NONCONN_IND and random address type
+    report = bytes([0x03, 0x01]) + address + bytes([len(payload)]) + payload + bytes([rssi & 0xFF])
+    return bytes([HCI_EVENT_PACKET, LE_META_EVENT, len(report) + 2, LE_ADVERTISING_REPORT, 0x01]) + report
@@ -0,0 +1,198 @@
+import os
+import time
+import sqlite3
+from collections import deque
+from threading import Thread, Event, Lock
+
+from log import error, warn, info, debug
+from metrics.services import metrics_register_counter, metrics_register_histogram, metrics_inc, metrics_time
+
+
+RESOLUTION_RAW = "raw"
+RESOLUTION_MINUTE = "minute"
+RESOLUTION_HOUR = "hour"
+# aggregate table and bucket seconds of each resolution
+AGGREGATES = {
+    RESOLUTION_MINUTE: ("readings_minute", 60),
+    RESOLUTION_HOUR: ("readings_hour", 3600),
+}
+PRUNE_INTERVAL = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    time REAL NOT NULL,
+    mac_address TEXT NOT NULL,
+    major INTEGER NOT NULL,
+    minor INTEGER NOT NULL,
+    uuid TEXT NOT NULL,
+    tx_power INTEGER NOT NULL,
+    rssi INTEGER NOT NULL,
+    adapter TEXT
+);
+CREATE INDEX IF NOT EXISTS readings_beacon_time ON readings (mac_address, major, minor, time);
+CREATE INDEX IF NOT EXISTS readings_time ON readings (time);
+""" + "".join(f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    mac_address TEXT NOT NULL,
+    major INTEGER NOT NULL,
+    minor INTEGER NOT NULL,
+    time INTEGER NOT NULL,
+    uuid TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    rssi_sum INTEGER NOT NULL,
+    rssi_min INTEGER NOT NULL,
+    rssi_max INTEGER NOT NULL,
+    PRIMARY KEY (mac_address, major, minor, time)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS {table}_time ON {table} (time);
+""" for table, _ in AGGREGATES.values())
+
+metrics_register_counter("history_readings_written_total", "Beacon readings written to the history store")
+metrics_register_counter("history_readings_dropped_total", "Beacon readings dropped because the history queue was full")
+metrics_register_histogram("history_flush_seconds", "Time to write a batch of readings and its aggregates to the history store")
+
+
+def _connect(filepath):
+    connection = sqlite3.connect(filepath, timeout=10)
+    # readers never block the writer and a commit does not wait for the disk
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class BeaconHistoryStore:
+    """ SQLite history of the beacon readings of each scan cycle, with per minute and per hour aggregates
+
+    append() only queues the readings. A background thread takes the whole queue and writes it
+    in one transaction per flush_interval, updates the aggregates of the same batch and removes the rows older
+    than the retention of their table.
+    """
+
+    def __init__(self, filepath, raw_retention=86400, minute_retention=604800, hour_retention=7776000,
+            flush_interval=1.0, queue_size=100000):
+        self.filepath = filepath
+        self.flush_interval = flush_interval
+        self.retentions = {
+            'readings': raw_retention,
+            'readings_minute': minute_retention,
+            'readings_hour': hour_retention,
+        }
+        self._queue = deque()
+        # append() runs in the scanner loop while the writer thread takes the queue
+        self._queue_lock = Lock()
+        self.queue_size = queue_size
+        self._stop_event = Event()
+        self._thread = None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = Thread(name="beacon_history_store", target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops the writer once the queued readings are written """
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def append(self, beacons_list, now=None):
+        """ Queues one reading of each beacon, dropping the oldest readings if the queue is full """
+        now = time.time() if now is None else now
+        readings = [(now, b.mac_address, b.major, b.minor, b.uuid, b.tx_power, b.rssi, b.adapter) for b in beacons_list]
+        with self._queue_lock:
+            overflow = len(self._queue) + len(readings) - self.queue_size
+            for _ in range(max(min(overflow, len(self._queue)), 0)):
+                self._queue.popleft()
+            self._queue.extend(readings[-self.queue_size:])
+        if overflow > 0:
+            metrics_inc("history_readings_dropped_total", overflow)
+
+    def _flush(self, connection):
+        with self._queue_lock:
+            readings, self._queue = self._queue, deque()
+        if not readings:
+            return
+        aggregates = {resolution: {} for resolution in AGGREGATES}
+        for reading_time, mac_address, major, minor, uuid, _, rssi, _ in readings:
+            for resolution, (_, bucket_seconds) in AGGREGATES.items():
+                key = (mac_address, major, minor, int(reading_time // bucket_seconds * bucket_seconds))
+                aggregate = aggregates[resolution].get(key)
+                if aggregate is None:
+                    aggregates[resolution][key] = [uuid, 1, rssi, rssi, rssi]
+                else:
+                    aggregate[1] += 1
+                    aggregate[2] += rssi
+                    aggregate[3] = min(aggregate[3], rssi)
+                    aggregate[4] = max(aggregate[4], rssi)
+        with metrics_time("history_flush_seconds"), connection:
+            connection.executemany("INSERT INTO readings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", readings)
+            for resolution, (table, _) in AGGREGATES.items():
+                connection.executemany(
+                    f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (mac_address, major, minor, time) DO UPDATE SET "
+                    "count = count + excluded.count, rssi_sum = rssi_sum + excluded.rssi_sum, "
+                    "rssi_min = min(rssi_min, excluded.rssi_min), rssi_max = max(rssi_max, excluded.rssi_max)",
+                    (key + tuple(aggregate) for key, aggregate in aggregates[resolution].items()),
+                )
+        metrics_inc("history_readings_written_total", len(readings))
+
+    def _prune(self, connection):
+        now = time.time()
+        with connection:
+            for table, retention in self.retentions.items():
+                connection.execute(f"DELETE FROM {table} WHERE time < ?", (now - retention,))
+
+    def _run(self):
+        try:
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            connection = _connect(self.filepath)
+            connection.executescript(_SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            error(f"Impossible to open history store '{self.filepath}': {e}")
+            return
+        pruned_at = 0
+        while 1:
+            stopping = self._stop_event.wait(self.flush_interval)
+            try:
+                self._flush(connection)
+                if time.monotonic() - pruned_at > PRUNE_INTERVAL:
+                    self._prune(connection)
+                    pruned_at = time.monotonic()
+            except sqlite3.Error as e:
+                error(f"Impossible to write history store '{self.filepath}': {e}")
+            if stopping:
+                break
+        connection.close()
+
+
+def query_history(filepath, mac_address=None, major=None, minor=None, since=None, until=None,
+        resolution=RESOLUTION_RAW, limit=1000):
+    """ Returns the readings, or the aggregates of the resolution, in the time range, oldest first """
+    if not os.path.exists(filepath):
+        return []
+    conditions, parameters = [], []
+    for column, value in (('mac_address', mac_address), ('major', major), ('minor', minor)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+    if since is not None:
+        conditions.append("time >= ?")
+        parameters.append(since)
+    if until is not None:
+        conditions.append("time < ?")
+        parameters.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    if resolution == RESOLUTION_RAW:
+        query = "SELECT time, mac_address, uuid, major, minor, tx_power, rssi, adapter FROM readings"
+        columns = ('time', 'mac_address', 'uuid', 'major', 'minor', 'tx_power', 'rssi', 'adapter')
+    else:
+        query = "SELECT time, mac_address, uuid, major, minor, count, " \
+            f"CAST(rssi_sum AS REAL) / count, rssi_min, rssi_max FROM {AGGREGATES[resolution][0]}"
+        columns = ('time', 'mac_address', 'uuid', 'major', 'minor', 'count', 'rssi_mean', 'rssi_min', 'rssi_max')
+    connection = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True, timeout=10)
+    try:
+        rows = connection.execute(f"{query} {where} ORDER BY time LIMIT ?", parameters + [limit]).fetchall()
+    finally:
+        connection.close()
+    return [dict(zip(columns, row)) for row in rows]
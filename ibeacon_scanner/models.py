@@ -1,21 +1,48 @@
+import time
+import heapq
+from threading import Lock
+
 
 class IBeacon:
     """ Class that represents an iBeacon packet """
 
-    def __init__(self, mac_address="", uuid="", major=0, minor=0, tx_power=0, rssi=0):
+    __slots__ = ('mac_address', 'uuid', 'major', 'minor', 'tx_power', 'rssi', 'adapter', 'adapters_rssi', 'key')
+
+    def __init__(self, mac_address="", uuid="", major=0, minor=0, tx_power=0, rssi=0, adapter=None, adapters_rssi=None):
         self.mac_address = mac_address
         self.uuid = uuid
         self.major = major
         self.minor = minor
         self.tx_power = tx_power
-        self.rssi = rssi		
+        self.rssi = rssi
+        # adapter that heard this reading, and last RSSI heard by each adapter once merged
+        self.adapter = adapter
+        self.adapters_rssi = adapters_rssi if adapters_rssi is not None else {}
+        # identity key computed once, used for every comparison and lookup
+        self.key = hash((mac_address, major, minor))
 
     def hash(self):
-        return hash(
-           str(self.mac_address) + 
-           str(self.major) +
-           str(self.minor)
-        )
+        return self.key
+
+    def to_json(self):
+        return {
+            "mac_address": self.mac_address,
+            "uuid": self.uuid,
+            "major": self.major,
+            "minor": self.minor,
+            "tx_power": self.tx_power,
+            "rssi": self.rssi,
+            "adapter": self.adapter,
+            "adapters_rssi": self.adapters_rssi,
+        }
+
+    def to_identity_json(self):
+        return {
+            "mac_address": self.mac_address,
+            "uuid": self.uuid,
+            "major": self.major,
+            "minor": self.minor,
+        }
 
     def __repr__(self):
         return f"IBeacon(" + \
@@ -24,13 +51,192 @@ class IBeacon:
             f"major={self.major}, " + \
             f"minor={self.minor}, " + \
             f"tx_power={self.tx_power}, " + \
-            f"rssi={self.rssi}" + \
+            f"rssi={self.rssi}, " + \
+            f"adapter={self.adapter}" + \
         ")"
 
     def __eq__(self, other):
-        if self.hash() == other.hash():
-            return True
-        return False
+        return self.key == other.key
+
+    def __hash__(self):
+        return self.key
 
     def __lt__(self, other):
          return other.rssi < self.rssi
+
+
+class IBeaconTopK:
+    """ Identity keys of the capacity strongest beacons, each with its current RSSI
+
+    A min-heap gives the weakest beacon kept in O(log capacity), so a new beacon only gets
+    in by pushing out a weaker one. RSSI changes push a new heap entry and leave the old one
+    to be skipped when it comes up, the heap is rebuilt when stale entries pile up. Readings
+    of new beacons too weak to get in and beacons pushed out are counted in overflow.
+    """
+
+    def __init__(self, capacity=None):
+        self.capacity = capacity
+        self.overflow = 0
+        self._rssi = {}
+        self._heap = []
+
+    def _push(self, key, rssi):
+        self._rssi[key] = rssi
+        heapq.heappush(self._heap, (rssi, key))
+        if len(self._heap) > 2 * len(self._rssi) + 16:
+            self._heap = [(rssi, key) for key, rssi in self._rssi.items()]
+            heapq.heapify(self._heap)
+
+    def _weakest(self):
+        while self._heap and self._rssi.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0]
+
+    def admit(self, key, rssi):
+        """ Records the RSSI of the beacon, returns (kept, key of the beacon pushed out or None) """
+        if self.capacity is None:
+            return True, None
+        current_rssi = self._rssi.get(key)
+        if current_rssi is not None:
+            if current_rssi != rssi:
+                self._push(key, rssi)
+            return True, None
+        if len(self._rssi) < self.capacity:
+            self._push(key, rssi)
+            return True, None
+        self.overflow += 1
+        if not self._rssi:
+            return False, None
+        weakest_rssi, weakest_key = self._weakest()
+        if rssi <= weakest_rssi:
+            return False, None
+        heapq.heappop(self._heap)
+        del self._rssi[weakest_key]
+        self._push(key, rssi)
+        return True, weakest_key
+
+    def discard(self, key):
+        self._rssi.pop(key, None)
+
+
+class IBeaconTable:
+    """ Table with one reading per beacon, keyed by its (mac, major, minor) identity
+
+    With a capacity only the strongest beacons are kept, see IBeaconTopK.
+    """
+
+    def __init__(self, keep_strongest=True, capacity=None):
+        self.keep_strongest = keep_strongest
+        self._beacons = {}
+        self._adapters_rssi = {}
+        self._received = {}
+        self._top_k = IBeaconTopK(capacity)
+
+    @property
+    def overflow(self):
+        return self._top_k.overflow
+
+    def add(self, beacon):
+        """ Keeps the strongest reading of the beacon, or the latest one if keep_strongest is off
+
+        Returns False if the beacon was left out because the table is full of stronger ones.
+        """
+        self._received[beacon.adapter] = self._received.get(beacon.adapter, 0) + 1
+        current_beacon = self._beacons.get(beacon.key)
+        if current_beacon is None or not self.keep_strongest or current_beacon.rssi < beacon.rssi:
+            kept, evicted_key = self._top_k.admit(beacon.key, beacon.rssi)
+            if not kept:
+                return False
+            if evicted_key is not None:
+                del self._beacons[evicted_key]
+                self._adapters_rssi.pop(evicted_key, None)
+            self._beacons[beacon.key] = beacon
+        if beacon.adapter is not None:
+            adapters_rssi = self._adapters_rssi.setdefault(beacon.key, {})
+            adapter_rssi = adapters_rssi.get(beacon.adapter)
+            if adapter_rssi is None or not self.keep_strongest or adapter_rssi < beacon.rssi:
+                adapters_rssi[beacon.adapter] = beacon.rssi
+        return True
+
+    def beacons(self):
+        for key, beacon in self._beacons.items():
+            beacon.adapters_rssi = self._adapters_rssi.get(key, beacon.adapters_rssi)
+        return list(self._beacons.values())
+
+    def take_received(self):
+        """ Returns the readings added by each adapter since the last call """
+        received, self._received = self._received, {}
+        return received
+
+    def __len__(self):
+        return len(self._beacons)
+
+
+class IBeaconWindow:
+    """ Table with the last reading of each beacon and adapter heard within a time window
+
+    With a capacity only the strongest beacons are kept, see IBeaconTopK.
+    """
+
+    def __init__(self, window=3, capacity=None):
+        self.window = window
+        self._readings = {}
+        self._received = {}
+        self._lock = Lock()
+        self._top_k = IBeaconTopK(capacity)
+
+    @property
+    def overflow(self):
+        return self._top_k.overflow
+
+    def add(self, beacon, now=None):
+        """ Returns False if the beacon was left out because the window is full of stronger ones """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._received[beacon.adapter] = self._received.get(beacon.adapter, 0) + 1
+            adapters_readings = self._readings.get(beacon.key)
+            # a beacon is as strong as its best adapter
+            rssi = beacon.rssi
+            for adapter, (adapter_beacon, _) in (adapters_readings or {}).items():
+                if adapter != beacon.adapter and adapter_beacon.rssi > rssi:
+                    rssi = adapter_beacon.rssi
+            kept, evicted_key = self._top_k.admit(beacon.key, rssi)
+            if not kept:
+                return False
+            if evicted_key is not None:
+                del self._readings[evicted_key]
+            if adapters_readings is None:
+                adapters_readings = self._readings[beacon.key] = {}
+            adapters_readings[beacon.adapter] = (beacon, now)
+        return True
+
+    def snapshot(self, now=None):
+        """ Drops the readings older than the window and returns the strongest reading of each beacon """
+        now = time.monotonic() if now is None else now
+        beacons_list = []
+        with self._lock:
+            for key, adapters_readings in list(self._readings.items()):
+                expired_adapters = [
+                    adapter for adapter, (_, heard_at) in adapters_readings.items()
+                    if now - heard_at > self.window
+                ]
+                for adapter in expired_adapters:
+                    del adapters_readings[adapter]
+                if not adapters_readings:
+                    del self._readings[key]
+                    self._top_k.discard(key)
+                    continue
+                beacon = max((b for b, _ in adapters_readings.values()), key=lambda b: b.rssi)
+                # expired readings may have been the strongest ones
+                self._top_k.admit(key, beacon.rssi)
+                beacon.adapters_rssi = {
+                    adapter: b.rssi for adapter, (b, _) in adapters_readings.items() if adapter is not None
+                }
+                beacons_list.append(beacon)
+        return beacons_list
+
+    def take_received(self):
+        """ Returns the readings added by each adapter since the last call """
+        with self._lock:
+            received, self._received = self._received, {}
+        return received
@@ -0,0 +1,184 @@
+import time
+
+import numpy as np
+
+
+MIN_ANCHORS = 3
+GAUSS_NEWTON_ITERATIONS = 3
+
+
+def estimate_distance(rssi, tx_power, path_loss_exponent=2.0, rssi_offset=0.0):
+    """ Distance in meters from the log-distance path loss model, for scalars or arrays
+
+    tx_power is the RSSI calibrated at 1 meter, rssi_offset corrects the RSSI read by a
+    given scanner and path_loss_exponent is 2 in free space and larger with obstacles.
+    """
+    return 10 ** ((np.asarray(tx_power) - (np.asarray(rssi) + rssi_offset)) / (10 * path_loss_exponent))
+
+
+def calibrate_path_loss(distances, rssis, tx_powers):
+    """ Fits path_loss_exponent and rssi_offset to readings taken at known distances
+
+    Readings follow rssi + rssi_offset = tx_power - 10 * path_loss_exponent * log10(distance),
+    a line on log10(distance) solved by least squares.
+    """
+    log_distances = np.log10(np.asarray(distances, dtype=np.float64))
+    path_losses = np.asarray(rssis, dtype=np.float64) - np.asarray(tx_powers, dtype=np.float64)
+    coefficients = np.vstack([log_distances, np.ones_like(log_distances)]).T
+    (slope, intercept), *_ = np.linalg.lstsq(coefficients, path_losses, rcond=None)
+    return {
+        'path_loss_exponent': float(-slope / 10),
+        'rssi_offset': float(-intercept),
+    }
+
+
+def _range_costs(positions, anchors, distances, weights):
+    ranges = np.linalg.norm(positions[:, None, :] - anchors[None, :, :], axis=2)
+    return (weights * (ranges - distances) ** 2).sum(axis=1)
+
+
+def trilaterate(anchors, distances, mask, margin=5.0):
+    """ Least squares 2D positions of many tags at once
+
+    anchors is a (scanners, 2) array of coordinates, distances and mask are (tags, scanners)
+    arrays, mask telling which scanners heard each tag. Positions start from the linear
+    solution of the range equations and are refined by Gauss-Newton on the range residuals,
+    weighting nearer readings more since their error in meters is smaller, a step being
+    shortened or dropped for the tags it would not improve. Positions are kept within margin
+    meters of the rectangle holding the scanners. Returns the
+    (tags, 2) positions and the root mean square range residual of each tag, NaN for the
+    tags heard by less than three scanners or by collinear ones.
+    """
+    distances = np.where(mask, distances, 0.0)
+    weights = np.where(mask, 1.0 / np.maximum(distances, 0.1) ** 2, 0.0)
+    # |p|^2 - 2 a.p + |a|^2 = d^2 is linear in (x, y, |p|^2)
+    design = np.empty(anchors.shape[:1] + (3,))
+    design[:, :2] = -2 * anchors
+    design[:, 2] = 1
+    targets = distances ** 2 - (anchors ** 2).sum(axis=1)
+    normal_matrices = np.einsum('tk,ki,kj->tij', weights, design, design)
+    normal_vectors = np.einsum('tk,ki,tk->ti', weights, design, targets)
+    solvable = (mask.sum(axis=1) >= MIN_ANCHORS) & (np.abs(np.linalg.det(normal_matrices)) > 1e-9)
+    positions = np.full((len(distances), 2), np.nan)
+    if not solvable.any():
+        return positions, np.full(len(distances), np.nan)
+    distances, weights = distances[solvable], weights[solvable]
+    solved_positions = np.linalg.solve(normal_matrices[solvable], normal_vectors[solvable][..., None])[:, :2, 0]
+    # inconsistent ranges can put the solution far away, it is kept around the scanners
+    lower_bounds, upper_bounds = anchors.min(axis=0) - margin, anchors.max(axis=0) + margin
+    solved_positions = np.clip(solved_positions, lower_bounds, upper_bounds)
+    costs = _range_costs(solved_positions, anchors, distances, weights)
+    for _ in range(GAUSS_NEWTON_ITERATIONS):
+        offsets = solved_positions[:, None, :] - anchors[None, :, :]
+        ranges = np.maximum(np.linalg.norm(offsets, axis=2), 1e-6)
+        jacobians = offsets / ranges[..., None]
+        normal_matrices = np.einsum('tk,tki,tkj->tij', weights, jacobians, jacobians) + 1e-9 * np.eye(2)
+        normal_vectors = np.einsum('tk,tki,tk->ti', weights, jacobians, ranges - distances)
+        steps = np.linalg.solve(normal_matrices, normal_vectors[..., None])[..., 0]
+        # each tag keeps its step only if it fits the ranges better, halving it otherwise
+        for step_scale in (1.0, 0.5, 0.25):
+            candidate_positions = np.clip(solved_positions - step_scale * steps, lower_bounds, upper_bounds)
+            candidate_costs = _range_costs(candidate_positions, anchors, distances, weights)
+            improved = candidate_costs < costs
+            solved_positions[improved], costs[improved] = candidate_positions[improved], candidate_costs[improved]
+            steps[improved] = 0
+    ranges = np.linalg.norm(solved_positions[:, None, :] - anchors[None, :, :], axis=2)
+    solved_mask = mask[solvable]
+    errors = np.sqrt(((ranges - distances) ** 2 * solved_mask).sum(axis=1) / solved_mask.sum(axis=1))
+    positions[solvable] = solved_positions
+    all_errors = np.full(len(mask), np.nan)
+    all_errors[solvable] = errors
+    return positions, all_errors
+
+
+class PositioningEngine:
+    """ Distance to each scanner that heard a beacon and its 2D position when scanners are at known coordinates
+
+    scanner_positions maps each adapter to its coordinates in meters and, optionally, to its
+    own path_loss_exponent and rssi_offset. Positions are kept within margin meters of
+    the rectangle holding the scanners. Beacons are solved in batches of up to batch_size,
+    sized to fit the budget seconds of a cycle; the rest keep their last position and are solved
+    first in the next cycle, so every beacon is refreshed even when they do not all fit.
+    """
+
+    def __init__(self, scanner_positions=None, path_loss_exponent=2.0, rssi_offset=0.0, margin=5.0,
+            budget=0.02, batch_size=256):
+        self.scanner_positions = scanner_positions = scanner_positions or {}
+        self.adapters = list(scanner_positions)
+        self._adapter_columns = {adapter: column for column, adapter in enumerate(self.adapters)}
+        self._anchors = np.array(
+            [[scanner['x'], scanner['y']] for scanner in scanner_positions.values()], dtype=np.float64).reshape(-1, 2)
+        self._path_loss_exponents = np.array(
+            [scanner.get('path_loss_exponent', path_loss_exponent) for scanner in scanner_positions.values()])
+        self._rssi_offsets = np.array(
+            [scanner.get('rssi_offset', rssi_offset) for scanner in scanner_positions.values()])
+        self.path_loss_exponent = path_loss_exponent
+        self.rssi_offset = rssi_offset
+        self.margin = margin
+        self.budget = budget
+        self.batch_size = batch_size
+        # last position of each beacon, by key
+        self._positions = {}
+        self.skipped = 0
+        # solving time of one beacon in the last batch
+        self._beacon_seconds = 1e-5
+
+    def _solve_batch(self, beacons, now):
+        rssis = np.zeros((len(beacons), len(self.adapters)))
+        mask = np.zeros(rssis.shape, dtype=bool)
+        tx_powers = np.array([beacon.tx_power for beacon in beacons], dtype=np.float64)
+        for row, beacon in enumerate(beacons):
+            for adapter, rssi in beacon.adapters_rssi.items():
+                column = self._adapter_columns.get(adapter)
+                if column is not None:
+                    rssis[row, column], mask[row, column] = rssi, True
+        distances = estimate_distance(rssis, tx_powers[:, None], self._path_loss_exponents, self._rssi_offsets)
+        positions, errors = trilaterate(self._anchors, distances, mask, self.margin)
+        # python values once per batch, numpy scalars are slow to convert one by one
+        solved_rows = (~np.isnan(errors)).tolist()
+        positions, errors = positions.round(3).tolist(), errors.round(3).tolist()
+        distances, mask = distances.round(3).tolist(), mask.tolist()
+        adapter_columns = list(self._adapter_columns.items())
+        for row, beacon in enumerate(beacons):
+            beacon_distances = {adapter: distances[row][column] for adapter, column in adapter_columns if mask[row][column]}
+            # scanners at unknown coordinates still give a distance, with the default calibration
+            for adapter, rssi in beacon.adapters_rssi.items():
+                if adapter not in beacon_distances:
+                    beacon_distances[adapter] = round(
+                        10 ** ((beacon.tx_power - rssi - self.rssi_offset) / (10 * self.path_loss_exponent)), 3)
+            solved = solved_rows[row]
+            self._positions[beacon.key] = dict(
+                beacon.to_identity_json(),
+                updated_at=now,
+                x=positions[row][0] if solved else None,
+                y=positions[row][1] if solved else None,
+                error=errors[row] if solved else None,
+                distances=beacon_distances,
+            )
+
+    def update(self, beacons_list, now=None):
+        """ Solves the beacons of the cycle within the budget, returns how many were solved """
+        started_at = time.perf_counter()
+        now = time.time() if now is None else now
+        current_keys = {beacon.key for beacon in beacons_list}
+        for key in [key for key in self._positions if key not in current_keys]:
+            del self._positions[key]
+        # the beacons solved the longest ago go first
+        beacons = sorted(beacons_list, key=lambda beacon: self._positions.get(beacon.key, {}).get('updated_at', 0))
+        solved = 0
+        while solved < len(beacons):
+            remaining_seconds = self.budget - (time.perf_counter() - started_at)
+            # batches are sized by the time a beacon took so far, so the last one does not overrun the budget
+            batch_size = min(self.batch_size, remaining_seconds / self._beacon_seconds)
+            if batch_size < 1:
+                break
+            batch = beacons[solved:solved + int(batch_size)]
+            batch_started_at = time.perf_counter()
+            self._solve_batch(batch, now)
+            self._beacon_seconds = (time.perf_counter() - batch_started_at) / len(batch)
+            solved += len(batch)
+        self.skipped = len(beacons) - solved
+        return solved
+
+    def snapshot(self):
+        return list(self._positions.values())
@@ -0,0 +1,150 @@
+import uuid
+from bisect import bisect_right
+
+
+MAX_IDENTIFIER = 0xFFFF
+# rules without a uuid apply to every uuid
+ANY_UUID = "*"
+
+
+def _parse_range(value, field):
+    """ (low, high) inclusive from a number, a [low, high] pair or None for the whole range """
+    if value is None:
+        return 0, MAX_IDENTIFIER
+    if isinstance(value, int) and not isinstance(value, bool):
+        low = high = value
+    elif isinstance(value, (list, tuple)) and len(value) == 2 and all(
+            isinstance(bound, int) and not isinstance(bound, bool) for bound in value):
+        low, high = value
+    else:
+        raise ValueError(f"Filter {field} must be a number or a [low, high] pair, got {value!r}")
+    if not 0 <= low <= high <= MAX_IDENTIFIER:
+        raise ValueError(f"Filter {field} range {value!r} must be within 0 and {MAX_IDENTIFIER}, low first")
+    return low, high
+
+
+def parse_filter_rules(uuid_filter):
+    """ Normalizes a uuid_filter setting into (uuid, major range, minor range) rules
+
+    uuid_filter is a UUID, several separated by commas, or a list whose items are UUIDs
+    or {"uuid": ..., "major": ..., "minor": ...} rules, where major and minor are a number
+    or an inclusive [low, high] pair and any of the three may be left out. An empty
+    uuid_filter accepts every beacon. Raises ValueError for a malformed filter.
+    """
+    if not uuid_filter:
+        return []
+    if isinstance(uuid_filter, str):
+        uuid_filter = [value for value in uuid_filter.replace(" ", "").split(",") if value]
+    if not isinstance(uuid_filter, list):
+        raise ValueError(f"Filter must be a UUID string or a list of rules, got {uuid_filter!r}")
+    rules = []
+    for rule in uuid_filter:
+        if isinstance(rule, str):
+            rule = {'uuid': rule}
+        if not isinstance(rule, dict) or set(rule) - {'uuid', 'major', 'minor'}:
+            raise ValueError(f"Filter rule must be a UUID or a dict with uuid, major and minor, got {rule!r}")
+        try:
+            rule_uuid = str(uuid.UUID(rule['uuid'])) if rule.get('uuid') else ANY_UUID
+        except (TypeError, ValueError):
+            raise ValueError(f"Filter rule uuid {rule['uuid']!r} is not a UUID")
+        rules.append((rule_uuid, _parse_range(rule.get('major'), 'major'), _parse_range(rule.get('minor'), 'minor')))
+    return rules
+
+
+def _merge_ranges(ranges):
+    merged_ranges = []
+    for low, high in sorted(ranges):
+        if merged_ranges and low <= merged_ranges[-1][1] + 1:
+            merged_ranges[-1][1] = max(merged_ranges[-1][1], high)
+        else:
+            merged_ranges.append([low, high])
+    return merged_ranges
+
+
+class _IntervalIndex:
+    """ Major and minor ranges of the rules of one uuid, split into disjoint major segments
+
+    Every segment holds the merged minor ranges of the rules covering it, so a lookup
+    is a binary search on the segments and another one on the minor ranges of its segment.
+    """
+
+    def __init__(self, ranges):
+        # sweeps the major axis, the rules covering a segment are the ones started and not ended yet
+        starts, ends = {}, {}
+        for number, ((low, high), minor_range) in enumerate(ranges):
+            starts.setdefault(low, []).append((number, minor_range))
+            ends.setdefault(high + 1, []).append(number)
+        active_ranges = {}
+        self._starts, self._minor_lows, self._minor_highs = [], [], []
+        for boundary in sorted(set(starts) | set(ends)):
+            for number in ends.get(boundary, ()):
+                del active_ranges[number]
+            active_ranges.update(starts.get(boundary, ()))
+            minor_ranges = _merge_ranges(active_ranges.values())
+            self._starts.append(boundary)
+            self._minor_lows.append([low for low, _ in minor_ranges])
+            self._minor_highs.append([high for _, high in minor_ranges])
+
+    def match(self, major, minor):
+        segment = bisect_right(self._starts, major) - 1
+        if segment < 0:
+            return False
+        minor_lows = self._minor_lows[segment]
+        position = bisect_right(minor_lows, minor) - 1
+        return position >= 0 and minor <= self._minor_highs[segment][position]
+
+
+class BeaconPrefilter:
+    """ Compiled uuid_filter rules checked for every advertisement before any IBeacon is built
+
+    UUIDs accepted whole are kept in a set and the ones limited to major and minor ranges in
+    an interval index per UUID, so a check costs a set lookup plus two binary searches at
+    most, whatever the number of rules. update() compiles new rules aside and swaps them in
+    with a single assignment, so the backend threads calling match() never see half of them.
+    """
+
+    def __init__(self, uuid_filter=None):
+        self.rejected = 0
+        self._compiled = None
+        self.update(uuid_filter)
+
+    def update(self, uuid_filter):
+        """ Compiles and applies new rules, raises ValueError and keeps the current ones if they are malformed """
+        rules = parse_filter_rules(uuid_filter)
+        if not rules:
+            self._compiled = None
+            return
+        whole_range = ((0, MAX_IDENTIFIER), (0, MAX_IDENTIFIER))
+        whole_uuids = {rule_uuid for rule_uuid, *ranges in rules if tuple(ranges) == whole_range}
+        if ANY_UUID in whole_uuids:
+            self._compiled = None
+            return
+        ranges_by_uuid = {}
+        for rule_uuid, major_range, minor_range in rules:
+            if rule_uuid not in whole_uuids:
+                ranges_by_uuid.setdefault(rule_uuid, []).append((major_range, minor_range))
+        interval_indexes = {rule_uuid: _IntervalIndex(ranges) for rule_uuid, ranges in ranges_by_uuid.items()}
+        # a rule for any uuid must be checked for every uuid
+        self._compiled = (frozenset(whole_uuids), interval_indexes, interval_indexes.pop(ANY_UUID, None))
+
+    @property
+    def uuids(self):
+        """ UUIDs accepted by some rule, None when any UUID may be """
+        if self._compiled is None or self._compiled[2] is not None or ANY_UUID in self._compiled[0]:
+            return None
+        return sorted(self._compiled[0] | set(self._compiled[1]))
+
+    def match(self, beacon_uuid, major, minor):
+        compiled = self._compiled
+        if compiled is None:
+            return True
+        whole_uuids, interval_indexes, any_uuid_index = compiled
+        if beacon_uuid in whole_uuids:
+            return True
+        interval_index = interval_indexes.get(beacon_uuid)
+        if interval_index is not None and interval_index.match(major, minor):
+            return True
+        if any_uuid_index is not None and any_uuid_index.match(major, minor):
+            return True
+        self.rejected += 1
+        return False
@@ -0,0 +1,92 @@
+import time
+from datetime import date, datetime
+
+
+PRUNE_INTERVAL = 60
+
+
+class BeaconPresence:
+    """ Presence of one beacon, updated in place by each reading """
+
+    __slots__ = ('identity', 'first_seen', 'last_seen', 'session_started_at', 'sessions',
+        'dwell', 'day', 'day_dwell')
+
+    def __init__(self, identity, now):
+        self.identity = identity
+        self.first_seen = now
+        self.last_seen = now
+        self.session_started_at = now
+        self.sessions = 1
+        self.dwell = 0.0
+        self.day = date.fromtimestamp(now).toordinal()
+        self.day_dwell = 0.0
+
+    def to_json(self, now, grace_period):
+        # a dwell counted on an older day is not today's anymore
+        today = date.fromtimestamp(now).toordinal()
+        return dict(
+            self.identity,
+            present=now - self.last_seen <= grace_period,
+            first_seen=self.first_seen,
+            last_seen=self.last_seen,
+            session_started_at=self.session_started_at,
+            sessions=self.sessions,
+            dwell_seconds=round(self.dwell, 3),
+            dwell_today_seconds=round(self.day_dwell, 3) if self.day == today else 0.0,
+        )
+
+
+class PresenceTracker:
+    """ First and last seen time, sessions and dwell time of each beacon seen by the scan cycles
+
+    Each reading costs one lookup: a beacon seen again within grace_period seconds extends
+    its session and adds the time since its last reading to its dwell, otherwise a new
+    session starts. Short dropouts therefore do not split sessions, and sessions expire
+    by time alone, with no pass over the beacons out of range. Beacons not seen for
+    retention seconds are forgotten.
+    """
+
+    def __init__(self, grace_period=30.0, retention=86400):
+        self.grace_period = grace_period
+        self.retention = retention
+        self._presences = {}
+        self._pruned_at = time.monotonic()
+
+    def update(self, beacons_list, now=None):
+        now = time.time() if now is None else now
+        grace_period = self.grace_period
+        day = date.fromtimestamp(now).toordinal()
+        day_started_at = datetime.combine(date.fromordinal(day), datetime.min.time()).timestamp()
+        for beacon in beacons_list:
+            presence = self._presences.get(beacon.key)
+            if presence is None:
+                self._presences[beacon.key] = BeaconPresence(beacon.to_identity_json(), now)
+                continue
+            elapsed = now - presence.last_seen
+            if elapsed < 0:
+                continue
+            if elapsed <= grace_period:
+                presence.dwell += elapsed
+                if day != presence.day:
+                    # a visit across midnight only adds to the new day the time since midnight
+                    presence.day, presence.day_dwell = day, 0.0
+                    elapsed = min(elapsed, now - day_started_at)
+                presence.day_dwell += elapsed
+            else:
+                presence.sessions += 1
+                presence.session_started_at = now
+            presence.last_seen = now
+        if time.monotonic() - self._pruned_at > PRUNE_INTERVAL:
+            self._prune(now)
+
+    def _prune(self, now):
+        self._pruned_at = time.monotonic()
+        expired_keys = [key for key, presence in self._presences.items() if now - presence.last_seen > self.retention]
+        for key in expired_keys:
+            del self._presences[key]
+
+    def snapshot(self, now=None):
+        """ Presence of every tracked beacon as JSON, most recently seen first """
+        now = time.time() if now is None else now
+        presences = sorted(self._presences.values(), key=lambda presence: presence.last_seen, reverse=True)
+        return [presence.to_json(now, self.grace_period) for presence in presences]
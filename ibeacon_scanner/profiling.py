@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+
+
+PROFILE_CPU = "cpu"
+PROFILE_MEMORY = "memory"
+PROFILE_KINDS = (PROFILE_CPU, PROFILE_MEMORY)
+TRACEMALLOC_FRAMES = 16
+TRACEMALLOC_TOP_STATS = 50
+
+
+class StackSampler:
+    """ Samples the stack of every thread of the process at a fixed interval
+
+    Stacks are counted in the collapsed format of flamegraph.pl and speedscope, one line
+    per distinct stack: thread;outermost function;...;innermost function count
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        sampler_thread_id = threading.get_ident()
+        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == sampler_thread_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(thread_names.get(thread_id, str(thread_id)))
+            self._stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(name="stack_sampler", target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def write(self, filepath):
+        with open(filepath, 'w') as folded_file:
+            for stack, count in self._stacks.most_common():
+                folded_file.write(f"{stack} {count}\n")
+
+
+def _profile_filepath(directory, kind, extension):
+    return os.path.join(directory, f"{kind}-{time.strftime('%Y%m%d-%H%M%S')}.{extension}")
+
+
+def profile_cpu(directory, duration, interval=0.005):
+    """ Samples every thread for duration seconds and writes their collapsed stacks, returns the files """
+    stack_sampler = StackSampler(interval)
+    stack_sampler.start()
+    time.sleep(duration)
+    stack_sampler.stop()
+    os.makedirs(directory, exist_ok=True)
+    filepath = _profile_filepath(directory, PROFILE_CPU, "folded")
+    stack_sampler.write(filepath)
+    return [filepath]
+
+
+def trace_memory(directory, duration):
+    """ Traces allocations for duration seconds and writes the ones still alive, returns the files
+
+    The snapshot is written twice: as text with the lines that allocated the most, and
+    dumped for tracemalloc.Snapshot.load() to be inspected or compared offline.
+    """
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        time.sleep(duration)
+        snapshot = tracemalloc.take_snapshot()
+        traced_memory, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    os.makedirs(directory, exist_ok=True)
+    filepath = _profile_filepath(directory, PROFILE_MEMORY, "txt")
+    with open(filepath, 'w') as stats_file:
+        stats_file.write(f"Traced during {duration}s: {traced_memory} bytes alive, {peak_memory} bytes at peak\n\n")
+        for statistic in snapshot.statistics('lineno')[:TRACEMALLOC_TOP_STATS]:
+            stats_file.write(f"{statistic}\n")
+    snapshot_filepath = f"{os.path.splitext(filepath)[0]}.tracemalloc"
+    snapshot.dump(snapshot_filepath)
+    return [filepath, snapshot_filepath]
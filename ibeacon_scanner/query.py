@@ -0,0 +1,118 @@
+import json
+import base64
+from bisect import bisect_left, bisect_right, insort
+
+
+# fields with an index of the beacons having each of their values
+INDEXED_FIELDS = ('mac_address', 'uuid', 'major', 'minor')
+# moves of the rssi order above 1 / REORDER_RATIO of the beacons sort it from scratch
+REORDER_RATIO = 8
+BEACON_FIELDS = ('mac_address', 'uuid', 'major', 'minor', 'tx_power', 'rssi', 'adapter', 'adapters_rssi')
+
+
+def encode_cursor(sort_key):
+    """ Opaque cursor pointing after the beacon with the sort key given """
+    if sort_key is None:
+        return None
+    negative_rssi, (mac_address, major, minor) = sort_key
+    return base64.urlsafe_b64encode(json.dumps([negative_rssi, mac_address, major, minor]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """ Sort key of an encoded cursor, raises ValueError if it is not one """
+    if not cursor:
+        return None
+    try:
+        negative_rssi, mac_address, major, minor = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return negative_rssi, (mac_address, major, minor)
+
+
+class BeaconsIndex:
+    """ Beacons of the last published scan cycle with secondary indexes, strongest RSSI first
+
+    update() only touches the beacons that appeared, left or changed since the previous cycle.
+    A query walks the RSSI order from its cursor, or the smallest index bucket of its filters,
+    so its cost depends on the beacons returned and not on the number of beacons seen. Cursors
+    hold the sort key of the last beacon returned, a page goes on after it even if the beacons
+    changed in between.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._beacons = {}
+        # (-rssi, key) of every beacon, kept sorted
+        self._order = []
+        self._indexes = {field: {} for field in INDEXED_FIELDS}
+
+    def _index(self, key, beacon):
+        for field in INDEXED_FIELDS:
+            self._indexes[field].setdefault(beacon[field], set()).add(key)
+
+    def _unindex(self, key, beacon):
+        for field in INDEXED_FIELDS:
+            keys = self._indexes[field][beacon[field]]
+            keys.discard(key)
+            if not keys:
+                del self._indexes[field][beacon[field]]
+
+    def update(self, beacons_list, version=None):
+        """ Applies the beacons of a new scan cycle, as published in beacons data """
+        # empty slots of the shared memory store have no mac address
+        current_beacons = {
+            (beacon['mac_address'], beacon['major'], beacon['minor']): beacon
+            for beacon in beacons_list if beacon['mac_address']
+        }
+        removed_sort_keys, added_sort_keys = [], []
+        for key in self._beacons.keys() - current_beacons.keys():
+            beacon = self._beacons.pop(key)
+            self._unindex(key, beacon)
+            removed_sort_keys.append((-beacon['rssi'], key))
+        for key, beacon in current_beacons.items():
+            previous_beacon = self._beacons.get(key)
+            if previous_beacon is None:
+                self._index(key, beacon)
+                added_sort_keys.append((-beacon['rssi'], key))
+            else:
+                if previous_beacon['uuid'] != beacon['uuid']:
+                    self._unindex(key, previous_beacon)
+                    self._index(key, beacon)
+                if previous_beacon['rssi'] != beacon['rssi']:
+                    removed_sort_keys.append((-previous_beacon['rssi'], key))
+                    added_sort_keys.append((-beacon['rssi'], key))
+            self._beacons[key] = beacon
+        # every move shifts the list, past a share of the beacons sorting it again is cheaper
+        if len(added_sort_keys) + len(removed_sort_keys) > len(self._beacons) // REORDER_RATIO:
+            self._order = sorted((-beacon['rssi'], key) for key, beacon in self._beacons.items())
+        else:
+            for sort_key in removed_sort_keys:
+                del self._order[bisect_left(self._order, sort_key)]
+            for sort_key in added_sort_keys:
+                insort(self._order, sort_key)
+        self.version = version
+
+    def _sort_keys(self, filters, after):
+        """ Sort keys of the beacons matching every filter, in order from after """
+        if not filters:
+            return (self._order[position] for position in range(
+                bisect_right(self._order, after) if after else 0, len(self._order)))
+        buckets = sorted((self._indexes[field].get(value, ()) for field, value in filters), key=len)
+        sort_keys = sorted(
+            (-self._beacons[key]['rssi'], key) for key in buckets[0] if all(key in keys for keys in buckets[1:]))
+        return sort_keys[bisect_right(sort_keys, after):] if after else sort_keys
+
+    def query(self, mac_address=None, uuid=None, major=None, minor=None, min_rssi=None, limit=None, after=None):
+        """ Returns up to limit matching beacons from the sort key after, and the sort key to go on from or None """
+        filters = [(field, value) for field, value in zip(INDEXED_FIELDS, (mac_address, uuid, major, minor))
+            if value is not None]
+        beacons = []
+        for sort_key in self._sort_keys(filters, after):
+            # beacons come strongest first, none after a weak one passes the threshold
+            if min_rssi is not None and -sort_key[0] < min_rssi:
+                break
+            if limit is not None and len(beacons) == limit:
+                return beacons, last_sort_key
+            beacons.append(self._beacons[sort_key[1]])
+            last_sort_key = sort_key
+        return beacons, None
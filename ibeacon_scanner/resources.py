@@ -1,12 +1,89 @@
 #!/usr/bin/python
-from flask import request
+import gzip
+import json
+from threading import Lock, BoundedSemaphore
+
+from urllib.parse import urlsplit
+
+from flask import request, redirect, Response, send_from_directory
 from flask_restful import Resource
+from werkzeug.wsgi import ClosingIterator
 
-from config import config_write
+from config import config_write, EVENTS_STREAM_PORT
 from log import error, warn, info, debug
+from event.stream import EventHub, EVENTS_KEEPALIVE_INTERVAL, EVENTS_MAX_POLL_TIMEOUT, EVENTS_RETRY_AFTER, \
+    render_sse_event
 from ibeacon_scanner.services import *
 
 
+BEACONS_DATA_CACHE_CONTROL = "no-cache"
+BEACONS_DATA_GZIP_LEVEL = 6
+BEACONS_DATA_GZIP_ETAG_SUFFIX = "-gz"
+# without the events stream server, every event stream and long poll holds one of the uWSGI threads
+# and the rest answer every other endpoint
+EVENTS_MAX_WAITING_CLIENTS = 2
+
+
+class _EncodedBeaconsData:
+    """ Beacons data snapshot kept as ready to send JSON and gzip bytes """
+
+    def __init__(self, version, beacons_data_dict):
+        self.version = version
+        self.body = json.dumps(beacons_data_dict, separators=(',', ':')).encode()
+        self.gzip_body = gzip.compress(self.body, compresslevel=BEACONS_DATA_GZIP_LEVEL)
+
+
+_encoded_beacons_data = None
+_encoded_beacons_data_lock = Lock()
+_event_hub = EventHub()
+_event_clients = BoundedSemaphore(EVENTS_MAX_WAITING_CLIENTS)
+
+
+def _get_encoded_beacons_data():
+    """ Encodes beacons data only when its version changed since the last request """
+    global _encoded_beacons_data
+    version = ibeacon_get_beacons_data_version()
+    encoded_beacons_data = _encoded_beacons_data
+    if version and encoded_beacons_data and encoded_beacons_data.version == version:
+        return encoded_beacons_data
+    with _encoded_beacons_data_lock:
+        if version and _encoded_beacons_data and _encoded_beacons_data.version == version:
+            return _encoded_beacons_data
+        encoded_beacons_data = _EncodedBeaconsData(version, ibeacon_get_beacons_data())
+        if version:
+            _encoded_beacons_data = encoded_beacons_data
+    return encoded_beacons_data
+
+
+def _accepts_gzip():
+    """ True when Accept-Encoding gives gzip, by name or by '*', a quality above 0 """
+    qualities = {value.lower(): quality for value, quality in request.accept_encodings}
+    return qualities.get('gzip', qualities.get('*', 0)) > 0
+
+
+def _event_stream(since):
+    subscription = _event_hub.subscribe(since=since)
+    try:
+        while not subscription.lagged:
+            events = _event_hub.next_events(subscription, EVENTS_KEEPALIVE_INTERVAL)
+            if not events and not subscription.lagged:
+                yield ": keepalive\n\n"
+            for seq, event_json in events:
+                yield render_sse_event(seq, event_json)
+        debug("Closing events stream of a client that could not keep up")
+    finally:
+        _event_hub.unsubscribe(subscription)
+
+
+def _event_stream_server_url():
+    """ URL of this request at the events stream server, on the same host """
+    hostname = urlsplit(request.host_url).hostname
+    if ":" in hostname:
+        hostname = f"[{hostname}]"
+    query_string = request.query_string.decode()
+    return f"{request.scheme}://{hostname}:{EVENTS_STREAM_PORT}{request.path}{'?' if query_string else ''}{query_string}"
+
+
 class IBeaconScannerStartResource(Resource):
 
     def post(self):
@@ -40,7 +117,112 @@ class IBeaconScannerSettingsResource(Resource):
 class IBeaconScannerBeaconsDataResource(Resource):
 
     def get(self):
-        return ibeacon_get_beacons_data()
+        # queries are answered from the beacons index, the whole beacons data from its encoded snapshot,
+        # also when the query string only has parameters of its own like a cache buster
+        if any(parameter in request.args for parameter in BEACONS_QUERY_PARAMETERS):
+            return ibeacon_query_beacons_data(**request.args.to_dict())
+        encoded_beacons_data = _get_encoded_beacons_data()
+        headers = {
+            'Cache-Control': BEACONS_DATA_CACHE_CONTROL,
+            'Vary': 'Accept-Encoding',
+        }
+        body = encoded_beacons_data.body
+        if _accepts_gzip():
+            headers['Content-Encoding'] = 'gzip'
+            body = encoded_beacons_data.gzip_body
+        if encoded_beacons_data.version:
+            # each encoding is a different representation, so it has its own strong validator
+            etags = [encoded_beacons_data.version, f"{encoded_beacons_data.version}{BEACONS_DATA_GZIP_ETAG_SUFFIX}"]
+            headers['ETag'] = f'"{etags[1] if "Content-Encoding" in headers else etags[0]}"'
+            # a cache may revalidate with the validator of the other encoding, the data is the same
+            if any(request.if_none_match.contains_weak(etag) for etag in etags):
+                return Response(status=304, headers=headers)
+        # already encoded, the gzip middleware must not encode it again
+        return Response(body, mimetype='application/json', headers=headers, direct_passthrough=True)
+
+
+class IBeaconScannerPresenceResource(Resource):
+
+    def get(self):
+        return ibeacon_get_presence(**request.args.to_dict())
+
+
+class IBeaconScannerPositionsResource(Resource):
+
+    def get(self):
+        return ibeacon_get_positions(**request.args.to_dict())
+
+
+class IBeaconScannerEventsResource(Resource):
+
+    def get(self):
+        # the events stream server waits for events in coroutines instead of threads of this process
+        if EVENTS_STREAM_PORT:
+            return redirect(_event_stream_server_url(), code=307)
+        _event_hub.start()
+        # server-sent events stream, resumable with the standard Last-Event-ID header
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            if not _event_clients.acquire(blocking=False):
+                return {'message': "Too many event streams, use the long-poll without 'Accept: text/event-stream'"}, \
+                    503, {'Retry-After': str(EVENTS_RETRY_AFTER)}
+            since = request.headers.get('Last-Event-ID', request.args.get('since'))
+            since = int(since) if since and since.isdigit() else None
+            # the server closes the stream when the client leaves, even before it starts
+            stream = ClosingIterator(_event_stream(since), _event_clients.release)
+            response = Response(stream, mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no',
+            })
+            # streamed body must not be buffered by the gzip middleware
+            response.direct_passthrough = True
+            return response
+        # long-poll fallback, answered at once with the events already there while every waiting slot is taken
+        since = request.args.get('since', 0, type=int)
+        timeout = min(request.args.get('timeout', EVENTS_MAX_POLL_TIMEOUT, type=float), EVENTS_MAX_POLL_TIMEOUT)
+        waiting = _event_clients.acquire(blocking=False)
+        try:
+            last_seq, events = _event_hub.wait_events_since(since, max(timeout, 0) if waiting else 0)
+        finally:
+            if waiting:
+                _event_clients.release()
+        response = {
+            'last_seq': last_seq,
+            'events': [{'seq': seq, 'event': event_json} for seq, event_json in events],
+        }
+        return response if waiting else (response, 200, {'Retry-After': str(EVENTS_RETRY_AFTER)})
+
+
+class IBeaconScannerProfileResource(Resource):
+
+    def post(self):
+        profile_request = request.get_json(silent=True) or {}
+        kind = profile_request.get('kind', PROFILE_CPU)
+        duration = profile_request.get('duration', PROFILE_DURATION)
+        if not ibeacon_start_profile(kind, duration):
+            return {'message': "Scanner process is not running"}, 503
+        return {
+            'status': 'profiling',
+            'kind': kind,
+            'duration': duration,
+        }, 202
+
+
+class IBeaconScannerProfilesResource(Resource):
+
+    def get(self):
+        return ibeacon_get_profiles()
+
+
+class IBeaconScannerProfileFileResource(Resource):
+
+    def get(self, filename):
+        return send_from_directory(DIRECTORY_PROFILES, filename, as_attachment=True)
+
+
+class IBeaconScannerHistoryResource(Resource):
+
+    def get(self):
+        return ibeacon_get_history(**request.args.to_dict())
 
 
 def ibeacon_add_http_resources_to_api(flask_restful_api, prefix=""):
@@ -50,3 +232,10 @@ def ibeacon_add_http_resources_to_api(flask_restful_api, prefix=""):
     flask_restful_api.add_resource(IBeaconScannerStopResource, f'{prefix}/stop')
     flask_restful_api.add_resource(IBeaconScannerSettingsResource, f'{prefix}/settings')
     flask_restful_api.add_resource(IBeaconScannerBeaconsDataResource, f'{prefix}/beacons_data')
+    flask_restful_api.add_resource(IBeaconScannerPresenceResource, f'{prefix}/presence')
+    flask_restful_api.add_resource(IBeaconScannerPositionsResource, f'{prefix}/positions')
+    flask_restful_api.add_resource(IBeaconScannerEventsResource, f'{prefix}/events')
+    flask_restful_api.add_resource(IBeaconScannerHistoryResource, f'{prefix}/history')
+    flask_restful_api.add_resource(IBeaconScannerProfileResource, f'{prefix}/profile')
+    flask_restful_api.add_resource(IBeaconScannerProfilesResource, f'{prefix}/profiles')
+    flask_restful_api.add_resource(IBeaconScannerProfileFileResource, f'{prefix}/profiles/<string:filename>')
@@ -1,118 +1,690 @@
 #!/usr/bin/python
 import os
-import random
-import json
 import time
-from threading import Thread
-from multiprocessing import shared_memory
-
-from beacontools import BeaconScanner
-from beacontools import IBeaconFilter
-
-from persistance import read_local_cache_file, write_local_cache_file
-from event.services import publish_event
-from ibeacon_scanner.models import IBeacon
-from ibeacon_scanner.events import IBeaconChange, IBeaconRead
+import heapq
+import signal
+from datetime import datetime
+from functools import partial
+from threading import Thread, Lock
+
+from persistance import read_local_cache_file, write_local_cache_file, submit_local_cache_file, \
+    flush_local_cache_files
+from persistance.shared_memory import SharedBeaconsStore, SharedJsonStore, \
+    create_shared_store, get_shared_store, unlink_shared_stores
+from event.services import publish_event, event_stop_pipeline
+from collector.services import collector_create_uploader, collector_stop_uploader
+from metrics.services import metrics_register_counter, metrics_register_gauge, metrics_register_histogram, \
+    metrics_inc, metrics_set, metrics_observe, metrics_time
+from ibeacon_scanner.models import IBeacon, IBeaconTable, IBeaconWindow
+from ibeacon_scanner.backends import BluetoothBeaconScanner, RawHciBeaconScanner, FakeBeaconScanner, \
+    ReplayBeaconScanner, MultiAdapterBeaconScanner
+from ibeacon_scanner.capture import CaptureWriter
+from ibeacon_scanner.diff import IBeaconDiffEngine
+from ibeacon_scanner.smoothing import RssiSmoother
+from ibeacon_scanner.control import ControlChannel, send_control_message
+from ibeacon_scanner.presence import PresenceTracker
+from ibeacon_scanner.positioning import PositioningEngine, MIN_ANCHORS
+from ibeacon_scanner.prefilter import BeaconPrefilter, parse_filter_rules
+from ibeacon_scanner.query import BeaconsIndex, BEACON_FIELDS, encode_cursor, decode_cursor
+from ibeacon_scanner.history import BeaconHistoryStore, RESOLUTION_RAW, AGGREGATES, query_history
+from ibeacon_scanner.supervisor import ScannerSupervisor
+from ibeacon_scanner.profiling import PROFILE_CPU, PROFILE_MEMORY, PROFILE_KINDS, profile_cpu, trace_memory
 from log import error, warn, info, debug
-from config import config_write, lowercase_dict_keys
+from config import config_read, config_write, lowercase_dict_keys
 from config import MIN_SCAN_TICK, MAX_SCAN_TICK, RUN_FLAG, \
-    SCAN_TICK, UUID_FILTER, FAKE_SCAN, BEACONS_LIST_CAPACITY
+    SCAN_TICK, UUID_FILTER, FAKE_SCAN, BEACONS_LIST_CAPACITY, MAX_TRACKED_BEACONS, \
+    CONTINUOUS_SCAN, SCAN_WINDOW, SNAPSHOT_INTERVAL, MIN_SNAPSHOT_INTERVAL, STATE_BACKEND, \
+    RSSI_MOVE_THRESHOLD, NEAREST_HYSTERESIS, NEAREST_DWELL, RSSI_SMOOTHING, RSSI_SMOOTHING_SAMPLES, \
+    RSSI_EMA_ALPHA, RSSI_KALMAN_PROCESS_NOISE, RSSI_KALMAN_MEASUREMENT_NOISE, BT_DEVICE_IDS, \
+    SCAN_BACKEND, REPLAY_FILE, REPLAY_SPEED, CAPTURE_FILE, FAKE_BEACONS, FAKE_ADVERTISEMENT_RATE, \
+    FAKE_CHURN, FAKE_MOBILITY, FAKE_PACKET_LOSS, FAKE_SEED, PROFILE_DURATION, MAX_PROFILE_DURATION, \
+    PROFILE_SAMPLE_INTERVAL, HISTORY_FILE, HISTORY_RAW_RETENTION, HISTORY_MINUTE_RETENTION, HISTORY_HOUR_RETENTION, \
+    HISTORY_FLUSH_INTERVAL, HISTORY_QUEUE_SIZE, PRESENCE_GRACE_PERIOD, PRESENCE_RETENTION, \
+    SCANNER_POSITIONS, PATH_LOSS_EXPONENT, PATH_LOSS_RSSI_OFFSET, POSITIONING_MARGIN, POSITIONING_BUDGET, \
+    SCANNER_START_METHOD, SCANNER_HEARTBEAT_TIMEOUT, SCANNER_MAX_RESTART_BACKOFF
 
 
 FILEPATH_BEACONS_DATA = "/local/storage/ibeacon_data.json"
+FILEPATH_BEACONS_TABLE = "/local/storage/ibeacon_table.json"
 FILEPATH_SCANNER_SETTINGS = "/local/storage/ibeacon_scanner_settings.json"
+FILEPATH_SCANNER_SETTINGS_LOCK = "/local/storage/ibeacon_scanner_settings.lock"
+FILEPATH_PRESENCE_DATA = "/local/storage/ibeacon_presence.json"
+FILEPATH_POSITIONS_DATA = "/local/storage/ibeacon_positions.json"
+FILEPATH_CONTROL_SOCKET = "/local/storage/ibeacon_scanner.sock"
+FILEPATH_SCANNER_LOCK = "/local/storage/ibeacon_scanner.lock"
+DIRECTORY_PROFILES = "/local/storage/profiles"
+MAX_PROFILE_FILES = 20
+MAX_HISTORY_LIMIT = 10000
+MAX_BEACONS_QUERY_LIMIT = 1000
+BEACONS_QUERY_PARAMETERS = ('mac_address', 'uuid', 'major', 'minor', 'min_rssi', 'limit', 'fields', 'cursor')
+BEACONS_DATA_SHM = "ibeacon_data"
+# every beacon tracked by the scanner, beacons data only holds the BEACONS_LIST_CAPACITY strongest
+BEACONS_TABLE_SHM = "ibeacon_table"
+SCANNER_SETTINGS_SHM = "ibeacon_scanner_settings"
+SCANNER_SETTINGS_SHM_CAPACITY = 65536
+# keeps the settings within the control channel datagrams and the settings store
+MAX_UUID_FILTER_RULES = 256
+PRESENCE_DATA_SHM = "ibeacon_presence"
+PRESENCE_DATA_SHM_CAPACITY = 4 * 1024 * 1024
+POSITIONS_DATA_SHM = "ibeacon_positions"
+POSITIONS_DATA_SHM_CAPACITY = 4 * 1024 * 1024
+# seconds between two publications of the presence and positions of the beacons
+PUBLISH_INTERVAL = 1.0
+# seconds between two heartbeats of a stopped scanner, a running one beats every cycle
+HEARTBEAT_INTERVAL = 5
+SCAN_CYCLE_BUCKETS = (0.1, 0.25, 0.5, 0.75, 1, 2.5, 5, 7.5, 10, 15, 20, 30)
+
+metrics_register_histogram(
+    "ibeacon_scan_cycle_seconds", "Duration of each scanner loop cycle, scan included", SCAN_CYCLE_BUCKETS)
+metrics_register_counter(
+    "ibeacon_scan_cycle_overrun_seconds_total",
+    "Time the processing of the scans lasted beyond their scan tick or snapshot interval, the scan itself excluded")
+metrics_register_histogram("ibeacon_scan_stage_seconds", "Duration of each processing stage of a scanner loop cycle")
+metrics_register_gauge("ibeacon_scan_beacons", "Unique beacons seen in the last scanner loop cycle")
+metrics_register_counter("ibeacon_advertisements_received_total", "Advertisements received by the scanner loop, by adapter")
+metrics_register_counter("ibeacon_advertisements_dropped_total", "Advertisements discarded by the scanner backends")
+metrics_register_counter(
+    "ibeacon_beacons_overflow_total", "Readings left out of the scanner tables because MAX_TRACKED_BEACONS stronger beacons were kept")
+metrics_register_counter(
+    "ibeacon_advertisements_filtered_total", "Advertisements rejected by the uuid_filter rules before building any beacon")
+metrics_register_counter(
+    "ibeacon_positioning_skipped_total", "Beacons left with their previous position because the positioning budget was spent")
+
+
+# supervisor of the scanner process started by this process, if any
+_scanner_supervisor = None
+# beacons table of the last version read by this process, indexed for queries
+_beacons_index = BeaconsIndex()
+_beacons_index_lock = Lock()
+
+
+def _create_shared_stores():
+    create_shared_store(
+        SharedJsonStore,
+        SCANNER_SETTINGS_SHM,
+        SCANNER_SETTINGS_SHM_CAPACITY,
+        lock_filepath=FILEPATH_SCANNER_SETTINGS_LOCK,
+    )
+    create_shared_store(SharedBeaconsStore, BEACONS_DATA_SHM, BEACONS_LIST_CAPACITY)
+    create_shared_store(SharedBeaconsStore, BEACONS_TABLE_SHM, MAX_TRACKED_BEACONS)
+    create_shared_store(SharedJsonStore, PRESENCE_DATA_SHM, PRESENCE_DATA_SHM_CAPACITY)
+    create_shared_store(SharedJsonStore, POSITIONS_DATA_SHM, POSITIONS_DATA_SHM_CAPACITY)
+
+
+def _get_shared_store(store_class, name, **kwargs):
+    shared_store = get_shared_store(store_class, name, **kwargs)
+    if not shared_store:
+        warn(f"Shared memory store '{name}' is not created yet")
+    return shared_store
+
+
+def _write_beacons_store(shm_name, filepath, beacons_data_dict):
+    if STATE_BACKEND == "shared_memory":
+        beacons_store = _get_shared_store(SharedBeaconsStore, shm_name)
+        if beacons_store:
+            beacons_store.write_beacons_data(beacons_data_dict)
+        return
+    # written in the background, the scanner keeps the beacons in memory
+    submit_local_cache_file(filepath=filepath, data_dict=beacons_data_dict)
 
 
-def _get_last_beacon_list():
-    """ Obtains the last list reading it from cache file or any other method. """
-    last_beacons_data = read_local_cache_file(filepath=FILEPATH_BEACONS_DATA)
-    last_beacons_list = last_beacons_data["beacons_list"]
-    return [IBeacon(**beacon_data) for beacon_data in last_beacons_list] \
-        if last_beacons_list else []
+def _write_beacons_data(beacons_data_dict):
+    _write_beacons_store(BEACONS_DATA_SHM, FILEPATH_BEACONS_DATA, beacons_data_dict)
 
 
-def _render_beacons_data(beacons_list):
+def _write_beacons_table(beacons_list):
+    _write_beacons_store(BEACONS_TABLE_SHM, FILEPATH_BEACONS_TABLE, {'beacons_list': [b.to_json() for b in beacons_list]})
+
+
+def _write_scanner_settings(scanner_settings_dict):
+    if STATE_BACKEND == "shared_memory":
+        settings_store = _get_shared_store(
+            SharedJsonStore, SCANNER_SETTINGS_SHM, lock_filepath=FILEPATH_SCANNER_SETTINGS_LOCK)
+        if settings_store:
+            settings_store.write_dict(scanner_settings_dict)
+        return
+    write_local_cache_file(filepath=FILEPATH_SCANNER_SETTINGS, data_dict=scanner_settings_dict)
+
+
+def _write_published_data(shm_name, filepath, data_dict):
+    if STATE_BACKEND == "shared_memory":
+        published_store = _get_shared_store(SharedJsonStore, shm_name)
+        if published_store:
+            try:
+                published_store.write_dict(data_dict)
+            except ValueError as e:
+                warn(f"Impossible to publish '{shm_name}': {e}")
+        return
+    submit_local_cache_file(filepath=filepath, data_dict=data_dict)
+
+
+def _read_published_data(shm_name, filepath):
+    if STATE_BACKEND == "shared_memory":
+        published_store = _get_shared_store(SharedJsonStore, shm_name)
+        data_dict = published_store.read_dict() if published_store else None
+        if data_dict is None:
+            warn(f"Impossible to read shared memory store '{shm_name}'")
+            return {}
+        return data_dict
+    return read_local_cache_file(filepath=filepath)
+
+
+def _filter_beacons_json(beacons_json_list, **kwargs):
+    """ Keeps the beacons matching the mac_address, major and minor given, compared as query string values """
+    for field in ('mac_address', 'major', 'minor'):
+        if kwargs.get(field) is not None:
+            value = kwargs[field] if field == 'mac_address' else int(kwargs[field])
+            beacons_json_list = [beacon_json for beacon_json in beacons_json_list if beacon_json[field] == value]
+    return beacons_json_list
+
+
+def _render_beacons_data(beacons_list, nearest_beacon):
+    # the nearest beacon is the one the diff engine settled on, not the strongest of this cycle
     return {
-        'nearest_beacon' : vars(beacons_list[0]) if beacons_list else None,
-        'beacons_list' : [vars(b) for b in beacons_list] if beacons_list else [],
+        'nearest_beacon' : nearest_beacon.to_json() if nearest_beacon else None,
+        'beacons_list' : [b.to_json() for b in beacons_list] if beacons_list else [],
     }
 
 
-def _scan_beacons(**kwargs):
-    beacons_list = []
-    # read beaconstools callback
-    def _scans_callback(bt_addr, rssi, packet, additional_info):
-        beacon = IBeacon(bt_addr, packet.uuid, packet.major, packet.minor, packet.tx_power, rssi)
-        if beacon not in beacons_list:
-            beacons_list.append(beacon)
-    # create and start scanner in each cycle
-    beaconstools_scanner = BeaconScanner(
-        _scans_callback, 
-        device_filter=IBeaconFilter(uuid=kwargs['uuid_filter'])
-    )
-    beaconstools_scanner.start()
-    time.sleep(kwargs['scan_tick'])
-    beaconstools_scanner.stop()
+def _create_scanner_backend(callback, capture_writer=None, **kwargs):
+    """ Builds a backend replaying a capture, or scanning with every configured HCI device or faking each one """
+    # a replay is never captured, the capture would get its own advertisements again
+    if kwargs['replay_file']:
+        return ReplayBeaconScanner(
+            callback, kwargs['replay_file'], uuid_filter=kwargs['uuid_filter'], speed=kwargs['replay_speed'])
+    raw_hci = SCAN_BACKEND == "raw_hci" and not kwargs['fake_scan']
+    if capture_writer and not raw_hci:
+        # captures every advertisement before it reaches the scanner, as the HCI report it was decoded from
+        scans_callback = callback
+        def callback(*advertisement):
+            capture_writer.write_advertisement(*advertisement)
+            scans_callback(*advertisement)
+    bt_device_ids = {
+        f"hci{bt_device_id}": int(bt_device_id)
+        for bt_device_id in str(BT_DEVICE_IDS).replace(" ", "").split(",") if bt_device_id
+    }
+    def _backend_factory(adapter_callback, adapter_id):
+        if kwargs['fake_scan']:
+            # each fake adapter simulates the same beacons, with its own noise and losses
+            return FakeBeaconScanner(
+                adapter_callback,
+                uuid_filter=kwargs['uuid_filter'],
+                beacons=FAKE_BEACONS,
+                advertisement_rate=FAKE_ADVERTISEMENT_RATE,
+                churn=FAKE_CHURN,
+                mobility=FAKE_MOBILITY,
+                packet_loss=FAKE_PACKET_LOSS,
+                seed=None if FAKE_SEED is None else FAKE_SEED + bt_device_ids[adapter_id],
+            )
+        if raw_hci:
+            # the HCI events are captured as they were received
+            return RawHciBeaconScanner(
+                adapter_callback, uuid_filter=kwargs['uuid_filter'], bt_device_id=bt_device_ids[adapter_id],
+                capture=partial(capture_writer.write, adapter_id) if capture_writer else None)
+        return BluetoothBeaconScanner(
+            adapter_callback, uuid_filter=kwargs['uuid_filter'], bt_device_id=bt_device_ids[adapter_id])
+    return MultiAdapterBeaconScanner(callback, _backend_factory, bt_device_ids)
+
+
+def _backend_uuid_filter(beacon_prefilter, fake_scan):
+    """ UUID the backends can reject advertisements on by themselves, if the rules accept a single one """
+    uuids = beacon_prefilter.uuids
+    # fake backends simulate beacons of the first UUID accepted
+    if not uuids or (len(uuids) > 1 and not fake_scan):
+        return None
+    return uuids[0]
+
+
+def _record_advertisements(received, dropped):
+    for adapter, advertisements in received.items():
+        metrics_inc("ibeacon_advertisements_received_total", advertisements, adapter=adapter)
+    if dropped:
+        metrics_inc("ibeacon_advertisements_dropped_total", dropped)
+
+
+def _create_tick_scan(beacon_prefilter, capture_writer=None, **kwargs):
+    """ Builds the backend of the scans by tick, it adds what it hears to the beacons table of the running tick """
+    tick_scan = {'beacons_table': None, 'reported_dropped': 0}
+    # read scanner backend callback
+    def _scans_callback(adapter, mac_address, uuid, major, minor, tx_power, rssi):
+        if not beacon_prefilter.match(uuid, major, minor):
+            return
+        tick_scan['beacons_table'].add(IBeacon(mac_address, uuid, major, minor, tx_power, rssi, adapter))
+    tick_scan['scanner_backend'] = _create_scanner_backend(_scans_callback, capture_writer, **kwargs)
+    return tick_scan
+
+
+def _tick_scan_reusable(**kwargs):
+    """ True if the backend can be restarted each tick, the HCI backends threads only start once """
+    return bool(kwargs['replay_file'] or kwargs['fake_scan'])
+
+
+def _scan_beacons(control_channel, tick_scan, rssi_smoother=None, **kwargs):
+    beacons_table = tick_scan['beacons_table'] = IBeaconTable(keep_strongest=True, capacity=MAX_TRACKED_BEACONS)
+    scanner_backend = tick_scan['scanner_backend']
+    scanner_backend.start()
+    # scans during a whole tick unless a control message ends it before
+    control_channel.wait(kwargs['scan_tick'])
+    scanner_backend.stop()
+    # a reused backend keeps counting the advertisements it dropped
+    dropped = getattr(scanner_backend, 'dropped', 0)
+    _record_advertisements(beacons_table.take_received(), dropped - tick_scan['reported_dropped'])
+    tick_scan['reported_dropped'] = dropped
+    if beacons_table.overflow:
+        metrics_inc("ibeacon_beacons_overflow_total", beacons_table.overflow)
     # return beacon_list
+    with metrics_time("ibeacon_scan_stage_seconds", stage="dedup"):
+        beacons_list = beacons_table.beacons()
+    # scans by tick give a single sample per beacon and tick
+    if rssi_smoother is not None:
+        for beacon in beacons_list:
+            rssi_smoother.add(beacon)
     return beacons_list
 
 
-def _scan_beacons_fake(**kwargs):
-    beacons_list = []
-    beacons_list.append(IBeacon("11:11:11", UUID_FILTER, 11, 1, -50, random.randint(1, 100) * -1))
-    beacons_list.append(IBeacon("22:22:22", UUID_FILTER, 11, 2, -50, random.randint(1, 100) * -1))
-    beacons_list.append(IBeacon("33:33:33", UUID_FILTER, 11, 3, -50, random.randint(1, 100) * -1))
-    time.sleep(kwargs['scan_tick'])
-    return beacons_list
+def _start_continuous_scan(rssi_smoother, beacon_prefilter, capture_writer=None, **kwargs):
+    """ Starts a long-lived scanner backend that feeds a time-windowed beacons table """
+    beacons_window = IBeaconWindow(window=kwargs['scan_window'], capacity=MAX_TRACKED_BEACONS)
+    # read scanner backend callback, every advertisement of a beacon kept is a sample for the smoother
+    def _scans_callback(adapter, mac_address, uuid, major, minor, tx_power, rssi):
+        if not beacon_prefilter.match(uuid, major, minor):
+            return
+        beacon = IBeacon(mac_address, uuid, major, minor, tx_power, rssi, adapter)
+        if beacons_window.add(beacon) and rssi_smoother is not None:
+            rssi_smoother.add(beacon)
+    scanner_backend = _create_scanner_backend(_scans_callback, capture_writer, **kwargs)
+    scanner_backend.start()
+    if kwargs['replay_file']:
+        info(f"Started continuous iBeacon scan replaying '{kwargs['replay_file']}'")
+    else:
+        info(f"Started continuous iBeacon scan with adapters: {', '.join(scanner_backend.adapter_ids)}")
+    return scanner_backend, beacons_window
+
+
+def _stop_continuous_scan(scanner_backend):
+    scanner_backend.stop()
+    info("Stopped continuous iBeacon scan")
+
+
+def _create_rssi_smoother():
+    if RSSI_SMOOTHING == "none":
+        return None
+    return RssiSmoother(
+        method=RSSI_SMOOTHING,
+        samples=RSSI_SMOOTHING_SAMPLES,
+        ema_alpha=RSSI_EMA_ALPHA,
+        kalman_process_noise=RSSI_KALMAN_PROCESS_NOISE,
+        kalman_measurement_noise=RSSI_KALMAN_MEASUREMENT_NOISE,
+    )
+
+
+def _create_history_store():
+    if not HISTORY_FILE:
+        return None
+    history_store = BeaconHistoryStore(
+        HISTORY_FILE,
+        raw_retention=HISTORY_RAW_RETENTION,
+        minute_retention=HISTORY_MINUTE_RETENTION,
+        hour_retention=HISTORY_HOUR_RETENTION,
+        flush_interval=HISTORY_FLUSH_INTERVAL,
+        queue_size=HISTORY_QUEUE_SIZE,
+    )
+    history_store.start()
+    return history_store
+
+
+def _create_positioning_engine():
+    # no beacon can be located with less than three scanners at known coordinates
+    if len(SCANNER_POSITIONS) < MIN_ANCHORS:
+        return None
+    return PositioningEngine(
+        # settings keys are uppercased when loaded, adapters and coordinates are lowercase
+        lowercase_dict_keys(SCANNER_POSITIONS),
+        path_loss_exponent=PATH_LOSS_EXPONENT,
+        rssi_offset=PATH_LOSS_RSSI_OFFSET,
+        margin=POSITIONING_MARGIN,
+        budget=POSITIONING_BUDGET,
+    )
+
 
+# wall clock time of the last publication of each data by the scanner loop, by shared memory name
+_published_at = {}
 
-def _is_nearest_beacon_changes(last_beacons_list, new_beacons_list):
-    if not last_beacons_list and not new_beacons_list:
+
+def _publish_due(shm_name, now):
+    """ True once per PUBLISH_INTERVAL for each published data """
+    if now - _published_at.get(shm_name, 0) < PUBLISH_INTERVAL:
         return False
-    if not last_beacons_list or not new_beacons_list:
-        return True
-    if last_beacons_list[0].hash() != new_beacons_list[0].hash():
-        return True
-    return False
-
-
-def _run_scanner_loop():
-    while 1:
-        scanner_settings = read_local_cache_file(filepath=FILEPATH_SCANNER_SETTINGS)
-        if scanner_settings['run_flag']:
-            # performs ibeacon scanning
-            if scanner_settings['fake_scan']:
-                current_beacons_list = _scan_beacons_fake(**scanner_settings)
-            else:
-                current_beacons_list = _scan_beacons(**scanner_settings)
-            # accomodate data for this new cycle
-            current_beacons_list = sorted(current_beacons_list)
-            last_beacons_list = sorted(_get_last_beacon_list())
-            beacons_data_dict = _render_beacons_data(current_beacons_list)
-            # compare new beacons list against last list and performs actions
-            if _is_nearest_beacon_changes(last_beacons_list, current_beacons_list):
-                debug("Nearest beacon has changed")
-                nearest_beacon_data = beacons_data_dict["nearest_beacon"]
-                publish_event(IBeaconChange(nearest_beacon_data))
-            # updates global system beacon data
-            if current_beacons_list and current_beacons_list != last_beacons_list:
-                publish_event(IBeaconRead(beacons_data_dict))
-            write_local_cache_file(filepath=FILEPATH_BEACONS_DATA, data_dict=beacons_data_dict)
-
-
-def ibeacon_init_scanner():
-    info("Initializing iBeacon Scanner")
+    _published_at[shm_name] = now
+    return True
+
+
+def _publish_presence(presence_tracker):
+    now = time.time()
+    if not _publish_due(PRESENCE_DATA_SHM, now):
+        return
+    _write_published_data(PRESENCE_DATA_SHM, FILEPATH_PRESENCE_DATA, {
+        'updated_at': now,
+        'grace_period': presence_tracker.grace_period,
+        'presence': presence_tracker.snapshot(now),
+    })
+
+
+def _publish_positions(positioning_engine):
+    now = time.time()
+    if not _publish_due(POSITIONS_DATA_SHM, now):
+        return
+    _write_published_data(POSITIONS_DATA_SHM, FILEPATH_POSITIONS_DATA, {
+        'updated_at': now,
+        'scanners': positioning_engine.scanner_positions,
+        'positions': positioning_engine.snapshot(),
+    })
+
+
+def _process_beacons_list(current_beacons_list, diff_engine, rssi_smoother=None, history_store=None,
+        presence_tracker=None, positioning_engine=None, report_uploader=None):
+    metrics_set("ibeacon_scan_beacons", len(current_beacons_list))
+    # accomodate data for this new cycle, ordered by filtered RSSI
+    if rssi_smoother is not None:
+        with metrics_time("ibeacon_scan_stage_seconds", stage="smoothing"):
+            current_beacons_list = rssi_smoother.smooth(current_beacons_list)
+    # only the strongest beacons are published and reported in events, every other stage takes them all
+    with metrics_time("ibeacon_scan_stage_seconds", stage="sort"):
+        published_beacons_list = heapq.nsmallest(BEACONS_LIST_CAPACITY, current_beacons_list)
+    # the report of the cycle is only queued, it is uploaded to the collector in the background
+    if report_uploader:
+        with metrics_time("ibeacon_scan_stage_seconds", stage="upload"):
+            report_uploader.submit(current_beacons_list)
+    # the history store only queues the readings, they are written in the background
+    if history_store:
+        with metrics_time("ibeacon_scan_stage_seconds", stage="history"):
+            history_store.append(current_beacons_list)
+    # one lookup per beacon, the presence of every beacon is only rendered when published
+    if presence_tracker:
+        with metrics_time("ibeacon_scan_stage_seconds", stage="presence"):
+            presence_tracker.update(current_beacons_list)
+            _publish_presence(presence_tracker)
+    # beacons that do not fit in the positioning budget keep their last position until the next cycle
+    if positioning_engine:
+        with metrics_time("ibeacon_scan_stage_seconds", stage="positioning"):
+            positioning_engine.update(current_beacons_list)
+            metrics_inc("ibeacon_positioning_skipped_total", positioning_engine.skipped)
+            _publish_positions(positioning_engine)
+    # publishes only what changed since the last reported state
+    with metrics_time("ibeacon_scan_stage_seconds", stage="diff"):
+        for event in diff_engine.update(published_beacons_list):
+            publish_event(event)
+    # updates global system beacon data, and the table of every beacon the queries are answered from
+    with metrics_time("ibeacon_scan_stage_seconds", stage="write"):
+        _write_beacons_data(_render_beacons_data(published_beacons_list, diff_engine.nearest))
+        _write_beacons_table(current_beacons_list)
+
+
+def _open_capture_writer(capture_filepath):
+    if not capture_filepath:
+        return None
+    try:
+        return CaptureWriter(capture_filepath)
+    except (OSError, ValueError) as e:
+        error(f"Impossible to capture advertisements to '{capture_filepath}': {e}")
+        return None
+
+
+# kinds of profile running in the scanner process, at most one of each
+_running_profiles = set()
+
+
+def _remove_old_profiles():
+    profile_filepaths = sorted(
+        (entry.path for entry in os.scandir(DIRECTORY_PROFILES) if entry.is_file()),
+        key=os.path.getmtime, reverse=True)
+    for filepath in profile_filepaths[MAX_PROFILE_FILES:]:
+        os.remove(filepath)
+
+
+def _run_profile(kind, duration):
+    try:
+        if kind == PROFILE_CPU:
+            filepaths = profile_cpu(DIRECTORY_PROFILES, duration, PROFILE_SAMPLE_INTERVAL)
+        else:
+            filepaths = trace_memory(DIRECTORY_PROFILES, duration)
+        info(f"Wrote scanner {kind} profile to {', '.join(filepaths)}")
+        _remove_old_profiles()
+    except OSError as e:
+        error(f"Impossible to write scanner {kind} profile: {e}")
+    finally:
+        _running_profiles.discard(kind)
+
+
+def _start_profile(kind, duration):
+    """ Profiles the scanner process in the background, nothing is traced while no profile runs """
+    if kind not in PROFILE_KINDS:
+        warn(f"Unknown profile kind '{kind}'")
+        return
+    if kind in _running_profiles:
+        warn(f"A scanner {kind} profile is already running")
+        return
+    _running_profiles.add(kind)
+    info(f"Profiling scanner {kind} during {duration}s")
+    Thread(name=f"{kind}_profile", target=_run_profile, args=(kind, duration), daemon=True).start()
+
+
+def _handle_profile_signals():
+    # the handlers only push a message, the profile starts from the scanner loop
+    def _signal_handler(signum, frame):
+        kind = PROFILE_CPU if signum == signal.SIGUSR1 else PROFILE_MEMORY
+        send_control_message(FILEPATH_CONTROL_SOCKET, {'type': 'profile', 'kind': kind, 'duration': PROFILE_DURATION})
+    signal.signal(signal.SIGUSR1, _signal_handler)
+    signal.signal(signal.SIGUSR2, _signal_handler)
+
+
+def _apply_control_message(scanner_settings, message):
+    if message.get('type') == 'settings':
+        debug("Applying scanner settings pushed through control channel")
+        return message['settings']
+    if message.get('type') == 'profile':
+        _start_profile(message.get('kind'), min(message.get('duration', PROFILE_DURATION), MAX_PROFILE_DURATION))
+        return scanner_settings
+    warn(f"Unknown scanner control message type '{message.get('type')}'")
+    return scanner_settings
+
+
+def _run_scanner_loop(heartbeat=None):
+    control_channel = ControlChannel(FILEPATH_CONTROL_SOCKET)
+    _handle_profile_signals()
+    scanner_settings = ibeacon_get_scanner_settings()
+    # rules are compiled once per change and checked in the backend callbacks
+    beacon_prefilter = BeaconPrefilter()
+    uuid_filter = None
+    reported_filtered = 0
+    diff_engine = IBeaconDiffEngine(
+        rssi_threshold=RSSI_MOVE_THRESHOLD,
+        nearest_hysteresis=NEAREST_HYSTERESIS,
+        nearest_dwell=NEAREST_DWELL,
+    )
+    rssi_smoother = _create_rssi_smoother()
+    history_store = _create_history_store()
+    report_uploader = collector_create_uploader()
+    presence_tracker = PresenceTracker(grace_period=PRESENCE_GRACE_PERIOD, retention=PRESENCE_RETENTION)
+    positioning_engine = _create_positioning_engine()
+    # continuous scan state, kept while the backend settings do not change
+    scanner_backend, beacons_window, backend_settings = None, None, None
+    # advertisements the continuous scanner backend dropped and beacons its window left out up to the last cycle
+    reported_dropped, reported_overflow = 0, 0
+    # scan by tick state, the backend is kept across ticks while the backend settings do not change
+    tick_scan, tick_scan_settings = None, None
+    capture_writer = None
+    try:
+        while 1:
+            if heartbeat:
+                heartbeat.beat()
+            # applies pushed settings, waiting for one while the scanner is stopped
+            receive_timeout = 0 if scanner_settings['run_flag'] else HEARTBEAT_INTERVAL
+            for message in control_channel.receive(timeout=receive_timeout):
+                scanner_settings = _apply_control_message(scanner_settings, message)
+            cycle_started_at = time.perf_counter()
+            continuous_scan = scanner_settings['run_flag'] and scanner_settings['continuous_scan']
+            if scanner_settings['uuid_filter'] != uuid_filter:
+                uuid_filter = scanner_settings['uuid_filter']
+                try:
+                    beacon_prefilter.update(uuid_filter)
+                except ValueError as e:
+                    warn(f"Keeping previous 'uuid_filter', {e}")
+            # new rules only rebuild the backends if they change the UUID the backends filter by
+            backend_scanner_settings = dict(
+                scanner_settings, uuid_filter=_backend_uuid_filter(beacon_prefilter, scanner_settings['fake_scan']))
+            current_backend_settings = tuple(backend_scanner_settings[setting] for setting in (
+                'uuid_filter', 'fake_scan', 'replay_file', 'replay_speed', 'capture_file'))
+            # stops the long-lived scanner when it is not needed anymore or must be rebuilt
+            if scanner_backend and (not continuous_scan or current_backend_settings != backend_settings):
+                _stop_continuous_scan(scanner_backend)
+                scanner_backend, beacons_window, backend_settings = None, None, None
+            if tick_scan and (continuous_scan or current_backend_settings != tick_scan_settings):
+                tick_scan, tick_scan_settings = None, None
+            # no backend is running at this point if the capture file changed, or a replay started or ended
+            capture_filepath = "" if scanner_settings['replay_file'] else scanner_settings['capture_file']
+            if (capture_writer.filepath if capture_writer else "") != capture_filepath:
+                if capture_writer:
+                    capture_writer.close()
+                capture_writer = _open_capture_writer(capture_filepath)
+            if scanner_settings['run_flag']:
+                # performs ibeacon scanning
+                if continuous_scan:
+                    if not scanner_backend:
+                        scanner_backend, beacons_window = _start_continuous_scan(
+                            rssi_smoother, beacon_prefilter, capture_writer, **backend_scanner_settings)
+                        backend_settings = current_backend_settings
+                        reported_dropped, reported_overflow = 0, 0
+                    beacons_window.window = scanner_settings['scan_window']
+                    control_channel.wait(scanner_settings['snapshot_interval'])
+                    processing_started_at = time.perf_counter()
+                    dropped = scanner_backend.dropped
+                    _record_advertisements(beacons_window.take_received(), dropped - reported_dropped)
+                    reported_dropped = dropped
+                    overflow = beacons_window.overflow
+                    if overflow > reported_overflow:
+                        metrics_inc("ibeacon_beacons_overflow_total", overflow - reported_overflow)
+                    reported_overflow = overflow
+                    with metrics_time("ibeacon_scan_stage_seconds", stage="dedup"):
+                        current_beacons_list = beacons_window.snapshot()
+                else:
+                    if not tick_scan or not _tick_scan_reusable(**backend_scanner_settings):
+                        tick_scan = _create_tick_scan(beacon_prefilter, capture_writer, **backend_scanner_settings)
+                        tick_scan_settings = current_backend_settings
+                    current_beacons_list = _scan_beacons(
+                        control_channel, tick_scan, rssi_smoother, **backend_scanner_settings)
+                    processing_started_at = time.perf_counter()
+                filtered = beacon_prefilter.rejected
+                if filtered > reported_filtered:
+                    metrics_inc("ibeacon_advertisements_filtered_total", filtered - reported_filtered)
+                reported_filtered = filtered
+                # the capture only loses what was buffered since the last cycle if the scanner is killed
+                if capture_writer:
+                    capture_writer.flush()
+                _process_beacons_list(
+                    current_beacons_list, diff_engine, rssi_smoother, history_store, presence_tracker, positioning_engine,
+                    report_uploader)
+                if heartbeat:
+                    heartbeat.beat(scanned=True)
+                processed_at = time.perf_counter()
+                metrics_observe("ibeacon_scan_cycle_seconds", processed_at - cycle_started_at)
+                # the scan lasts its whole tick or interval by itself, what comes after it delays the next one
+                processing_duration = processed_at - processing_started_at
+                cycle_period = scanner_settings['snapshot_interval'] if continuous_scan else scanner_settings['scan_tick']
+                if processing_duration > cycle_period:
+                    metrics_inc("ibeacon_scan_cycle_overrun_seconds_total", processing_duration - cycle_period)
+    finally:
+        # the scanner process leaves without exit handlers, everything it holds is released here
+        if scanner_backend:
+            _stop_continuous_scan(scanner_backend)
+        if capture_writer:
+            capture_writer.close()
+        if history_store:
+            history_store.stop()
+        if report_uploader:
+            collector_stop_uploader(report_uploader)
+        control_channel.close()
+
+
+def _read_previous_scanner_settings():
+    """ Settings left by the previous scanner of this host in the settings store, or None """
+    if STATE_BACKEND != "shared_memory":
+        return read_local_cache_file(filepath=FILEPATH_SCANNER_SETTINGS) or None
+    try:
+        settings_store = SharedJsonStore.attach(SCANNER_SETTINGS_SHM, lock_filepath=FILEPATH_SCANNER_SETTINGS_LOCK)
+    except FileNotFoundError:
+        return None
+    try:
+        return settings_store.read_dict()
+    finally:
+        settings_store.close()
+
+
+def _load_scanner_settings():
+    """ Settings the scanner starts with, the ones changed at runtime survive a restart of the scanner
+
+    Each setting is taken from the settings store of the previous scanner, else from the
+    settings file, where every change is persisted, else from the settings loaded at startup.
+    """
     scanner_settings_dict = {
         'uuid_filter': UUID_FILTER,
         'scan_tick': SCAN_TICK,
         'run_flag': RUN_FLAG,
         'fake_scan': FAKE_SCAN,
+        'continuous_scan': CONTINUOUS_SCAN,
+        'scan_window': SCAN_WINDOW,
+        'snapshot_interval': SNAPSHOT_INTERVAL,
+        'replay_file': REPLAY_FILE,
+        'replay_speed': REPLAY_SPEED,
+        'capture_file': CAPTURE_FILE,
     }
-    write_local_cache_file(filepath=FILEPATH_SCANNER_SETTINGS, data_dict=scanner_settings_dict)
-    initial_beacons_list = [IBeacon("","",0,0,0,0) for _ in range(BEACONS_LIST_CAPACITY)]
-    initial_beacons_data_dict = _render_beacons_data(initial_beacons_list)
-    write_local_cache_file(filepath=FILEPATH_BEACONS_DATA, data_dict=initial_beacons_data_dict)
-    _run_scanner_loop()
+    try:
+        persisted_settings = lowercase_dict_keys(config_read())
+    except (OSError, ValueError) as e:
+        warn(f"Impossible to read persisted scanner settings: {e}")
+        persisted_settings = {}
+    for settings_source in (persisted_settings, _read_previous_scanner_settings() or {}):
+        scanner_settings_dict.update(
+            (setting, value) for setting, value in settings_source.items() if setting in scanner_settings_dict)
+    return scanner_settings_dict
+
+
+def ibeacon_init_scanner(heartbeat=None):
+    info("Initializing iBeacon Scanner")
+    # read before the stores of a previous scanner are replaced
+    scanner_settings_dict = _load_scanner_settings()
+    try:
+        if STATE_BACKEND == "shared_memory":
+            _create_shared_stores()
+        _write_scanner_settings(scanner_settings_dict)
+        # no beacon was read yet
+        _write_beacons_data(_render_beacons_data([], None))
+        _write_beacons_table([])
+        _run_scanner_loop(heartbeat)
+    finally:
+        # a supervised scanner leaves with os._exit, exit handlers do not release this
+        event_stop_pipeline()
+        flush_local_cache_files()
+        unlink_shared_stores()
+
+
+def ibeacon_create_supervisor():
+    """ Supervisor that keeps a single scanner process running on this host """
+    global _scanner_supervisor
+    _scanner_supervisor = ScannerSupervisor(
+        ibeacon_init_scanner,
+        FILEPATH_SCANNER_LOCK,
+        start_method=SCANNER_START_METHOD,
+        # a scan by tick does not beat until its tick ends
+        heartbeat_timeout=max(SCANNER_HEARTBEAT_TIMEOUT, 2 * MAX_SCAN_TICK),
+        max_backoff=SCANNER_MAX_RESTART_BACKOFF,
+    )
+    return _scanner_supervisor
+
+
+def ibeacon_get_supervisor_status():
+    """ Returns the state of the scanner supervised by this process, or None if it supervises none """
+    return _scanner_supervisor.status() if _scanner_supervisor else None
 
 
 def ibeacon_start_scanner():
@@ -125,21 +697,132 @@ def ibeacon_stop_scanner():
     ibeacon_set_scanner_settings(run_flag=False)
 
 
+def _read_beacons_store(shm_name, filepath):
+    if STATE_BACKEND == "shared_memory":
+        beacons_store = _get_shared_store(SharedBeaconsStore, shm_name)
+        beacons_data_dict = beacons_store.read_beacons_data() if beacons_store else None
+        if beacons_data_dict is None:
+            warn(f"Impossible to read shared memory store '{shm_name}'")
+            return {}
+        return beacons_data_dict
+    return read_local_cache_file(filepath=filepath)
+
+
+def _get_beacons_store_version(shm_name, filepath):
+    if STATE_BACKEND == "shared_memory":
+        beacons_store = _get_shared_store(SharedBeaconsStore, shm_name)
+        beacons_data_version = beacons_store.version() if beacons_store else None
+        if beacons_data_version is None or beacons_data_version & 1:
+            return None
+        return f"{beacons_data_version:x}"
+    try:
+        beacons_data_stat = os.stat(filepath)
+    except OSError:
+        return None
+    return f"{beacons_data_stat.st_mtime_ns:x}-{beacons_data_stat.st_size:x}"
+
+
 def ibeacon_get_beacons_data():
-    return read_local_cache_file(filepath=FILEPATH_BEACONS_DATA)
+    return _read_beacons_store(BEACONS_DATA_SHM, FILEPATH_BEACONS_DATA)
+
+
+def ibeacon_get_beacons_data_version():
+    """ Returns a token that changes whenever beacons data is written, or None if unknown """
+    return _get_beacons_store_version(BEACONS_DATA_SHM, FILEPATH_BEACONS_DATA)
+
+
+def ibeacon_get_beacons_table():
+    """ Returns every beacon tracked by the scanner, beacons data only holds the strongest ones """
+    return _read_beacons_store(BEACONS_TABLE_SHM, FILEPATH_BEACONS_TABLE).get('beacons_list', [])
+
+
+def ibeacon_get_beacons_table_version():
+    """ Returns a token that changes whenever the beacons table is written, or None if unknown """
+    return _get_beacons_store_version(BEACONS_TABLE_SHM, FILEPATH_BEACONS_TABLE)
+
+
+def ibeacon_query_beacons_data(**kwargs):
+    """ Returns a page of the tracked beacons matching mac_address, uuid, major, minor and min_rssi, strongest first
+
+    limit is the size of the page, or the k of a top k query, fields the comma separated
+    fields of each beacon to return and cursor the next_cursor of the previous page.
+    """
+    unknown_parameters = set(kwargs) - set(BEACONS_QUERY_PARAMETERS)
+    if unknown_parameters:
+        raise ValueError(f"Unknown beacons query parameters '{', '.join(sorted(unknown_parameters))}', expected some of: {', '.join(BEACONS_QUERY_PARAMETERS)}")
+    limit = min(int(kwargs.get('limit') or MAX_BEACONS_QUERY_LIMIT), MAX_BEACONS_QUERY_LIMIT)
+    if limit < 1:
+        raise ValueError("Beacons query limit must be positive")
+    fields = [field for field in kwargs.get('fields', "").replace(" ", "").split(",") if field]
+    unknown_fields = set(fields) - set(BEACON_FIELDS)
+    if unknown_fields:
+        raise ValueError(f"Unknown beacon fields '{', '.join(sorted(unknown_fields))}', expected some of: {', '.join(BEACON_FIELDS)}")
+    after = decode_cursor(kwargs.get('cursor'))
+    version = ibeacon_get_beacons_table_version()
+    with _beacons_index_lock:
+        # the index follows the table of every tracked beacon, at most once per version
+        if version is None or version != _beacons_index.version:
+            _beacons_index.update(ibeacon_get_beacons_table(), version)
+        beacons, next_sort_key = _beacons_index.query(
+            mac_address=kwargs.get('mac_address'),
+            uuid=kwargs.get('uuid'),
+            major=None if kwargs.get('major') is None else int(kwargs['major']),
+            minor=None if kwargs.get('minor') is None else int(kwargs['minor']),
+            min_rssi=None if kwargs.get('min_rssi') is None else float(kwargs['min_rssi']),
+            limit=limit,
+            after=after,
+        )
+    return {
+        'version': version,
+        'beacons': [{field: beacon[field] for field in fields} for beacon in beacons] if fields else beacons,
+        'next_cursor': encode_cursor(next_sort_key),
+    }
+
+
+def ibeacon_get_presence(**kwargs):
+    """ Returns the presence published by the scanner of the beacons matching mac_address, major and minor """
+    presence_data_dict = _read_published_data(PRESENCE_DATA_SHM, FILEPATH_PRESENCE_DATA)
+    return {
+        'updated_at': presence_data_dict.get('updated_at'),
+        'grace_period': presence_data_dict.get('grace_period', PRESENCE_GRACE_PERIOD),
+        'presence': _filter_beacons_json(presence_data_dict.get('presence', []), **kwargs),
+    }
+
+
+def ibeacon_get_positions(**kwargs):
+    """ Returns the distances and positions published by the scanner of the beacons matching mac_address, major and minor """
+    positions_data_dict = _read_published_data(POSITIONS_DATA_SHM, FILEPATH_POSITIONS_DATA)
+    return {
+        'updated_at': positions_data_dict.get('updated_at'),
+        'scanners': positions_data_dict.get('scanners', lowercase_dict_keys(SCANNER_POSITIONS)),
+        'positions': _filter_beacons_json(positions_data_dict.get('positions', []), **kwargs),
+    }
 
 
 def ibeacon_get_scanner_settings():
+    if STATE_BACKEND == "shared_memory":
+        settings_store = _get_shared_store(
+            SharedJsonStore, SCANNER_SETTINGS_SHM, lock_filepath=FILEPATH_SCANNER_SETTINGS_LOCK)
+        scanner_settings_dict = settings_store.read_dict() if settings_store else None
+        if scanner_settings_dict is None:
+            warn(f"Impossible to read shared memory store '{SCANNER_SETTINGS_SHM}'")
+            return {}
+        return scanner_settings_dict
     return read_local_cache_file(filepath=FILEPATH_SCANNER_SETTINGS)
 
 
 def ibeacon_set_scanner_settings(**kwargs):
     kwargs = lowercase_dict_keys(kwargs)
-    current_settings = read_local_cache_file(filepath=FILEPATH_SCANNER_SETTINGS)
+    current_settings = ibeacon_get_scanner_settings()
 
-    if 'uuid_filter' in kwargs and isinstance(kwargs['uuid_filter'], str):
-        current_settings["uuid_filter"] = kwargs["uuid_filter"]
-        debug(f"IBeaconScanner 'uuid_filter' update to: {current_settings['uuid_filter']}")
+    if 'uuid_filter' in kwargs and isinstance(kwargs['uuid_filter'], (str, list)):
+        try:
+            if len(parse_filter_rules(kwargs['uuid_filter'])) > MAX_UUID_FILTER_RULES:
+                raise ValueError(f"more than {MAX_UUID_FILTER_RULES} rules")
+            current_settings["uuid_filter"] = kwargs["uuid_filter"]
+            debug(f"IBeaconScanner 'uuid_filter' update to: {current_settings['uuid_filter']}")
+        except ValueError as e:
+            warn(f"Ignoring IBeaconScanner 'uuid_filter' update: {e}")
 
     if 'scan_tick' in kwargs and isinstance(kwargs['scan_tick'], int):
         if kwargs["scan_tick"] < MIN_SCAN_TICK:
@@ -154,11 +837,100 @@ def ibeacon_set_scanner_settings(**kwargs):
         current_settings["fake_scan"] = kwargs['fake_scan']
         debug(f"IBeaconScanner 'fake_scan' update to: {current_settings['fake_scan']}")
 
+    if 'continuous_scan' in kwargs and isinstance(kwargs['continuous_scan'], bool):
+        current_settings["continuous_scan"] = kwargs['continuous_scan']
+        debug(f"IBeaconScanner 'continuous_scan' update to: {current_settings['continuous_scan']}")
+
+    if 'scan_window' in kwargs and isinstance(kwargs['scan_window'], (int, float)):
+        if kwargs["scan_window"] > 0:
+            current_settings["scan_window"] = kwargs["scan_window"]
+            debug(f"IBeaconScanner 'scan_window' update to: {current_settings['scan_window']}")
+
+    if 'snapshot_interval' in kwargs and isinstance(kwargs['snapshot_interval'], (int, float)):
+        if kwargs["snapshot_interval"] < MIN_SNAPSHOT_INTERVAL:
+            current_settings["snapshot_interval"] = MIN_SNAPSHOT_INTERVAL
+        else:
+            current_settings["snapshot_interval"] = kwargs["snapshot_interval"]
+        debug(f"IBeaconScanner 'snapshot_interval' update to: {current_settings['snapshot_interval']}")
+
+    if 'replay_file' in kwargs and isinstance(kwargs['replay_file'], str):
+        if not kwargs['replay_file'] or os.path.isfile(kwargs['replay_file']):
+            current_settings["replay_file"] = kwargs['replay_file']
+            debug(f"IBeaconScanner 'replay_file' update to: {current_settings['replay_file']}")
+        else:
+            warn(f"Capture file to replay '{kwargs['replay_file']}' does not exist")
+
+    if 'replay_speed' in kwargs and isinstance(kwargs['replay_speed'], (int, float)):
+        if kwargs["replay_speed"] >= 0:
+            current_settings["replay_speed"] = kwargs["replay_speed"]
+            debug(f"IBeaconScanner 'replay_speed' update to: {current_settings['replay_speed']}")
+
+    if 'capture_file' in kwargs and isinstance(kwargs['capture_file'], str):
+        current_settings["capture_file"] = kwargs['capture_file']
+        debug(f"IBeaconScanner 'capture_file' update to: {current_settings['capture_file']}")
+
     if 'run_flag' in kwargs and isinstance(kwargs['run_flag'], bool):
         current_settings["run_flag"] = kwargs['run_flag']
         debug(f"IBeaconScanner 'run_flag' update to: {current_settings['run_flag']}")
         
-    if current_settings != read_local_cache_file(filepath=FILEPATH_SCANNER_SETTINGS):
+    if current_settings != ibeacon_get_scanner_settings():
         config_write(**current_settings)
-        write_local_cache_file(filepath=FILEPATH_SCANNER_SETTINGS, data_dict=current_settings)
+        _write_scanner_settings(current_settings)
+        send_control_message(FILEPATH_CONTROL_SOCKET, {'type': 'settings', 'settings': current_settings})
         info("Updated new scanner settings")
+
+
+def ibeacon_start_profile(kind=PROFILE_CPU, duration=None):
+    """ Asks the scanner process for a profile, returns False if the scanner is not running """
+    duration = PROFILE_DURATION if duration is None else duration
+    if kind not in PROFILE_KINDS:
+        raise ValueError(f"Unknown profile kind '{kind}', expected one of: {', '.join(PROFILE_KINDS)}")
+    if isinstance(duration, bool) or not isinstance(duration, (int, float)) or not 0 < duration <= MAX_PROFILE_DURATION:
+        raise ValueError(f"Profile duration must be a number of seconds up to {MAX_PROFILE_DURATION}")
+    return send_control_message(FILEPATH_CONTROL_SOCKET, {'type': 'profile', 'kind': kind, 'duration': duration})
+
+
+def ibeacon_get_profiles():
+    """ Returns the profiles written by the scanner process, newest first """
+    try:
+        entries = [entry for entry in os.scandir(DIRECTORY_PROFILES) if entry.is_file()]
+    except FileNotFoundError:
+        return []
+    profiles = [{
+        'filename': entry.name,
+        'size': entry.stat().st_size,
+        'modified': datetime.fromtimestamp(entry.stat().st_mtime).isoformat(),
+    } for entry in entries]
+    return sorted(profiles, key=lambda profile: profile['modified'], reverse=True)
+
+
+def _parse_history_time(value):
+    """ Seconds since the epoch from a number or an ISO 8601 date """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def ibeacon_get_history(**kwargs):
+    """ Returns the history of the beacons matching mac_address, major and minor in the time range """
+    resolution = kwargs.get('resolution') or RESOLUTION_RAW
+    if resolution != RESOLUTION_RAW and resolution not in AGGREGATES:
+        raise ValueError(f"Unknown history resolution '{resolution}', expected one of: raw, {', '.join(AGGREGATES)}")
+    limit = min(int(kwargs.get('limit') or MAX_HISTORY_LIMIT), MAX_HISTORY_LIMIT)
+    history = query_history(
+        HISTORY_FILE,
+        mac_address=kwargs.get('mac_address'),
+        major=None if kwargs.get('major') is None else int(kwargs['major']),
+        minor=None if kwargs.get('minor') is None else int(kwargs['minor']),
+        since=_parse_history_time(kwargs.get('since')),
+        until=_parse_history_time(kwargs.get('until')),
+        resolution=resolution,
+        limit=limit,
+    ) if HISTORY_FILE else []
+    return {
+        'resolution': resolution,
+        'history': history,
+    }
@@ -0,0 +1,146 @@
+import numpy as np
+
+from ibeacon_scanner.models import IBeacon
+
+
+SMOOTHING_EMA = "ema"
+SMOOTHING_MEDIAN = "median"
+SMOOTHING_KALMAN = "kalman"
+SMOOTHING_METHODS = (SMOOTHING_EMA, SMOOTHING_MEDIAN, SMOOTHING_KALMAN)
+
+
+class RssiSmoother:
+    """ Ring buffer of the last RSSI samples of each beacon, filtered for all beacons at once
+
+    Every beacon owns a row of a (capacity, samples) array. Readings are queued by add()
+    and written to the ring buffers in one vectorized step when smooth() is called, which
+    must always be called from the same thread.
+    """
+
+    def __init__(self, method=SMOOTHING_EMA, samples=8, capacity=256,
+            ema_alpha=0.3, kalman_process_noise=0.1, kalman_measurement_noise=4.0):
+        if method not in SMOOTHING_METHODS:
+            raise ValueError(f"Unknown RSSI smoothing method '{method}'")
+        self.method = method
+        self.samples = samples
+        self.ema_alpha = ema_alpha
+        self.kalman_process_noise = kalman_process_noise
+        self.kalman_measurement_noise = kalman_measurement_noise
+        self._rows = {}
+        self._free_rows = []
+        self._pending = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self._buffers = np.full((capacity, self.samples), np.nan, dtype=np.float32)
+        self._cursors = np.zeros(capacity, dtype=np.intp)
+        self._free_rows = list(range(capacity - 1, -1, -1))
+
+    def _grow(self):
+        capacity = len(self._buffers)
+        buffers, cursors = self._buffers, self._cursors
+        self._allocate(capacity * 2)
+        self._buffers[:capacity], self._cursors[:capacity] = buffers, cursors
+        self._free_rows = self._free_rows[:capacity]
+
+    def add(self, beacon):
+        """ Queues one RSSI reading of the beacon, it can be called from the scanner backend thread """
+        # a single extend keeps each key and rssi pair together when flushed from another thread
+        self._pending.extend((beacon.key, beacon.rssi))
+
+    def _row(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            if not self._free_rows:
+                self._grow()
+            row = self._rows[key] = self._free_rows.pop()
+        return row
+
+    def _flush(self):
+        # readings queued while flushing are kept for the next flush
+        pending_length = len(self._pending)
+        if not pending_length:
+            return
+        readings = np.fromiter(self._pending[:pending_length], dtype=np.int64, count=pending_length)
+        readings = readings.reshape(-1, 2)
+        del self._pending[:pending_length]
+        # maps each key to its row once, no matter how many readings it has
+        unique_keys, inverse = np.unique(readings[:, 0], return_inverse=True)
+        unique_rows = np.fromiter(map(self._row, unique_keys.tolist()), dtype=np.intp, count=len(unique_keys))
+        # position of each reading among the queued readings of its beacon
+        order = np.argsort(inverse, kind='stable')
+        inverse, rssis = inverse[order], readings[order, 1]
+        counts = np.bincount(inverse, minlength=len(unique_keys))
+        occurrences = np.arange(len(readings)) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = unique_rows[inverse]
+        positions = (self._cursors[rows] + occurrences) % self.samples
+        # when a beacon queued more readings than samples, the newest ones are written last
+        self._buffers[rows, positions] = rssis
+        self._cursors[unique_rows] = (self._cursors[unique_rows] + counts) % self.samples
+
+    def _release(self, keys):
+        for key in keys:
+            row = self._rows.pop(key)
+            self._buffers[row] = np.nan
+            self._cursors[row] = 0
+            self._free_rows.append(row)
+
+    def _chronological(self, rows):
+        # oldest sample first, missing samples as nan at the beginning
+        columns = (self._cursors[rows, None] + np.arange(self.samples)) % self.samples
+        return np.take_along_axis(self._buffers[rows], columns, axis=1)
+
+    def _ema(self, samples):
+        ages = np.arange(self.samples - 1, -1, -1, dtype=np.float32)
+        weights = np.where(np.isnan(samples), 0, (1 - self.ema_alpha) ** ages)
+        return np.nansum(samples * weights, axis=1) / weights.sum(axis=1)
+
+    def _median(self, samples):
+        # nan sorts last, so the measured samples of each row are at its beginning
+        samples = np.sort(samples, axis=1)
+        counts = np.count_nonzero(~np.isnan(samples), axis=1)
+        rows = np.arange(len(samples))
+        return (samples[rows, (counts - 1) // 2] + samples[rows, counts // 2]) / 2
+
+    def _kalman(self, samples):
+        estimates = np.full(len(samples), np.nan, dtype=np.float32)
+        covariances = np.zeros(len(samples), dtype=np.float32)
+        for column in samples.T:
+            measured = ~np.isnan(column)
+            first = measured & np.isnan(estimates)
+            # the first sample of each beacon initializes its estimate
+            estimates[first] = column[first]
+            covariances[first] = self.kalman_measurement_noise
+            update = measured & ~first
+            predicted_covariances = covariances[update] + self.kalman_process_noise
+            gains = predicted_covariances / (predicted_covariances + self.kalman_measurement_noise)
+            estimates[update] += gains * (column[update] - estimates[update])
+            covariances[update] = (1 - gains) * predicted_covariances
+        return estimates
+
+    def smooth(self, beacons_list):
+        """ Returns the beacons with their filtered RSSI, forgetting the beacons not in the list
+
+        A beacon without samples yet, whose first reading is still being queued from another
+        thread, keeps its raw RSSI.
+        """
+        self._flush()
+        current_keys = {beacon.key for beacon in beacons_list}
+        self._release([key for key in self._rows if key not in current_keys])
+        sampled = [index for index, beacon in enumerate(beacons_list) if beacon.key in self._rows]
+        if not sampled:
+            return list(beacons_list)
+        rows = np.fromiter((self._rows[beacons_list[index].key] for index in sampled), dtype=np.intp)
+        samples = self._chronological(rows)
+        if self.method == SMOOTHING_MEDIAN:
+            rssis = self._median(samples)
+        elif self.method == SMOOTHING_KALMAN:
+            rssis = self._kalman(samples)
+        else:
+            rssis = self._ema(samples)
+        smoothed_beacons_list = list(beacons_list)
+        for index, rssi in zip(sampled, np.rint(rssis).astype(int).tolist()):
+            b = beacons_list[index]
+            smoothed_beacons_list[index] = IBeacon(
+                b.mac_address, b.uuid, b.major, b.minor, b.tx_power, rssi, b.adapter, b.adapters_rssi)
+        return smoothed_beacons_list
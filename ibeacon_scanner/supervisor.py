@@ -0,0 +1,225 @@
+import os
+import sys
+import time
+import fcntl
+import signal
+import traceback
+import multiprocessing
+from threading import Thread, Event
+
+from log import error, warn, info, debug
+from metrics.services import metrics_register_counter, metrics_register_gauge, metrics_inc, metrics_set
+
+
+LOCK_RETRY_INTERVAL = 5
+CHECK_INTERVAL = 1.0
+PARENT_CHECK_INTERVAL = 1.0
+
+metrics_register_counter("ibeacon_scanner_restarts_total", "Scanner processes restarted by the supervisor, by reason")
+metrics_register_gauge("ibeacon_scanner_first_scan_seconds", "Seconds from the launch of the scanner process to its first scan cycle")
+
+
+class ScannerHeartbeat:
+    """ Times of the last loop iteration and of the first scan cycle of the scanner, shared with its supervisor
+
+    Both are time.monotonic() values, the same clock for every process of the host.
+    """
+
+    def __init__(self, context):
+        self._beat_at = context.RawValue('d', 0.0)
+        self._first_scan_at = context.RawValue('d', 0.0)
+
+    def reset(self):
+        self._beat_at.value = time.monotonic()
+        self._first_scan_at.value = 0.0
+
+    def beat(self, scanned=False):
+        now = time.monotonic()
+        self._beat_at.value = now
+        if scanned and not self._first_scan_at.value:
+            self._first_scan_at.value = now
+
+    @property
+    def beat_at(self):
+        return self._beat_at.value
+
+    @property
+    def first_scan_at(self):
+        return self._first_scan_at.value or None
+
+
+def _watch_parent(parent_pid):
+    # an orphan scanner would keep the host lock and the adapters from the next supervisor
+    while os.getppid() == parent_pid:
+        time.sleep(PARENT_CHECK_INTERVAL)
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _raise_system_exit(signum, frame):
+    raise SystemExit(0)
+
+
+def _run_supervised(target, heartbeat, parent_pid):
+    """ Entry point of the scanner process
+
+    target releases what it holds on its way out, SIGTERM included. The process then leaves
+    with os._exit, so the exit handlers inherited from the supervising process never run.
+    """
+    signal.signal(signal.SIGTERM, _raise_system_exit)
+    Thread(name="scanner_parent_watch", target=_watch_parent, args=(parent_pid,), daemon=True).start()
+    exitcode = 1
+    try:
+        target(heartbeat=heartbeat)
+        exitcode = 0
+    except SystemExit as e:
+        exitcode = e.code if isinstance(e.code, int) else 0
+    except BaseException:
+        error(f"iBeacon scanner process failed:\n{traceback.format_exc()}")
+    finally:
+        # os._exit does not flush the standard streams
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exitcode)
+
+
+class ScannerSupervisor:
+    """ Runs target(heartbeat=...) in a child process, the only one of the host, restarting it when it dies or hangs
+
+    The host lock is an flock on lock_filepath, held for as long as the supervisor and its
+    scanner live and released by the kernel if they die. A supervisor that does not get it
+    stands by and retries. With the fork start method the scanner starts from the already
+    imported modules instead of a new interpreter. The scanner must call heartbeat.beat()
+    at least every heartbeat_timeout seconds, or it is terminated. Restarts wait twice as
+    long after each one, from min_backoff up to max_backoff, unless the scanner ran longer
+    than max_backoff before failing.
+    """
+
+    def __init__(self, target, lock_filepath, start_method="fork", heartbeat_timeout=60, min_backoff=1,
+            max_backoff=60, stop_timeout=10):
+        self.target = target
+        self.lock_filepath = lock_filepath
+        self.heartbeat_timeout = heartbeat_timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stop_timeout = stop_timeout
+        self._context = multiprocessing.get_context(start_method)
+        self.heartbeat = ScannerHeartbeat(self._context)
+        self.process = None
+        self.launched_at = None
+        self.first_scan_seconds = None
+        self.restarts = 0
+        self._lock_fd = None
+        self._pid = os.getpid()
+        self._stop_event = Event()
+        self._thread = None
+
+    def _acquire_lock(self):
+        lock_fd = os.open(self.lock_filepath, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(lock_fd)
+            return False
+        # the pid of the supervisor holding the lock, for whoever looks at the file
+        os.ftruncate(lock_fd, 0)
+        os.write(lock_fd, f"{os.getpid()}\n".encode())
+        self._lock_fd = lock_fd
+        return True
+
+    def _release_lock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def _launch(self):
+        self.heartbeat.reset()
+        self.first_scan_seconds = None
+        self.launched_at = time.monotonic()
+        self.process = self._context.Process(
+            name="ibeacon_scanner", target=_run_supervised, args=(self.target, self.heartbeat, os.getpid()))
+        self.process.start()
+        info(f"Started iBeacon scanner process {self.process.pid}")
+
+    def _terminate(self):
+        """ Asks the scanner to stop, and kills it if it does not within stop_timeout """
+        if not self.process or not self.process.is_alive():
+            return
+        self.process.terminate()
+        self.process.join(self.stop_timeout)
+        if self.process.is_alive():
+            warn(f"iBeacon scanner process {self.process.pid} did not stop in {self.stop_timeout}s, killing it")
+            self.process.kill()
+            self.process.join()
+
+    def _watch(self):
+        """ Waits until the scanner exits or hangs, returns the reason or None if stopping """
+        while not self._stop_event.wait(CHECK_INTERVAL):
+            if not self.process.is_alive():
+                error(f"iBeacon scanner process {self.process.pid} exited with code {self.process.exitcode}")
+                return "exit"
+            first_scan_at = self.heartbeat.first_scan_at
+            if self.first_scan_seconds is None and first_scan_at:
+                self.first_scan_seconds = first_scan_at - self.launched_at
+                metrics_set("ibeacon_scanner_first_scan_seconds", self.first_scan_seconds)
+                info(f"iBeacon scanner first scan {self.first_scan_seconds:.2f}s after its launch")
+            heartbeat_age = time.monotonic() - self.heartbeat.beat_at
+            if heartbeat_age > self.heartbeat_timeout:
+                error(f"iBeacon scanner process {self.process.pid} missed its heartbeat for {heartbeat_age:.0f}s")
+                self._terminate()
+                return "heartbeat"
+        return None
+
+    def run(self):
+        """ Supervises the scanner from the calling thread until stop() """
+        standing_by = False
+        while not self._acquire_lock():
+            if not standing_by:
+                info(f"Another iBeacon scanner holds '{self.lock_filepath}', standing by")
+                standing_by = True
+            if self._stop_event.wait(LOCK_RETRY_INTERVAL):
+                return
+        failures = 0
+        try:
+            while not self._stop_event.is_set():
+                self._launch()
+                reason = self._watch()
+                if reason is None:
+                    break
+                self.restarts += 1
+                metrics_inc("ibeacon_scanner_restarts_total", reason=reason)
+                # a scanner that ran for a while failed on its own, not because of its start
+                failures = 0 if time.monotonic() - self.launched_at > self.max_backoff else failures + 1
+                backoff = min(self.min_backoff * 2 ** max(failures - 1, 0), self.max_backoff)
+                warn(f"Restarting iBeacon scanner in {backoff}s...")
+                self._stop_event.wait(backoff)
+        finally:
+            self._terminate()
+            self._release_lock()
+
+    def start(self):
+        """ Supervises the scanner from a background thread """
+        self._stop_event.clear()
+        self._thread = Thread(name="ibeacon_scanner_supervisor", target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops the scanner gracefully and releases the host lock """
+        # forked processes inherit the supervisor but do not own its scanner
+        if os.getpid() != self._pid:
+            return
+        info("Stopping iBeacon scanner supervisor")
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(self.stop_timeout + CHECK_INTERVAL + 1)
+            self._thread = None
+
+    def status(self):
+        alive = bool(self.process and self.process.is_alive())
+        return {
+            'holds_lock': self._lock_fd is not None,
+            'pid': self.process.pid if alive else None,
+            'alive': alive,
+            'restarts': self.restarts,
+            'heartbeat_age': time.monotonic() - self.heartbeat.beat_at if alive else None,
+            'first_scan_seconds': self.first_scan_seconds,
+        }
@@ -0,0 +1,121 @@
+from threading import Lock
+
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+# seconds, from a fast HTTP request to a slow cache file write
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MetricsRegistry:
+    """ Counters, gauges and histograms of one process, keyed by metric name and labels
+
+    Metrics are declared once with register() and updated with inc(), set() and observe(),
+    always passing the labels of a metric in the same order. snapshot() returns every
+    declared metric with its values as a JSON serializable dict.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._values = {}
+        self._lock = Lock()
+
+    def register(self, name, metric_type, help_text, buckets=DEFAULT_BUCKETS):
+        self._metrics[name] = {
+            'type': metric_type,
+            'help': help_text,
+            'buckets': list(buckets) if metric_type == HISTOGRAM else None,
+        }
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        buckets = self._metrics[name]['buckets']
+        # first bucket holding the value, the last one is +Inf
+        bucket = next((index for index, bound in enumerate(buckets) if value <= bound), len(buckets))
+        with self._lock:
+            histogram = self._values.get(key)
+            if histogram is None:
+                histogram = self._values[key] = [0] * (len(buckets) + 1) + [0.0]
+            histogram[bucket] += 1
+            histogram[-1] += value
+
+    def reset_after_fork(self):
+        """ Forgets every value, keeping the declared metrics, in a process forked from the one recording them
+
+        A thread of the parent could hold the lock when it forked, and it is never released in
+        the child, so the lock and the values are replaced instead of acquired and cleared.
+        """
+        self._lock = Lock()
+        self._values = {}
+
+    def snapshot(self):
+        snapshot = {
+            name: dict(metric, samples=[]) for name, metric in self._metrics.items()
+        }
+        with self._lock:
+            values = [(name, labels, list(value) if isinstance(value, list) else value)
+                for (name, labels), value in self._values.items()]
+        for name, labels, value in values:
+            if name in snapshot:
+                snapshot[name]['samples'].append([dict(labels), value])
+        return snapshot
+
+
+def _merge_sample_values(value, other_value):
+    if isinstance(value, list):
+        return [a + b for a, b in zip(value, other_value)]
+    return value + other_value
+
+
+def merge_metrics_snapshots(snapshots):
+    """ Adds up the values of the same metric and labels across the snapshots of several processes """
+    merged_snapshot = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            merged_metric = merged_snapshot.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric['samples']:
+                key = tuple(sorted(labels.items()))
+                current_value = merged_metric['samples'].get(key)
+                merged_metric['samples'][key] = \
+                    value if current_value is None else _merge_sample_values(current_value, value)
+    return merged_snapshot
+
+
+def _render_labels(labels):
+    if not labels:
+        return ""
+    rendered_labels = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + rendered_labels + "}"
+
+
+def render_metrics_text(merged_snapshot):
+    """ Renders merged snapshots in the Prometheus text exposition format """
+    lines = []
+    for name, metric in sorted(merged_snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric['samples'].items()):
+            if metric['type'] != HISTOGRAM:
+                lines.append(f"{name}{_render_labels(labels)} {value}")
+                continue
+            cumulative_count = 0
+            for bound, bucket_count in zip(metric['buckets'] + ["+Inf"], value[:-1]):
+                cumulative_count += bucket_count
+                lines.append(f"{name}_bucket{_render_labels(labels + (('le', bound),))} {cumulative_count}")
+            lines.append(f"{name}_sum{_render_labels(labels)} {value[-1]}")
+            lines.append(f"{name}_count{_render_labels(labels)} {cumulative_count}")
+    return "\n".join(lines) + "\n"
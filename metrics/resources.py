@@ -0,0 +1,21 @@
+#!/usr/bin/python
+from flask import Response
+from flask_restful import Resource
+
+from log import error, warn, info, debug
+from metrics.services import metrics_get_text
+
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsResource(Resource):
+
+    def get(self):
+        return Response(metrics_get_text(), content_type=METRICS_CONTENT_TYPE)
+
+
+def metrics_add_http_resources_to_api(flask_restful_api, prefix=""):
+    info("Adding 'metrics_add_http_resources' resources to application")
+    prefix = f"/{prefix}" if prefix and not prefix.startswith("/") else prefix
+    flask_restful_api.add_resource(MetricsResource, f'{prefix}/metrics')
@@ -0,0 +1,138 @@
+import os
+import time
+from contextlib import contextmanager
+from threading import Thread, Lock
+
+from log import error, warn, info, debug
+from metrics.models import MetricsRegistry, COUNTER, GAUGE, HISTOGRAM, DEFAULT_BUCKETS, \
+    merge_metrics_snapshots, render_metrics_text
+
+
+# every process writes its own snapshot to a store named after its pid
+METRICS_SHM_PREFIX = "metrics_"
+METRICS_SHM_CAPACITY = 65536
+METRICS_SNAPSHOT_INTERVAL = 1.0
+_SHM_DIRECTORY = "/dev/shm"
+
+_metrics_registry = MetricsRegistry()
+_metrics_snapshots_started = False
+_metrics_snapshots_lock = Lock()
+
+
+def _restart_metrics_after_fork():
+    # a forked worker must report its own values, from its own snapshots thread
+    # locks are replaced, a thread of the parent could hold them when it forked
+    global _metrics_snapshots_started, _metrics_snapshots_lock
+    _metrics_registry.reset_after_fork()
+    _metrics_snapshots_started = False
+    _metrics_snapshots_lock = Lock()
+
+
+os.register_at_fork(after_in_child=_restart_metrics_after_fork)
+
+
+def _write_metrics_snapshots():
+    # persistance reports metrics too, so its stores are imported once both packages are loaded
+    from persistance.shared_memory import SharedJsonStore, create_shared_store
+    metrics_store = create_shared_store(
+        SharedJsonStore, f"{METRICS_SHM_PREFIX}{os.getpid()}", METRICS_SHM_CAPACITY)
+    while 1:
+        try:
+            metrics_store.write_dict(_metrics_registry.snapshot())
+        except ValueError as e:
+            if metrics_store.closed:
+                # the process released its stores on its way out
+                return
+            error(f"Impossible to share metrics of process {os.getpid()}: {e}")
+        time.sleep(METRICS_SNAPSHOT_INTERVAL)
+
+
+def _start_metrics_snapshots():
+    """ Starts sharing the metrics of this process the first time it records one """
+    global _metrics_snapshots_started
+    with _metrics_snapshots_lock:
+        if _metrics_snapshots_started:
+            return
+        _metrics_snapshots_started = True
+        Thread(name="metrics_snapshots", target=_write_metrics_snapshots, daemon=True).start()
+
+
+def metrics_register_counter(name, help_text):
+    _metrics_registry.register(name, COUNTER, help_text)
+
+
+def metrics_register_gauge(name, help_text):
+    _metrics_registry.register(name, GAUGE, help_text)
+
+
+def metrics_register_histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    _metrics_registry.register(name, HISTOGRAM, help_text, buckets)
+
+
+def metrics_inc(name, value=1, **labels):
+    if not _metrics_snapshots_started:
+        _start_metrics_snapshots()
+    _metrics_registry.inc(name, value, **labels)
+
+
+def metrics_set(name, value, **labels):
+    if not _metrics_snapshots_started:
+        _start_metrics_snapshots()
+    _metrics_registry.set(name, value, **labels)
+
+
+def metrics_observe(name, value, **labels):
+    if not _metrics_snapshots_started:
+        _start_metrics_snapshots()
+    _metrics_registry.observe(name, value, **labels)
+
+
+@contextmanager
+def metrics_time(name, **labels):
+    """ Observes the seconds the block takes in the histogram, even if it raises """
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics_observe(name, time.perf_counter() - started_at, **labels)
+
+
+def _read_processes_metrics_snapshots():
+    from persistance.shared_memory import SharedJsonStore, get_shared_store
+    snapshots = []
+    try:
+        store_names = [name for name in os.listdir(_SHM_DIRECTORY) if name.startswith(METRICS_SHM_PREFIX)]
+    except FileNotFoundError:
+        return snapshots
+    for store_name in store_names:
+        pid = store_name[len(METRICS_SHM_PREFIX):]
+        # this process is reported with its live values
+        if not pid.isdigit() or int(pid) == os.getpid():
+            continue
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            # a killed process can not unlink its store
+            debug(f"Removing metrics of finished process {pid}")
+            try:
+                os.remove(os.path.join(_SHM_DIRECTORY, store_name))
+            except OSError:
+                pass
+            continue
+        except PermissionError:
+            pass
+        metrics_store = get_shared_store(SharedJsonStore, store_name)
+        snapshot = metrics_store.read_dict() if metrics_store else None
+        if snapshot:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def metrics_get_text():
+    """ Returns the metrics of every process of the service in Prometheus text format
+
+    Values with the same name and labels are added up across processes, gauges are
+    only set by a single process.
+    """
+    snapshots = _read_processes_metrics_snapshots() + [_metrics_registry.snapshot()]
+    return render_metrics_text(merge_metrics_snapshots(snapshots))
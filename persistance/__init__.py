@@ -1,8 +1,70 @@
 import os
 import json
 import time
+import atexit
+import hashlib
+from threading import Thread, Condition, Lock, get_ident
 
 from log import warn
+from config import CACHE_FILE_WRITE_INTERVAL
+from metrics.services import metrics_register_counter, metrics_register_histogram, metrics_inc, metrics_time
+
+
+CACHE_FILE_RETRIES = 5
+CACHE_FILE_RETRY_DELAY = 0.1
+
+metrics_register_histogram("persistance_cache_file_seconds", "Time to read or write a local cache file, retries included")
+metrics_register_counter("persistance_cache_file_retries_total", "Local cache file reads or writes that had to be retried")
+metrics_register_counter("persistance_cache_file_unchanged_total", "Local cache file writes skipped because the content did not change")
+metrics_register_counter("persistance_cache_file_coalesced_total", "Background local cache file writes replaced by a newer one before being written")
+
+# (content digest, file stat) of the last write of this process to each file
+_written_files = {}
+_written_files_lock = Lock()
+
+
+def _reset_written_files_after_fork():
+    # a thread of the parent could hold the lock when it forked, a new one is never held
+    global _written_files_lock
+    _written_files_lock = Lock()
+
+
+os.register_at_fork(after_in_child=_reset_written_files_after_fork)
+
+
+def _encode_cache_file(data_dict):
+    return json.dumps(data_dict or {}, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def _file_signature(filepath):
+    try:
+        file_stat = os.stat(filepath)
+    except OSError:
+        return None
+    return file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size
+
+
+def _write_cache_file(filepath, payload):
+    """ Replaces the file atomically, unless it still holds the same payload this process wrote last """
+    digest = hashlib.blake2b(payload, digest_size=16).digest()
+    with _written_files_lock:
+        written_file = _written_files.get(filepath)
+    # another process may have replaced the file since, so the file must be the one written
+    if written_file and written_file[0] == digest and written_file[1] == _file_signature(filepath):
+        metrics_inc("persistance_cache_file_unchanged_total")
+        return
+    # readers see either the previous file or the new one, never a partial write
+    temporary_filepath = f"{filepath}.{os.getpid()}.{get_ident()}.tmp"
+    try:
+        with open(temporary_filepath, 'wb') as _file:
+            _file.write(payload)
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(temporary_filepath, 'wb') as _file:
+            _file.write(payload)
+    os.replace(temporary_filepath, filepath)
+    with _written_files_lock:
+        _written_files[filepath] = (digest, _file_signature(filepath))
 
 
 def write_local_cache_file(**kwargs):
@@ -10,30 +72,106 @@ def write_local_cache_file(**kwargs):
         return
     if not 'data_dict' in kwargs:
         return
-    if not kwargs['data_dict']:
-        kwargs['data_dict'] = {}
-    cycles = 0
-    while cycles < 5:
-        try:
-            os.makedirs(os.path.dirname(kwargs['filepath']), exist_ok=True)
-            with open(kwargs['filepath'], 'w') as _file:
-                json.dump(kwargs['data_dict'], _file, ensure_ascii=False, indent=4)
-            return
-        except:
-            warn(f"While trying to write local cache file '{kwargs['filepath']}'. Retrying...")
-        cycles += 1
-        time.sleep(1)
+    payload = _encode_cache_file(kwargs['data_dict'])
+    with metrics_time("persistance_cache_file_seconds", operation="write"):
+        cycles = 0
+        while cycles < CACHE_FILE_RETRIES:
+            try:
+                _write_cache_file(kwargs['filepath'], payload)
+                return
+            except OSError:
+                warn(f"While trying to write local cache file '{kwargs['filepath']}'. Retrying...")
+                metrics_inc("persistance_cache_file_retries_total", operation="write")
+            cycles += 1
+            time.sleep(CACHE_FILE_RETRY_DELAY)
 
 
 def read_local_cache_file(**kwargs):
     if not 'filepath' in kwargs:
         return
-    cycles = 0
-    while cycles < 5:
-        try:
-            return json.loads(open(kwargs['filepath']).read())
-        except:
-            warn(f"While trying to read local cache file '{kwargs['filepath']}'. Retrying...")
-        cycles += 1
-        time.sleep(1)
-    return {}
+    with metrics_time("persistance_cache_file_seconds", operation="read"):
+        cycles = 0
+        while cycles < CACHE_FILE_RETRIES:
+            try:
+                return json.loads(open(kwargs['filepath'], 'rb').read())
+            except FileNotFoundError:
+                # files are replaced atomically, a missing file will not show up by retrying
+                warn(f"Local cache file '{kwargs['filepath']}' does not exist")
+                return {}
+            except (OSError, ValueError):
+                warn(f"While trying to read local cache file '{kwargs['filepath']}'. Retrying...")
+                metrics_inc("persistance_cache_file_retries_total", operation="read")
+            cycles += 1
+            time.sleep(CACHE_FILE_RETRY_DELAY)
+        return {}
+
+
+class CacheFileWriter:
+    """ Background thread writing local cache files, at most once per interval
+
+    Only the latest data submitted for each file is kept, so a file changing every
+    cycle is written once per interval and the submitting thread never waits on disk.
+    """
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._pending = {}
+        self._condition = Condition()
+        self._thread = None
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self):
+        # the writer thread is not copied to a forked process, the pending files are still the parent's
+        self._pending = {}
+        self._condition = Condition()
+        self._thread = None
+
+    def submit(self, filepath, data_dict):
+        with self._condition:
+            if filepath in self._pending:
+                metrics_inc("persistance_cache_file_coalesced_total")
+            self._pending[filepath] = data_dict
+            if not self._thread:
+                self._thread = Thread(name="cache_file_writer", target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def flush(self):
+        """ Writes every pending file from the calling thread """
+        with self._condition:
+            pending, self._pending = self._pending, {}
+        for filepath, data_dict in pending.items():
+            write_local_cache_file(filepath=filepath, data_dict=data_dict)
+
+    def _run(self):
+        while 1:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+            self.flush()
+            time.sleep(self.interval)
+
+
+_cache_file_writer = CacheFileWriter(CACHE_FILE_WRITE_INTERVAL)
+
+
+def _flush_local_cache_files_at_exit(pid):
+    # forked processes inherit the exit handlers, they flush their own files with flush_local_cache_files()
+    if os.getpid() == pid:
+        _cache_file_writer.flush()
+
+
+atexit.register(_flush_local_cache_files_at_exit, os.getpid())
+
+
+def flush_local_cache_files():
+    """ Writes the files still queued for the background writer from the calling thread """
+    _cache_file_writer.flush()
+
+
+def submit_local_cache_file(**kwargs):
+    """ Queues the write of the file to the background writer, replacing any write still pending """
+    if not 'filepath' in kwargs:
+        return
+    if not 'data_dict' in kwargs:
+        return
+    _cache_file_writer.submit(kwargs['filepath'], kwargs['data_dict'])
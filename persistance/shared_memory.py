@@ -0,0 +1,311 @@
+import os
+import sys
+import json
+import atexit
+import time
+import fcntl
+import random
+import struct
+from threading import Lock
+from multiprocessing import shared_memory, resource_tracker
+
+
+# Segment layout: a fixed header followed by a payload area of fixed capacity.
+# The header holds a sequence counter used as a seqlock: the writer makes it odd
+# before touching the payload and even again when it is done, so readers copy the
+# payload without locking and retry when the counter moved while they copied it.
+_HEADER = struct.Struct("<4sIQI")
+_SEQ = struct.Struct("<Q")
+_LENGTH = struct.Struct("<I")
+_SEQ_OFFSET = 8
+_LENGTH_OFFSET = 16
+_MAGIC = b"IBSM"
+_CLOSED_MAGIC = b"\0\0\0\0"
+_READ_RETRIES = 100
+_REATTACH_CHECK_INTERVAL = 1.0
+_SHM_DIRECTORY = "/dev/shm"
+# python 3.13 opens segments out of the resource tracker, before it every process registers what it opens
+_UNTRACKED = sys.version_info >= (3, 13)
+
+
+def _open_segment(name, **kwargs):
+    """ Opens a segment the resource tracker does not remove, so only its owner unlinks it
+
+    The tracker of a process is shared with the processes it starts, where registering and
+    unregistering the same segment from several of them undoes the registration of another.
+    """
+    if _UNTRACKED:
+        return shared_memory.SharedMemory(name=name, track=False, **kwargs)
+    shm = shared_memory.SharedMemory(name=name, **kwargs)
+    resource_tracker.unregister(_tracked_name(shm), "shared_memory")
+    return shm
+
+
+def _tracked_name(shm):
+    # the tracker gets the POSIX name of the segment, with the leading slash its name drops
+    return f"/{shm.name}" if os.name == "posix" else shm.name
+
+
+def _unlink_segment(shm):
+    if not _UNTRACKED:
+        # unlink() unregisters the segment from the tracker, which expects it registered
+        resource_tracker.register(_tracked_name(shm), "shared_memory")
+    shm.unlink()
+
+
+def _segment_inode(name):
+    """ Inode of the segment now named name, None where segments are not files of _SHM_DIRECTORY """
+    if not os.path.isdir(_SHM_DIRECTORY):
+        return None
+    return os.stat(os.path.join(_SHM_DIRECTORY, name)).st_ino
+
+
+class SharedStateStore:
+    """ Seqlock protected shared memory segment holding one payload of bytes """
+
+    def __init__(self, name, shm, owner=False, lock_filepath=None):
+        self.name = name
+        self._shm = shm
+        self.owner = owner
+        self._lock_filepath = lock_filepath
+        self._write_lock = Lock()
+        self._checked_at = time.monotonic()
+        self._closed = False
+        # the segment attached, told apart from a newer one created under the same name by its inode
+        self._inode = None if owner else _segment_inode(name)
+
+    @classmethod
+    def create(cls, name, capacity, **kwargs):
+        """ Creates the segment, replacing any stale one left by a previous process """
+        try:
+            stale_shm = _open_segment(name)
+            stale_shm.close()
+            _unlink_segment(stale_shm)
+        except FileNotFoundError:
+            pass
+        # a killed owner leaves its segments behind until the next one replaces them
+        shm = _open_segment(name, create=True, size=_HEADER.size + capacity)
+        # a random even start keeps versions unique across scanner restarts
+        _HEADER.pack_into(shm.buf, 0, _MAGIC, capacity, random.getrandbits(48) * 2, 0)
+        return cls(name, shm, owner=True, **kwargs)
+
+    @classmethod
+    def attach(cls, name, **kwargs):
+        """ Attaches to a segment created by other process, raises FileNotFoundError if missing """
+        return cls(name, _open_segment(name), **kwargs)
+
+    @property
+    def capacity(self):
+        return _HEADER.unpack_from(self._shm.buf, 0)[1]
+
+    @property
+    def closed(self):
+        """ True when the owner unlinked the segment or replaced it with a new one """
+        if self._closed:
+            return True
+        if _HEADER.unpack_from(self._shm.buf, 0)[0] != _MAGIC:
+            return True
+        now = time.monotonic()
+        if self.owner or self._inode is None or now - self._checked_at < _REATTACH_CHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        # a crashed owner can not mark the segment, so compare it against the named one
+        try:
+            return _segment_inode(self.name) != self._inode
+        except FileNotFoundError:
+            return True
+
+    def version(self):
+        """ Returns the sequence counter, odd while a write is in progress """
+        return _SEQ.unpack_from(self._shm.buf, _SEQ_OFFSET)[0]
+
+    def write(self, payload):
+        with self._write_lock:
+            if self._closed:
+                raise ValueError(f"Shared store '{self.name}' is closed")
+            if len(payload) > self.capacity:
+                raise ValueError(f"Payload of {len(payload)} bytes exceeds '{self.name}' capacity")
+            lock_file = open(self._lock_filepath, 'a') if self._lock_filepath else None
+            try:
+                if lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                buf = self._shm.buf
+                seq = _SEQ.unpack_from(buf, _SEQ_OFFSET)[0]
+                _SEQ.pack_into(buf, _SEQ_OFFSET, seq + 1)
+                _LENGTH.pack_into(buf, _LENGTH_OFFSET, len(payload))
+                buf[_HEADER.size:_HEADER.size + len(payload)] = payload
+                _SEQ.pack_into(buf, _SEQ_OFFSET, seq + 2)
+            finally:
+                if lock_file:
+                    lock_file.close()
+
+    def read(self):
+        """ Returns (version, payload) from a consistent copy, or None if the writer never let go """
+        buf = self._shm.buf
+        capacity = self.capacity
+        for _ in range(_READ_RETRIES):
+            seq_before = _SEQ.unpack_from(buf, _SEQ_OFFSET)[0]
+            if not seq_before & 1:
+                length = min(_LENGTH.unpack_from(buf, _LENGTH_OFFSET)[0], capacity)
+                payload = bytes(buf[_HEADER.size:_HEADER.size + length])
+                if _SEQ.unpack_from(buf, _SEQ_OFFSET)[0] == seq_before:
+                    return seq_before, payload
+            time.sleep(0)
+        return None
+
+    def close(self):
+        # a write in progress on other thread finishes before the segment is released
+        with self._write_lock:
+            self._closed = True
+            self._shm.close()
+
+    def unlink(self):
+        """ Marks the segment as closed for attached readers and removes it """
+        with self._write_lock:
+            _HEADER.pack_into(self._shm.buf, 0, _CLOSED_MAGIC, self.capacity, self.version(), 0)
+            self._closed = True
+            self._shm.close()
+            _unlink_segment(self._shm)
+
+
+class SharedJsonStore(SharedStateStore):
+    """ Shared memory store holding a small dict encoded as compact JSON """
+
+    def write_dict(self, data_dict):
+        self.write(json.dumps(data_dict, separators=(',', ':')).encode())
+
+    def read_dict(self):
+        versioned_payload = self.read()
+        if versioned_payload is None:
+            return None
+        return json.loads(versioned_payload[1]) if versioned_payload[1] else {}
+
+
+class SharedBeaconsStore(SharedStateStore):
+    """ Shared memory store holding the beacons list as fixed-size binary records
+
+    Each record keeps the RSSI of up to MAX_RECORD_ADAPTERS adapters, the strongest ones.
+    """
+
+    MAX_RECORD_ADAPTERS = 4
+    _COUNT = struct.Struct("<I")
+    _RECORD = struct.Struct("<17s36sHHbh8s" + "8sh" * MAX_RECORD_ADAPTERS)
+
+    @classmethod
+    def create(cls, name, beacons_capacity, **kwargs):
+        capacity = cls._COUNT.size + beacons_capacity * cls._RECORD.size
+        return super(SharedBeaconsStore, cls).create(name, capacity, **kwargs)
+
+    @property
+    def beacons_capacity(self):
+        return (self.capacity - self._COUNT.size) // self._RECORD.size
+
+    def write_beacons_data(self, beacons_data_dict):
+        """ Packs the beacons list, already sorted from nearest, truncated to the store capacity """
+        beacons_list = beacons_data_dict.get('beacons_list') or []
+        beacons_list = beacons_list[:self.beacons_capacity]
+        payload = bytearray(self._COUNT.size + len(beacons_list) * self._RECORD.size)
+        self._COUNT.pack_into(payload, 0, len(beacons_list))
+        offset = self._COUNT.size
+        for beacon in beacons_list:
+            adapters_rssi = sorted(
+                (beacon.get('adapters_rssi') or {}).items(), key=lambda item: item[1], reverse=True)
+            adapters_fields = [b"", 0] * self.MAX_RECORD_ADAPTERS
+            for index, (adapter, rssi) in enumerate(adapters_rssi[:self.MAX_RECORD_ADAPTERS]):
+                adapters_fields[index * 2:index * 2 + 2] = str(adapter).encode(), rssi
+            self._RECORD.pack_into(
+                payload, offset,
+                str(beacon['mac_address']).encode(), str(beacon['uuid']).encode(),
+                beacon['major'], beacon['minor'], beacon['tx_power'], beacon['rssi'],
+                str(beacon.get('adapter') or "").encode(), *adapters_fields,
+            )
+            offset += self._RECORD.size
+        self.write(payload)
+
+    def read_beacons_data(self):
+        versioned_payload = self.read()
+        if versioned_payload is None:
+            return None
+        payload = versioned_payload[1]
+        beacons_count = self._COUNT.unpack_from(payload, 0)[0] if payload else 0
+        beacons_list = []
+        for mac_address, uuid, major, minor, tx_power, rssi, adapter, *adapters_fields in self._RECORD.iter_unpack(
+                payload[self._COUNT.size:self._COUNT.size + beacons_count * self._RECORD.size]):
+            adapter = adapter.rstrip(b"\0").decode()
+            beacons_list.append({
+                'mac_address': mac_address.rstrip(b"\0").decode(),
+                'uuid': uuid.rstrip(b"\0").decode(),
+                'major': major,
+                'minor': minor,
+                'tx_power': tx_power,
+                'rssi': rssi,
+                'adapter': adapter or None,
+                'adapters_rssi': {
+                    adapter_id.rstrip(b"\0").decode(): adapter_rssi
+                    for adapter_id, adapter_rssi in zip(adapters_fields[::2], adapters_fields[1::2])
+                    if adapter_id.rstrip(b"\0")
+                },
+            })
+        return {
+            'nearest_beacon': beacons_list[0] if beacons_list else None,
+            'beacons_list': beacons_list,
+        }
+
+
+# stores created or attached by this process, by name, used from the scanner, metrics and HTTP threads
+_shared_stores = {}
+_shared_stores_lock = Lock()
+
+
+def _reset_after_fork():
+    # a forked scanner owns none of the stores of its parent, and must unlink the ones it creates
+    global _shared_stores_lock
+    _shared_stores_lock = Lock()
+    _shared_stores.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def create_shared_store(store_class, name, *args, **kwargs):
+    """ Creates a store owned by this process, unlinked when the process exits """
+    with _shared_stores_lock:
+        # stores attached before do not unlink anything, the first one owned sets the unlinking up
+        if not any(shared_store.owner for shared_store in _shared_stores.values()):
+            atexit.register(_unlink_shared_stores_at_exit, os.getpid())
+        _shared_stores[name] = store_class.create(name, *args, **kwargs)
+        return _shared_stores[name]
+
+
+def get_shared_store(store_class, name, **kwargs):
+    """ Returns the store, attaching again when its owner replaced it, or None if missing """
+    with _shared_stores_lock:
+        shared_store = _shared_stores.get(name)
+        if shared_store and shared_store.closed:
+            shared_store.close()
+            del _shared_stores[name]
+            shared_store = None
+        if not shared_store:
+            try:
+                shared_store = store_class.attach(name, **kwargs)
+            except FileNotFoundError:
+                return None
+            _shared_stores[name] = shared_store
+        return shared_store
+
+
+def _unlink_shared_stores_at_exit(pid):
+    # forked processes inherit the exit handlers, they unlink their own stores with unlink_shared_stores()
+    if os.getpid() == pid:
+        unlink_shared_stores()
+
+
+def unlink_shared_stores():
+    """ Unlinks the stores owned by this process and closes the attached ones """
+    with _shared_stores_lock:
+        for shared_store in _shared_stores.values():
+            if shared_store.owner:
+                shared_store.unlink()
+            else:
+                shared_store.close()
+        _shared_stores.clear()
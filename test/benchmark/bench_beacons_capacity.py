@@ -0,0 +1,55 @@
+#!/usr/bin/python
+import json
+import time
+import heapq
+import random
+import tracemalloc
+
+from ibeacon_scanner.models import IBeacon, IBeaconWindow
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+# a crowded venue, far more beacons in range than the capacity
+BEACONS_COUNT = 10000
+ADVERTISEMENTS = 200000
+ADAPTERS = ("hci0", "hci1", "hci2")
+CAPACITIES = (None, 20, 200)
+
+
+def _advertisements(rnd):
+    # every beacon has its own mean rssi, a few are close and most are far
+    mean_rssis = [rnd.gauss(-85, 8) for _ in range(BEACONS_COUNT)]
+    advertisements = []
+    for _ in range(ADVERTISEMENTS):
+        number = rnd.randrange(BEACONS_COUNT)
+        advertisements.append(IBeacon(
+            f"c0:ff:ee:{number >> 16:02x}:{number >> 8 & 0xFF:02x}:{number & 0xFF:02x}", UUID, 1, number, -59,
+            round(mean_rssis[number] + rnd.gauss(0, 3)), rnd.choice(ADAPTERS)))
+    return advertisements
+
+
+def run_benchmarks():
+    advertisements = _advertisements(random.Random(0))
+    print(f"[ BENCH ] - {ADVERTISEMENTS} advertisements of {BEACONS_COUNT} beacons through the scan window")
+    for capacity in CAPACITIES:
+        tracemalloc.start()
+        beacons_window = IBeaconWindow(window=60, capacity=capacity)
+        started_at = time.perf_counter()
+        for now, beacon in enumerate(advertisements):
+            beacons_window.add(beacon, now * 1e-4)
+        add_seconds = time.perf_counter() - started_at
+        window_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        started_at = time.perf_counter()
+        beacons_list = heapq.nsmallest(
+            len(advertisements) if capacity is None else capacity, beacons_window.snapshot(len(advertisements) * 1e-4))
+        cycle_seconds = time.perf_counter() - started_at
+        body = json.dumps([beacon.to_json() for beacon in beacons_list], separators=(',', ':')).encode()
+        print(f"capacity {capacity or 'unbounded':>9}: {len(advertisements) / add_seconds:8.0f} adv/s, "
+            f"window {window_bytes / 1024:7.0f} KiB, snapshot and selection {cycle_seconds * 1000:6.2f} ms, "
+            f"{len(beacons_list):>5} beacons in {len(body):>7} bytes, overflow {beacons_window.overflow}, "
+            f"strongest {beacons_list[0].rssi} weakest {beacons_list[-1].rssi} dBm")
+
+
+if __name__ == "__main__":
+    run_benchmarks()
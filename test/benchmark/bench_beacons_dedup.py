@@ -0,0 +1,76 @@
+#!/usr/bin/python
+import random
+import timeit
+
+from ibeacon_scanner.models import IBeacon, IBeaconTable
+
+
+BEACONS_COUNTS = [10, 100, 1000]
+ADVERTISEMENTS_PER_BEACON = 10
+REPEAT = 5
+
+
+class _LegacyIBeacon:
+    """ Copy of the IBeacon record used before the keyed table, kept for comparison """
+
+    def __init__(self, mac_address="", uuid="", major=0, minor=0, tx_power=0, rssi=0):
+        self.mac_address = mac_address
+        self.uuid = uuid
+        self.major = major
+        self.minor = minor
+        self.tx_power = tx_power
+        self.rssi = rssi
+
+    def hash(self):
+        return hash(
+           str(self.mac_address) +
+           str(self.major) +
+           str(self.minor)
+        )
+
+    def __eq__(self, other):
+        if self.hash() == other.hash():
+            return True
+        return False
+
+
+def _build_advertisements(beacons_count):
+    advertisements = [
+        (f"aa:bb:cc:{n >> 16:02x}:{(n >> 8) & 0xff:02x}:{n & 0xff:02x}",
+         "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee", n // 100, n % 100, -59, random.randint(-100, -30))
+        for n in range(beacons_count)
+        for _ in range(ADVERTISEMENTS_PER_BEACON)
+    ]
+    random.shuffle(advertisements)
+    return advertisements
+
+
+def _dedup_legacy(advertisements):
+    beacons_list = []
+    for advertisement in advertisements:
+        beacon = _LegacyIBeacon(*advertisement)
+        if beacon not in beacons_list:
+            beacons_list.append(beacon)
+    return beacons_list
+
+
+def _dedup_keyed(advertisements):
+    beacons_table = IBeaconTable(keep_strongest=True)
+    for advertisement in advertisements:
+        beacons_table.add(IBeacon(*advertisement))
+    return beacons_table.beacons()
+
+
+def run_dedup_benchmark():
+    print(f"[ BENCH ] - Dedup of {ADVERTISEMENTS_PER_BEACON} advertisements per beacon, best of {REPEAT}")
+    print(f"{'beacons':>8} {'legacy list (ms)':>18} {'keyed table (ms)':>18} {'speedup':>9}")
+    for beacons_count in BEACONS_COUNTS:
+        advertisements = _build_advertisements(beacons_count)
+        assert len(_dedup_legacy(advertisements)) == len(_dedup_keyed(advertisements)) == beacons_count
+        legacy_time = min(timeit.repeat(lambda: _dedup_legacy(advertisements), number=1, repeat=REPEAT))
+        keyed_time = min(timeit.repeat(lambda: _dedup_keyed(advertisements), number=1, repeat=REPEAT))
+        print(f"{beacons_count:>8} {legacy_time * 1000:>18.3f} {keyed_time * 1000:>18.3f} {legacy_time / keyed_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    run_dedup_benchmark()
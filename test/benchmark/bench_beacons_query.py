@@ -0,0 +1,90 @@
+#!/usr/bin/python
+import json
+import time
+import random
+
+from ibeacon_scanner.query import BeaconsIndex
+
+
+BEACONS_COUNTS = (100, 1000, 10000)
+UUIDS = ("ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee", "11111111-2222-3333-4444-555555555555")
+MAJORS = 50
+# share of the beacons whose rssi changes from a cycle to the next, and that come or go
+RSSI_CHANGE_RATIO = 0.3
+CHURN_RATIO = 0.02
+CYCLES = 20
+QUERIES = (
+    ("top 5", {'limit': 5}),
+    ("major, rssi > -70", {'major': 11, 'min_rssi': -70}),
+    ("uuid, major, minor", {'uuid': UUIDS[1], 'major': 11, 'minor': 11}),
+    ("page of 100", {'limit': 100}),
+)
+
+
+def _beacon(rnd, number):
+    return {
+        'mac_address': f"c0:ff:ee:{number >> 16:02x}:{number >> 8 & 0xFF:02x}:{number & 0xFF:02x}",
+        'uuid': UUIDS[number % len(UUIDS)],
+        'major': number % MAJORS,
+        'minor': number,
+        'tx_power': -59,
+        'rssi': rnd.randint(-100, -40),
+        'adapter': "hci0",
+        'adapters_rssi': {},
+    }
+
+
+def _cycles(rnd, beacons_count):
+    """ Beacons data of consecutive scan cycles """
+    beacons = {number: _beacon(rnd, number) for number in range(beacons_count)}
+    next_number = beacons_count
+    cycles = []
+    for _ in range(CYCLES):
+        for number in rnd.sample(sorted(beacons), int(beacons_count * CHURN_RATIO)):
+            del beacons[number]
+            beacons[next_number] = _beacon(rnd, next_number)
+            next_number += 1
+        for number in rnd.sample(sorted(beacons), int(beacons_count * RSSI_CHANGE_RATIO)):
+            beacons[number] = dict(beacons[number], rssi=rnd.randint(-100, -40))
+        cycles.append(sorted(beacons.values(), key=lambda beacon: beacon['rssi'], reverse=True))
+    return cycles
+
+
+def _best_seconds(function, repeat=5):
+    best_seconds = float('inf')
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        best_seconds = min(best_seconds, time.perf_counter() - started_at)
+    return best_seconds
+
+
+def run_benchmarks():
+    rnd = random.Random(0)
+    print(f"[ BENCH ] - Beacons index over {CYCLES} cycles, {RSSI_CHANGE_RATIO:.0%} of rssi changes "
+        f"and {CHURN_RATIO:.0%} of beacons coming and going per cycle")
+    for beacons_count in BEACONS_COUNTS:
+        cycles = _cycles(rnd, beacons_count)
+        beacons_index = BeaconsIndex()
+        beacons_index.update(cycles[0])
+        started_at = time.perf_counter()
+        for version, beacons_list in enumerate(cycles[1:]):
+            beacons_index.update(beacons_list, version)
+        update_seconds = (time.perf_counter() - started_at) / (len(cycles) - 1)
+        rebuild_seconds = _best_seconds(lambda: BeaconsIndex().update(cycles[-1]))
+        full_body = json.dumps({'beacons_list': cycles[-1]}, separators=(',', ':')).encode()
+        full_seconds = _best_seconds(
+            lambda: json.dumps({'beacons_list': cycles[-1]}, separators=(',', ':')).encode())
+        print(f"{beacons_count:>5} beacons: update {update_seconds * 1000:.2f} ms per cycle "
+            f"(rebuild {rebuild_seconds * 1000:.2f} ms), whole beacons data {len(full_body)} bytes "
+            f"encoded in {full_seconds * 1000:.2f} ms")
+        for name, query in QUERIES:
+            beacons = beacons_index.query(**query)[0]
+            body = json.dumps({'beacons': beacons}, separators=(',', ':')).encode()
+            query_seconds = _best_seconds(
+                lambda: json.dumps({'beacons': beacons_index.query(**query)[0]}, separators=(',', ':')).encode())
+            print(f"      {name:>20}: {len(beacons):>4} beacons, {len(body):>6} bytes in {query_seconds * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+import time
+import random
+import logging
+import multiprocessing
+from threading import Thread
+
+import requests
+from flask import Flask
+from flask_restful import Api
+from werkzeug.serving import make_server
+
+from ibeacon_scanner.models import IBeacon
+from collector.models import GlobalBeaconIndex
+from collector.resources import collector_add_http_resources_to_api
+from collector.uploader import ReportUploader, encode_report
+
+
+COLLECTOR_PORT = 5099
+COLLECTOR_URL = f"http://127.0.0.1:{COLLECTOR_PORT}/collector"
+SCANNERS_COUNT = 8
+BEACONS_COUNT = 400
+# every scanner hears this share of the beacons of the other rooms
+OVERHEARD_RATIO = 0.3
+CYCLE_INTERVAL = 0.2
+UPLOAD_INTERVAL = 0.5
+DURATION = 10
+# scanners start uploading before the collector is up, so they back off and catch up
+COLLECTOR_START_DELAY = 2
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def _room(number):
+    """ Each beacon lives in one room, heard best by the scanner of that room """
+    return number % SCANNERS_COUNT
+
+
+def _scanner_process(scanner_number):
+    rnd = random.Random(scanner_number)
+    report_uploader = ReportUploader(
+        f"{COLLECTOR_URL}/reports", f"room-{scanner_number}",
+        interval=UPLOAD_INTERVAL, max_backoff=2, queue_size=DURATION * 10)
+    report_uploader.start()
+    heard_beacons = [number for number in range(BEACONS_COUNT)
+        if _room(number) == scanner_number or rnd.random() < OVERHEARD_RATIO]
+    started_at = time.monotonic()
+    while time.monotonic() - started_at < DURATION:
+        beacons_list = [
+            IBeacon(f"c0:ff:ee:00:{number >> 8:02x}:{number & 0xFF:02x}", UUID, 1, number, -59,
+                rnd.randint(-60, -45) if _room(number) == scanner_number else rnd.randint(-95, -70), "hci0")
+            for number in heard_beacons
+        ]
+        report_uploader.submit(beacons_list)
+        time.sleep(CYCLE_INTERVAL)
+    report_uploader.stop(timeout=10)
+
+
+def _start_collector():
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    application = Flask(__name__)
+    collector_add_http_resources_to_api(Api(application), prefix="/collector")
+    server = make_server("127.0.0.1", COLLECTOR_PORT, application, threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_benchmark():
+    print(f"[ BENCH ] - {SCANNERS_COUNT} scanner processes with {BEACONS_COUNT} beacons uploading "
+        f"a cycle every {CYCLE_INTERVAL}s for {DURATION}s, collector up after {COLLECTOR_START_DELAY}s")
+    scanner_processes = [
+        multiprocessing.Process(target=_scanner_process, args=(scanner_number,))
+        for scanner_number in range(SCANNERS_COUNT)
+    ]
+    for scanner_process in scanner_processes:
+        scanner_process.start()
+    time.sleep(COLLECTOR_START_DELAY)
+    server = _start_collector()
+    started_at = time.monotonic()
+    for scanner_process in scanner_processes:
+        scanner_process.join()
+    elapsed = time.monotonic() - started_at
+    scanners = requests.get(f"{COLLECTOR_URL}/scanners").json()
+    query_started_at = time.perf_counter()
+    beacons = requests.get(f"{COLLECTOR_URL}/beacons").json()
+    query_seconds = time.perf_counter() - query_started_at
+    server.shutdown()
+    reports = sum(scanner['reports'] for scanner in scanners.values())
+    readings = sum(scanner['readings'] for scanner in scanners.values())
+    expected_reports = SCANNERS_COUNT * DURATION / CYCLE_INTERVAL
+    print(f"ingested {reports} of about {expected_reports:.0f} reports from {len(scanners)} scanners, "
+        f"{readings / elapsed:.0f} readings/s")
+    best_scanner_hits = sum(beacon['best_scanner'] == f"room-{_room(beacon['minor'])}" for beacon in beacons)
+    print(f"global index: {len(beacons)} beacons, best scanner right for {best_scanner_hits}, "
+        f"listed in {query_seconds * 1000:.1f} ms")
+
+
+def run_index_benchmark():
+    rnd = random.Random(0)
+    global_beacon_index = GlobalBeaconIndex()
+    reports_by_scanner = {
+        f"room-{scanner_number}": [encode_report([
+            IBeacon(f"c0:ff:ee:00:{number >> 8:02x}:{number & 0xFF:02x}", UUID, 1, number, -59, rnd.randint(-95, -45), "hci0")
+            for number in range(BEACONS_COUNT)
+        ], time.time()) for _ in range(20)]
+        for scanner_number in range(SCANNERS_COUNT)
+    }
+    started_at = time.perf_counter()
+    for scanner_id, reports in reports_by_scanner.items():
+        global_beacon_index.ingest(scanner_id, reports)
+    elapsed = time.perf_counter() - started_at
+    readings = SCANNERS_COUNT * 20 * BEACONS_COUNT
+    print(f"[ BENCH ] - Global index ingest: {readings / elapsed:.0f} readings/s")
+
+
+if __name__ == "__main__":
+    run_index_benchmark()
+    run_benchmark()
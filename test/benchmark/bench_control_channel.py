@@ -0,0 +1,100 @@
+#!/usr/bin/python
+import time
+import random
+from threading import Thread, Event
+
+from persistance import read_local_cache_file, write_local_cache_file
+from ibeacon_scanner import services
+from ibeacon_scanner.control import ControlChannel
+
+
+IDLE_SECONDS = 3
+STOP_REPETITIONS = 3
+SCAN_TICK = 5
+FILEPATH_LEGACY_SETTINGS = "/local/storage/bench_legacy_scanner_settings.json"
+
+
+def _legacy_scanner_loop(stopped_event, finished_event):
+    """ Copy of the scanner loop that polled the settings file, kept for comparison """
+    while not finished_event.is_set():
+        scanner_settings = read_local_cache_file(filepath=FILEPATH_LEGACY_SETTINGS)
+        if scanner_settings['run_flag']:
+            stopped_event.clear()
+            time.sleep(scanner_settings['scan_tick'])
+        else:
+            stopped_event.set()
+
+
+class _InstrumentedControlChannel(ControlChannel):
+    """ Control channel that flags when the scanner loop goes idle """
+
+    stopped_event = Event()
+
+    def receive(self, timeout=None):
+        if timeout is None:
+            self.stopped_event.set()
+        else:
+            self.stopped_event.clear()
+        return super(_InstrumentedControlChannel, self).receive(timeout)
+
+
+def _measure_idle_cpu(stopped_event):
+    stopped_event.wait()
+    cpu_before = time.process_time()
+    time.sleep(IDLE_SECONDS)
+    return (time.process_time() - cpu_before) / IDLE_SECONDS * 100
+
+
+def _measure_stop_latency(start_scanner, stop_scanner, stopped_event):
+    latencies = []
+    for _ in range(STOP_REPETITIONS):
+        start_scanner()
+        time.sleep(random.uniform(0.5, SCAN_TICK - 0.5))
+        stopped_event.clear()
+        stop_requested_at = time.monotonic()
+        stop_scanner()
+        stopped_event.wait()
+        latencies.append(time.monotonic() - stop_requested_at)
+    return max(latencies), sum(latencies) / len(latencies)
+
+
+def run_legacy_benchmark():
+    stopped_event, finished_event = Event(), Event()
+    scanner_settings = {'uuid_filter': "", 'scan_tick': SCAN_TICK, 'run_flag': False, 'fake_scan': True}
+    write_local_cache_file(filepath=FILEPATH_LEGACY_SETTINGS, data_dict=scanner_settings)
+    legacy_thread = Thread(target=_legacy_scanner_loop, args=(stopped_event, finished_event), daemon=True)
+    legacy_thread.start()
+    idle_cpu = _measure_idle_cpu(stopped_event)
+    def _set_run_flag(run_flag):
+        write_local_cache_file(filepath=FILEPATH_LEGACY_SETTINGS, data_dict=dict(scanner_settings, run_flag=run_flag))
+    max_latency, mean_latency = _measure_stop_latency(
+        lambda: _set_run_flag(True), lambda: _set_run_flag(False), stopped_event)
+    finished_event.set()
+    legacy_thread.join()
+    return idle_cpu, max_latency, mean_latency
+
+
+def run_control_channel_benchmark():
+    stopped_event = _InstrumentedControlChannel.stopped_event
+    services.ControlChannel = _InstrumentedControlChannel
+    Thread(target=services.ibeacon_init_scanner, daemon=True).start()
+    time.sleep(1)
+    original_settings = services.ibeacon_get_scanner_settings()
+    services.ibeacon_set_scanner_settings(scan_tick=SCAN_TICK, fake_scan=True, continuous_scan=False, run_flag=False)
+    idle_cpu = _measure_idle_cpu(stopped_event)
+    max_latency, mean_latency = _measure_stop_latency(
+        services.ibeacon_start_scanner, services.ibeacon_stop_scanner, stopped_event)
+    services.ibeacon_set_scanner_settings(**original_settings)
+    return idle_cpu, max_latency, mean_latency
+
+
+def run_benchmarks():
+    print(f"[ BENCH ] - Idle CPU over {IDLE_SECONDS}s and stop latency with scan_tick={SCAN_TICK}s")
+    print(f"{'loop':>16} {'idle cpu (%)':>13} {'max stop (s)':>13} {'mean stop (s)':>14}")
+    for loop_name, benchmark in (("polling file", run_legacy_benchmark), ("control channel", run_control_channel_benchmark)):
+        idle_cpu, max_latency, mean_latency = benchmark()
+        print(f"{loop_name:>16} {idle_cpu:>13.1f} {max_latency:>13.3f} {mean_latency:>14.3f}")
+
+
+if __name__ == "__main__":
+    run_benchmarks()
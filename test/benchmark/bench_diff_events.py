@@ -0,0 +1,76 @@
+#!/usr/bin/python
+import json
+import random
+
+from ibeacon_scanner.models import IBeacon
+from ibeacon_scanner.diff import IBeaconDiffEngine
+from ibeacon_scanner.events import IBeaconChange, IBeaconRead
+from ibeacon_scanner.services import _render_beacons_data
+from config import RSSI_MOVE_THRESHOLD
+
+
+BEACONS_COUNT = 10
+SNAPSHOTS = 1200
+SNAPSHOT_INTERVAL = 0.5
+RSSI_JITTER = 2
+EXIT_PROBABILITY = 0.01
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def _simulate_snapshots(seed=0):
+    """ Beacons at a fixed distance with gaussian RSSI jitter, the two nearest ones of similar strength """
+    rnd = random.Random(seed)
+    base_rssis = [-60, -61] + [rnd.randint(-95, -70) for _ in range(BEACONS_COUNT - 2)]
+    present = [True] * BEACONS_COUNT
+    for _ in range(SNAPSHOTS):
+        beacons_list = []
+        for index, base_rssi in enumerate(base_rssis):
+            # now and then a far beacon goes out of range or comes back
+            if index >= 2 and rnd.random() < EXIT_PROBABILITY:
+                present[index] = not present[index]
+            if present[index]:
+                rssi = round(rnd.gauss(base_rssi, RSSI_JITTER))
+                beacons_list.append(IBeacon(f"00:00:{index:02d}", UUID, 1, index, -59, rssi))
+        yield sorted(beacons_list)
+
+
+def _event_size(event):
+    return len(json.dumps(event.to_json(), default=str))
+
+
+def _legacy_events(snapshots):
+    """ Events published by the former snapshot comparison """
+    last_beacons_list = []
+    for beacons_list in snapshots:
+        # the former snapshot comparison took the strongest beacon of each cycle as the nearest
+        beacons_data_dict = _render_beacons_data(beacons_list, beacons_list[0] if beacons_list else None)
+        if bool(last_beacons_list) != bool(beacons_list) or \
+                (beacons_list and last_beacons_list[0].key != beacons_list[0].key):
+            yield IBeaconChange(beacons_data_dict["nearest_beacon"])
+        if beacons_list and beacons_list != last_beacons_list:
+            yield IBeaconRead(beacons_data_dict)
+        last_beacons_list = beacons_list
+
+
+def _diff_events(snapshots):
+    diff_engine = IBeaconDiffEngine(rssi_threshold=RSSI_MOVE_THRESHOLD)
+    for index, beacons_list in enumerate(snapshots):
+        yield from diff_engine.update(beacons_list, now=index * SNAPSHOT_INTERVAL)
+
+
+def run_benchmarks():
+    print(f"[ BENCH ] - {SNAPSHOTS} snapshots of {BEACONS_COUNT} beacons with {RSSI_JITTER} dB RSSI deviation")
+    print(f"{'publisher':>10} {'events':>8} {'bytes':>10} {'nearest changes':>16}")
+    results = {}
+    for name, events_source in (("snapshot", _legacy_events), ("diff", _diff_events)):
+        events = list(events_source(_simulate_snapshots()))
+        nearest_changes = sum(isinstance(event, IBeaconChange) for event in events)
+        results[name] = (len(events), sum(map(_event_size, events)))
+        print(f"{name:>10} {len(events):>8} {results[name][1]:>10} {nearest_changes:>16}")
+    events_reduction = 100 - results["diff"][0] / results["snapshot"][0] * 100
+    bytes_reduction = 100 - results["diff"][1] / results["snapshot"][1] * 100
+    print(f"Reduction: {events_reduction:.1f}% events, {bytes_reduction:.1f}% bytes")
+
+
+if __name__ == "__main__":
+    run_benchmarks()
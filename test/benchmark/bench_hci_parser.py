@@ -0,0 +1,108 @@
+#!/usr/bin/python
+import time
+import random
+import struct
+
+from ahocorapy.keywordtree import KeywordTree
+from beacontools import parse_packet, IBeaconFilter, IBeaconAdvertisement
+from beacontools.const import MANUFACTURER_SPECIFIC_DATA_TYPE, IBEACON_MANUFACTURER_ID, IBEACON_PROXIMITY_TYPE
+from beacontools.utils import bt_addr_to_string, bin_to_int
+
+from ibeacon_scanner.hci import IBeaconReportParser, IBEACON_PREFIX
+
+
+UUID_FILTER = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+CORPUS_SIZE = 20000
+REPEAT = 5
+FLAGS = b"\x02\x01\x06"
+# share of each kind of advertisement in the corpus, a gateway mostly hears phones
+CORPUS_MIX = (
+    ("ibeacon", 0.2),
+    ("ibeacon_other_uuid", 0.1),
+    ("eddystone", 0.1),
+    ("apple_continuity", 0.4),
+    ("named_device", 0.2),
+)
+
+
+def _advertising_report(rnd, payload):
+    """ HCI LE advertising report event with a single report """
+    address = bytes(rnd.getrandbits(8) for _ in range(6))
+    report = bytes([0x00, 0x01]) + address + bytes([len(payload)]) + payload + struct.pack("b", rnd.randint(-100, -30))
+    return bytes([0x04, 0x3E, len(report) + 2, 0x02, 0x01]) + report
+
+
+def _advertisement_payload(rnd, kind):
+    if kind in ("ibeacon", "ibeacon_other_uuid"):
+        beacon_uuid = bytes.fromhex(UUID_FILTER.replace("-", "")) if kind == "ibeacon" else rnd.randbytes(16)
+        return FLAGS + IBEACON_PREFIX + beacon_uuid + struct.pack(">HHb", rnd.randint(0, 65535), rnd.randint(0, 65535), -59)
+    if kind == "eddystone":
+        return FLAGS + b"\x03\x03\xaa\xfe" + b"\x17\x16\xaa\xfe\x00\xe7" + rnd.randbytes(16) + b"\x00\x00"
+    if kind == "apple_continuity":
+        return FLAGS + b"\x0a\xff\x4c\x00\x10\x05" + rnd.randbytes(4)
+    return FLAGS + b"\x09\x09" + b"device-" + bytes([0x30 + rnd.randint(0, 9)])
+
+
+def load_corpus(seed=0):
+    rnd = random.Random(seed)
+    kinds, weights = zip(*CORPUS_MIX)
+    return [
+        _advertising_report(rnd, _advertisement_payload(rnd, kind))
+        for kind in rnd.choices(kinds, weights, k=CORPUS_SIZE)
+    ]
+
+
+class _BeacontoolsParser:
+    """ Same steps beacontools' monitor takes for each packet with an iBeacon device filter """
+
+    def __init__(self, uuid_filter):
+        self.device_filter = IBeaconFilter(uuid=uuid_filter) if uuid_filter else None
+        self.kwtree = KeywordTree()
+        self.kwtree.add(bytes([MANUFACTURER_SPECIFIC_DATA_TYPE]) + IBEACON_MANUFACTURER_ID + IBEACON_PROXIMITY_TYPE)
+        self.kwtree.finalize()
+
+    def parse(self, pkt):
+        payload = pkt[14:-1]
+        if not self.kwtree.search(payload):
+            return None
+        bt_addr = bt_addr_to_string(pkt[7:13])
+        rssi = bin_to_int(pkt[-1])
+        packet = parse_packet(payload)
+        if not isinstance(packet, IBeaconAdvertisement):
+            return None
+        if self.device_filter and not self.device_filter.matches(packet.properties):
+            return None
+        return bt_addr, packet.uuid, packet.major, packet.minor, packet.tx_power, rssi
+
+
+def _measure(parser, corpus):
+    parse = parser.parse
+    best_seconds = float("inf")
+    for _ in range(REPEAT):
+        started_at = time.perf_counter()
+        for packet in corpus:
+            parse(packet)
+        best_seconds = min(best_seconds, time.perf_counter() - started_at)
+    return len(corpus) / best_seconds
+
+
+def run_benchmarks():
+    corpus = load_corpus()
+    print(f"[ BENCH ] - {CORPUS_SIZE} HCI advertising reports, mix: {', '.join(f'{k} {w:.0%}' for k, w in CORPUS_MIX)}")
+    for uuid_filter in (UUID_FILTER, None):
+        beacontools_parser, raw_parser = _BeacontoolsParser(uuid_filter), IBeaconReportParser(uuid_filter)
+        # both paths must decode the same beacons
+        beacontools_results = [beacontools_parser.parse(packet) for packet in corpus]
+        raw_results = [raw_parser.parse(packet) for packet in corpus]
+        assert beacontools_results == raw_results, "raw HCI parser differs from beacontools"
+        matches = sum(1 for result in raw_results if result)
+        beacontools_rate, raw_rate = _measure(beacontools_parser, corpus), _measure(raw_parser, corpus)
+        print(
+            f"uuid filter {'on ' if uuid_filter else 'off'} ({matches} matches): "
+            f"beacontools {beacontools_rate:>9.0f} pkt/s, raw hci {raw_rate:>10.0f} pkt/s, "
+            f"{raw_rate / beacontools_rate:.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+import os
+import time
+import random
+
+from ibeacon_scanner.models import IBeacon
+from ibeacon_scanner.history import BeaconHistoryStore, query_history
+
+
+FILEPATH_HISTORY = "/local/storage/bench_history.sqlite3"
+BEACONS_COUNT = 1000
+CYCLES = 120
+# a cycle every half second during one minute
+CYCLE_INTERVAL = 0.5
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def _remove_history():
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(FILEPATH_HISTORY + suffix):
+            os.remove(FILEPATH_HISTORY + suffix)
+
+
+def _beacons_list(rnd):
+    return [
+        IBeacon(f"c0:ff:ee:00:{number >> 8:02x}:{number & 0xFF:02x}", UUID, 1, number, -59, rnd.randint(-100, -40), "hci0")
+        for number in range(BEACONS_COUNT)
+    ]
+
+
+def run_benchmarks():
+    _remove_history()
+    rnd = random.Random(0)
+    cycles = [_beacons_list(rnd) for _ in range(CYCLES)]
+    readings = BEACONS_COUNT * CYCLES
+    print(f"[ BENCH ] - History of {CYCLES} cycles of {BEACONS_COUNT} beacons, {readings} readings")
+    history_store = BeaconHistoryStore(FILEPATH_HISTORY, flush_interval=1.0, queue_size=readings)
+    started_at = time.time() - CYCLES * CYCLE_INTERVAL
+    append_seconds = 0
+    for cycle, beacons_list in enumerate(cycles):
+        append_started_at = time.perf_counter()
+        history_store.append(beacons_list, now=started_at + cycle * CYCLE_INTERVAL)
+        append_seconds += time.perf_counter() - append_started_at
+    print(f"append from the scan loop: {append_seconds / CYCLES * 1000:.3f} ms per cycle")
+    # the writer flushes everything queued at once when it starts, then stops
+    write_started_at = time.perf_counter()
+    history_store.start()
+    history_store.stop()
+    write_seconds = time.perf_counter() - write_started_at
+    print(f"background write: {readings / write_seconds:.0f} readings/s, {os.path.getsize(FILEPATH_HISTORY)} bytes")
+    for resolution, kwargs in (("raw", {'mac_address': "c0:ff:ee:00:01:f4", 'major': 1, 'minor': 500}),
+            ("raw", {'since': started_at + 10, 'until': started_at + 11}),
+            ("minute", {'mac_address': "c0:ff:ee:00:01:f4", 'major': 1, 'minor': 500})):
+        query_started_at = time.perf_counter()
+        history = query_history(FILEPATH_HISTORY, resolution=resolution, **kwargs)
+        query_seconds = time.perf_counter() - query_started_at
+        print(f"query {resolution:>6} {', '.join(kwargs)}: {len(history)} rows in {query_seconds * 1000:.2f} ms")
+    _remove_history()
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+import time
+
+import numpy as np
+
+from ibeacon_scanner.models import IBeacon
+from ibeacon_scanner.positioning import PositioningEngine, calibrate_path_loss
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+TX_POWER = -59
+# a 20 x 20 meters room with a scanner at each corner and one in the middle
+SCANNER_POSITIONS = {
+    'hci0': {'x': 0, 'y': 0},
+    'hci1': {'x': 20, 'y': 0},
+    'hci2': {'x': 0, 'y': 20},
+    'hci3': {'x': 20, 'y': 20},
+    'hci4': {'x': 10, 'y': 10},
+}
+ROOM_SIZE = 20
+# path loss of the simulated environment, unknown to an uncalibrated engine
+PATH_LOSS_EXPONENT = 2.7
+RSSI_OFFSET = 4
+RSSI_NOISE = 2.0
+# readings lost by each scanner
+PACKET_LOSS = 0.1
+TAGS_COUNTS = (100, 500, 2000)
+CYCLES = 20
+BUDGET = 0.02
+
+
+def _rssi(rng, distances):
+    path_loss = 10 * PATH_LOSS_EXPONENT * np.log10(np.maximum(distances, 0.1))
+    return TX_POWER - path_loss - RSSI_OFFSET + rng.normal(0, RSSI_NOISE, np.shape(distances))
+
+
+def _tags(rng, tags_count):
+    anchors = np.array([[scanner['x'], scanner['y']] for scanner in SCANNER_POSITIONS.values()])
+    positions = rng.uniform(0, ROOM_SIZE, (tags_count, 2))
+    rssis = _rssi(rng, np.linalg.norm(positions[:, None, :] - anchors[None, :, :], axis=2)).round()
+    heard = rng.random(rssis.shape) >= PACKET_LOSS
+    beacons_list = []
+    for number in range(tags_count):
+        adapters_rssi = {
+            adapter: rssis[number, column] for column, adapter in enumerate(SCANNER_POSITIONS) if heard[number, column]
+        }
+        adapter = max(adapters_rssi, key=adapters_rssi.get, default='hci0')
+        beacons_list.append(IBeacon(
+            f"c0:ff:ee:00:{number >> 8:02x}:{number & 0xFF:02x}", UUID, 1, number, TX_POWER,
+            adapters_rssi.get(adapter, -100), adapter, adapters_rssi))
+    return positions, beacons_list
+
+
+def _position_errors(engine, positions, beacons_list):
+    engine.update(beacons_list)
+    solved_positions = {(position['minor']): position for position in engine.snapshot()}
+    errors = [
+        np.hypot(solved_positions[number]['x'] - x, solved_positions[number]['y'] - y)
+        for number, (x, y) in enumerate(positions) if solved_positions[number]['x'] is not None
+    ]
+    return np.array(errors), len(positions) - len(errors)
+
+
+def run_accuracy_benchmark(rng):
+    # calibration readings taken by one scanner at known distances
+    distances = np.repeat([0.5, 1, 2, 4, 8, 16], 20)
+    calibration = calibrate_path_loss(distances, _rssi(rng, distances), [TX_POWER] * len(distances))
+    print(f"[ BENCH ] - Calibration of exponent {PATH_LOSS_EXPONENT} and offset {RSSI_OFFSET} with "
+        f"{RSSI_NOISE} dB of noise: exponent {calibration['path_loss_exponent']:.2f}, offset {calibration['rssi_offset']:.2f}")
+    positions, beacons_list = _tags(rng, 1000)
+    for name, engine in (
+            ("uncalibrated", PositioningEngine(SCANNER_POSITIONS, budget=float('inf'))),
+            ("calibrated", PositioningEngine(SCANNER_POSITIONS, budget=float('inf'), **calibration))):
+        errors, unsolved = _position_errors(engine, positions, beacons_list)
+        print(f"{name:>12}: error median {np.median(errors):.2f} m, p90 {np.percentile(errors, 90):.2f} m, "
+            f"max {errors.max():.2f} m, {unsolved} tags heard by less than 3 scanners")
+
+
+def run_throughput_benchmark(rng):
+    print(f"[ BENCH ] - Positioning throughput with a budget of {BUDGET * 1000:.0f} ms per cycle")
+    for tags_count in TAGS_COUNTS:
+        _, beacons_list = _tags(rng, tags_count)
+        engine = PositioningEngine(SCANNER_POSITIONS, budget=BUDGET)
+        solved, cycle_seconds = 0, []
+        for _ in range(CYCLES):
+            started_at = time.perf_counter()
+            solved += engine.update(beacons_list)
+            cycle_seconds.append(time.perf_counter() - started_at)
+        print(f"{tags_count:>5} tags: {solved / sum(cycle_seconds):.0f} tags/s, "
+            f"cycle p50 {np.median(cycle_seconds) * 1000:.2f} ms, max {max(cycle_seconds) * 1000:.2f} ms, "
+            f"{solved / CYCLES:.0f} tags solved per cycle")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    run_accuracy_benchmark(rng)
+    run_throughput_benchmark(rng)
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+import time
+import uuid
+import random
+
+from ibeacon_scanner.prefilter import BeaconPrefilter, parse_filter_rules, ANY_UUID
+
+
+RULES_COUNTS = (1, 10, 100, 1000, 10000)
+ADVERTISEMENTS = 20000
+REPEAT = 5
+# the linear scan is only measured up to this number of rules, it gets too slow beyond
+MAX_LINEAR_RULES = 1000
+
+
+class _LinearPrefilter:
+    """ Every rule checked one after the other, the straightforward way to apply a list of rules """
+
+    def __init__(self, uuid_filter):
+        self._rules = parse_filter_rules(uuid_filter)
+
+    def match(self, beacon_uuid, major, minor):
+        for rule_uuid, (major_low, major_high), (minor_low, minor_high) in self._rules:
+            if (rule_uuid == ANY_UUID or rule_uuid == beacon_uuid) and major_low <= major <= major_high \
+                    and minor_low <= minor <= minor_high:
+                return True
+        return False
+
+
+def _uuid(rnd):
+    return str(uuid.UUID(int=rnd.getrandbits(128)))
+
+
+def _uuid_rules(rnd, rules_count):
+    """ Whole UUIDs accepted, like one UUID per customer site """
+    return [_uuid(rnd) for _ in range(rules_count)]
+
+
+def _range_rules(rnd, rules_count):
+    """ Major and minor ranges of a few UUIDs, like a block of tags per floor of a building """
+    uuids = [_uuid(rnd) for _ in range(max(1, rules_count // 100))]
+    rules = []
+    for _ in range(rules_count):
+        major = rnd.randrange(0, 0xFFFF - 10)
+        minor = rnd.randrange(0, 0xFFFF - 1000)
+        rules.append({'uuid': rnd.choice(uuids), 'major': [major, major + 10], 'minor': [minor, minor + 1000]})
+    return rules
+
+
+def _advertisements(rnd, rules, hit):
+    """ Advertisements accepted by some rule if hit, or of unknown beacons otherwise """
+    advertisements = []
+    for _ in range(ADVERTISEMENTS):
+        if not hit:
+            advertisements.append((_uuid(rnd), rnd.randrange(0x10000), rnd.randrange(0x10000)))
+            continue
+        rule = rnd.choice(rules)
+        if isinstance(rule, str):
+            advertisements.append((rule, rnd.randrange(0x10000), rnd.randrange(0x10000)))
+        else:
+            advertisements.append((rule['uuid'], rnd.randint(*rule['major']), rnd.randint(*rule['minor'])))
+    return advertisements
+
+
+def _measure(prefilter, advertisements):
+    """ Best nanoseconds per advertisement checked """
+    best_seconds = float('inf')
+    for _ in range(REPEAT):
+        started_at = time.perf_counter()
+        for advertisement in advertisements:
+            prefilter.match(*advertisement)
+        best_seconds = min(best_seconds, time.perf_counter() - started_at)
+    return best_seconds / len(advertisements) * 1e9
+
+
+def run_benchmarks():
+    rnd = random.Random(0)
+    print(f"[ BENCH ] - ns per advertisement checked by the prefilter, best of {REPEAT} runs of {ADVERTISEMENTS}")
+    for kind, rules_factory in (("uuids", _uuid_rules), ("ranges", _range_rules)):
+        for rules_count in RULES_COUNTS:
+            rules = rules_factory(rnd, rules_count)
+            started_at = time.perf_counter()
+            prefilter = BeaconPrefilter(rules)
+            compile_seconds = time.perf_counter() - started_at
+            line = f"{kind:>6} {rules_count:>5} rules, compiled in {compile_seconds * 1000:7.2f} ms:"
+            for hit in (True, False):
+                advertisements = _advertisements(rnd, rules, hit)
+                assert all(prefilter.match(*advertisement) == hit for advertisement in advertisements), \
+                    "prefilter disagrees with the rules"
+                line += f" {'hit' if hit else 'miss'} {_measure(prefilter, advertisements):6.0f} ns"
+                if rules_count <= MAX_LINEAR_RULES:
+                    line += f" (linear {_measure(_LinearPrefilter(rules), advertisements):8.0f} ns)"
+            print(line)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
@@ -0,0 +1,64 @@
+#!/usr/bin/python
+import os
+import time
+import random
+from threading import Event
+
+from ibeacon_scanner.models import IBeacon, IBeaconWindow
+from ibeacon_scanner.smoothing import RssiSmoother
+from ibeacon_scanner.capture import CaptureWriter
+from ibeacon_scanner.backends import ReplayBeaconScanner
+
+
+FILEPATH_CAPTURE = "/local/storage/bench_replay.ibcap"
+BEACONS_COUNT = 200
+ADVERTISEMENTS = 100000
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def _write_capture():
+    if os.path.exists(FILEPATH_CAPTURE):
+        os.remove(FILEPATH_CAPTURE)
+    rnd = random.Random(0)
+    capture_writer = CaptureWriter(FILEPATH_CAPTURE)
+    for _ in range(ADVERTISEMENTS):
+        beacon_number = rnd.randrange(BEACONS_COUNT)
+        capture_writer.write_advertisement(
+            f"hci{beacon_number % 2}", f"c0:ff:ee:00:{beacon_number >> 8:02x}:{beacon_number & 0xFF:02x}",
+            UUID, 1, beacon_number, -59, rnd.randint(-100, -40))
+    capture_writer.close()
+    return os.path.getsize(FILEPATH_CAPTURE)
+
+
+def _replay(callback):
+    """ Replays the capture once at max speed and returns advertisements per second """
+    replayed_event = Event()
+    def _counting_callback(*advertisement):
+        callback(*advertisement)
+        if replay_backend.replayed == ADVERTISEMENTS:
+            replayed_event.set()
+    replay_backend = ReplayBeaconScanner(_counting_callback, FILEPATH_CAPTURE, uuid_filter=UUID, speed=0)
+    started_at = time.perf_counter()
+    replay_backend.start()
+    replayed_event.wait()
+    elapsed = time.perf_counter() - started_at
+    replay_backend.stop()
+    return ADVERTISEMENTS / elapsed
+
+
+def run_benchmarks():
+    capture_size = _write_capture()
+    print(f"[ BENCH ] - Replay of {ADVERTISEMENTS} advertisements of {BEACONS_COUNT} beacons at max speed")
+    print(f"Capture size: {capture_size} bytes, {capture_size / ADVERTISEMENTS:.1f} bytes per advertisement")
+    beacons_window, rssi_smoother = IBeaconWindow(), RssiSmoother()
+    def _scanner_callback(adapter, mac_address, uuid, major, minor, tx_power, rssi):
+        beacon = IBeacon(mac_address, uuid, major, minor, tx_power, rssi, adapter)
+        beacons_window.add(beacon)
+        rssi_smoother.add(beacon)
+    for name, callback in (("decode only", lambda *advertisement: None), ("scanner callback", _scanner_callback)):
+        print(f"{name:>17}: {_replay(callback):>9.0f} advertisements/s")
+    os.remove(FILEPATH_CAPTURE)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
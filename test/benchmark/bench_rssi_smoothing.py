@@ -0,0 +1,99 @@
+#!/usr/bin/python
+import time
+import random
+import statistics
+from collections import deque
+
+from ibeacon_scanner.models import IBeacon
+from ibeacon_scanner.smoothing import RssiSmoother, SMOOTHING_METHODS
+
+
+BEACONS_COUNTS = [100, 1000, 5000]
+ADVERTISEMENTS_PER_BEACON = 10
+SAMPLES = 8
+SNAPSHOTS = 5
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+class _PythonRssiSmoother:
+    """ Same filters computed beacon by beacon over deques, kept for comparison """
+
+    def __init__(self, method, samples=SAMPLES, ema_alpha=0.3, kalman_process_noise=0.1, kalman_measurement_noise=4.0):
+        self.method = method
+        self.samples = samples
+        self.ema_alpha = ema_alpha
+        self.kalman_process_noise = kalman_process_noise
+        self.kalman_measurement_noise = kalman_measurement_noise
+        self._buffers = {}
+
+    def add(self, beacon):
+        buffer = self._buffers.get(beacon.key)
+        if buffer is None:
+            buffer = self._buffers[beacon.key] = deque(maxlen=self.samples)
+        buffer.append(beacon.rssi)
+
+    def _filter(self, samples):
+        if self.method == "median":
+            return statistics.median(samples)
+        if self.method == "kalman":
+            estimate, covariance = samples[0], self.kalman_measurement_noise
+            for sample in samples[1:]:
+                covariance += self.kalman_process_noise
+                gain = covariance / (covariance + self.kalman_measurement_noise)
+                estimate += gain * (sample - estimate)
+                covariance *= 1 - gain
+            return estimate
+        weights = [(1 - self.ema_alpha) ** age for age in range(len(samples) - 1, -1, -1)]
+        return sum(w * s for w, s in zip(weights, samples)) / sum(weights)
+
+    def smooth(self, beacons_list):
+        return [
+            IBeacon(b.mac_address, b.uuid, b.major, b.minor, b.tx_power,
+                round(self._filter(list(self._buffers[b.key]))))
+            for b in beacons_list
+        ]
+
+
+def _advertisements(beacons_count, seed=0):
+    rnd = random.Random(seed)
+    beacons_list = [IBeacon(f"{i:012x}", UUID, i // 65536, i % 65536, -59, -70) for i in range(beacons_count)]
+    advertisements = [
+        IBeacon(b.mac_address, b.uuid, b.major, b.minor, b.tx_power, round(rnd.gauss(-70, 4)))
+        for _ in range(ADVERTISEMENTS_PER_BEACON) for b in beacons_list
+    ]
+    rnd.shuffle(advertisements)
+    return beacons_list, advertisements
+
+
+def _measure(smoother, beacons_list, advertisements):
+    """ Seconds to ingest one snapshot interval of advertisements, and to filter them """
+    add_seconds, smooth_seconds = 0.0, 0.0
+    for _ in range(SNAPSHOTS):
+        started_at = time.perf_counter()
+        for beacon in advertisements:
+            smoother.add(beacon)
+        added_at = time.perf_counter()
+        smoother.smooth(beacons_list)
+        add_seconds += added_at - started_at
+        smooth_seconds += time.perf_counter() - added_at
+    return add_seconds / SNAPSHOTS, smooth_seconds / SNAPSHOTS
+
+
+def run_benchmarks():
+    print(f"[ BENCH ] - {ADVERTISEMENTS_PER_BEACON} advertisements per beacon and snapshot, {SAMPLES} samples per beacon")
+    print(f"{'beacons':>8} {'method':>7} {'python add':>11} {'python filter':>14} {'numpy add':>10} {'numpy filter':>13} {'speedup':>8} {'numpy adv/s':>12}")
+    for beacons_count in BEACONS_COUNTS:
+        beacons_list, advertisements = _advertisements(beacons_count)
+        for method in SMOOTHING_METHODS:
+            python_add, python_smooth = _measure(_PythonRssiSmoother(method), beacons_list, advertisements)
+            numpy_add, numpy_smooth = _measure(RssiSmoother(method, samples=SAMPLES), beacons_list, advertisements)
+            speedup = (python_add + python_smooth) / (numpy_add + numpy_smooth)
+            throughput = len(advertisements) / (numpy_add + numpy_smooth)
+            print(
+                f"{beacons_count:>8} {method:>7} {python_add * 1000:>9.1f}ms {python_smooth * 1000:>12.1f}ms "
+                f"{numpy_add * 1000:>8.1f}ms {numpy_smooth * 1000:>11.1f}ms {speedup:>7.1f}x {throughput:>12.0f}"
+            )
+
+
+if __name__ == "__main__":
+    run_benchmarks()
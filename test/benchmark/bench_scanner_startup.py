@@ -0,0 +1,87 @@
+#!/usr/bin/python
+""" Time from the launch of the scanner to its first published scan, run with FAKE_SCAN on
+
+Compares the former launch of a new interpreter with the supervised scanner forked
+from an already loaded process, and spawned, as any start method other than fork does.
+"""
+import os
+import sys
+import time
+import subprocess
+import statistics
+
+from ibeacon_scanner.services import ibeacon_init_scanner, ibeacon_get_beacons_data, BEACONS_DATA_SHM
+from ibeacon_scanner.supervisor import ScannerSupervisor
+from persistance.shared_memory import _REATTACH_CHECK_INTERVAL
+
+
+LOCK_FILEPATH = "/tmp/bench_scanner_startup.lock"
+REPEAT = 5
+POLL_INTERVAL = 0.005
+FIRST_SCAN_TIMEOUT = 30
+
+
+def _wait_first_scan(started_at):
+    """ Seconds until beacons data holds a beacon read by the scanner """
+    while time.monotonic() - started_at < FIRST_SCAN_TIMEOUT:
+        beacons_list = (ibeacon_get_beacons_data() or {}).get('beacons_list') or []
+        if any(beacon['mac_address'] for beacon in beacons_list):
+            return time.monotonic() - started_at
+        time.sleep(POLL_INTERVAL)
+    raise TimeoutError("The scanner did not publish any beacon, is FAKE_SCAN on?")
+
+
+def _wait_scanner_gone():
+    """ Waits until the segment of the last scanner is removed and readers noticed it """
+    while os.path.exists(f"/dev/shm/{BEACONS_DATA_SHM}"):
+        time.sleep(POLL_INTERVAL)
+    # a scanner killed without unlinking can not mark its segment as closed
+    time.sleep(_REATTACH_CHECK_INTERVAL)
+
+
+def _measure_interpreter():
+    started_at = time.monotonic()
+    # stops on SIGTERM, the scanner unlinks its shared memory stores on its way out
+    process = subprocess.Popen([sys.executable, "-c", "import signal, sys\n"
+        "signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))\n"
+        "from ibeacon_scanner.services import ibeacon_init_scanner\n"
+        "ibeacon_init_scanner()"])
+    try:
+        return _wait_first_scan(started_at), None
+    finally:
+        process.terminate()
+        process.wait()
+        _wait_scanner_gone()
+
+
+def _measure_supervised(start_method):
+    scanner_supervisor = ScannerSupervisor(ibeacon_init_scanner, LOCK_FILEPATH, start_method=start_method)
+    started_at = time.monotonic()
+    scanner_supervisor.start()
+    try:
+        first_scan_seconds = _wait_first_scan(started_at)
+        # the heartbeat of the first scan comes right before the supervisor checks it
+        while scanner_supervisor.first_scan_seconds is None:
+            time.sleep(POLL_INTERVAL)
+        return first_scan_seconds, scanner_supervisor.first_scan_seconds
+    finally:
+        scanner_supervisor.stop()
+        _wait_scanner_gone()
+
+
+def run_benchmarks():
+    print(f"[ BENCH ] - Seconds from launch to the first scan published, median of {REPEAT}")
+    for name, measure in (
+            ("new interpreter", _measure_interpreter),
+            ("supervised fork", lambda: _measure_supervised("fork")),
+            ("supervised spawn", lambda: _measure_supervised("spawn"))):
+        measures = [measure() for _ in range(REPEAT)]
+        published = statistics.median(published_seconds for published_seconds, _ in measures)
+        line = f"{name:>16}: published {published:.3f}s"
+        if measures[0][1] is not None:
+            line += f", heartbeat {statistics.median(heartbeat_seconds for _, heartbeat_seconds in measures):.3f}s"
+        print(line)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
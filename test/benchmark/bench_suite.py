@@ -0,0 +1,245 @@
+#!/usr/bin/python
+""" Times every stage of the scan cycle and the HTTP API, offline, with the fake scanner
+
+Results are written as JSON, and --compare prints the change of each median against
+the results of a previous run:
+
+    python test/benchmark/bench_suite.py --output before.json
+    python test/benchmark/bench_suite.py --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import statistics
+import subprocess
+
+from flask import Flask
+from flask_restful import Api
+from flask_gzip import Gzip
+
+from persistance import read_local_cache_file, write_local_cache_file
+from persistance.shared_memory import SharedBeaconsStore, SharedJsonStore, create_shared_store, get_shared_store
+from event import services as event_services
+from event.pipeline import EventPipeline
+from event.resources import event_add_http_resources_to_api
+from ibeacon_scanner import services, resources
+from ibeacon_scanner.models import IBeacon, IBeaconTable, IBeaconWindow
+from ibeacon_scanner.smoothing import RssiSmoother
+from ibeacon_scanner.diff import IBeaconDiffEngine
+from ibeacon_scanner.backends import FakeBeaconScanner
+from ibeacon_scanner.resources import ibeacon_add_http_resources_to_api
+
+
+BEACONS_COUNTS = [10, 100, 1000]
+REPEAT = 5
+SNAPSHOT_SECONDS = 1.0
+ADVERTISEMENT_RATE = 10
+SEED = 0
+FILEPATH_BENCH_CACHE = "/local/storage/bench_suite_beacons_data.json"
+# stores of the benchmark, apart from the ones of a scanner that could be running
+BENCH_SHM_PREFIX = "bench_suite_"
+
+
+class _DiscardSink:
+    """ Events sink that drops every batch, so publishing is timed without any I/O """
+
+    name = "discard"
+
+    def deliver(self, events):
+        pass
+
+
+def _simulate_advertisements(beacons_count, seed):
+    """ Advertisements the fake scanner hears during a snapshot """
+    advertisements = []
+    fake_scanner = FakeBeaconScanner(
+        lambda *advertisement: advertisements.append(advertisement),
+        beacons=beacons_count, advertisement_rate=ADVERTISEMENT_RATE, churn=6.0, seed=seed)
+    fake_scanner.advance(SNAPSHOT_SECONDS)
+    return [("hci0",) + advertisement for advertisement in advertisements]
+
+
+def _snapshot(advertisements):
+    """ Beacons heard in the advertisements, as the scanner loop keeps them every cycle """
+    beacons_window = IBeaconWindow()
+    for adapter, mac_address, uuid, major, minor, tx_power, rssi in advertisements:
+        beacons_window.add(IBeacon(mac_address, uuid, major, minor, tx_power, rssi, adapter))
+    return beacons_window.snapshot()
+
+
+def _time(function, repeat):
+    """ Seconds per call of each run, every run long enough to be measured """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return [seconds / number for seconds in timer.repeat(repeat=repeat, number=number)]
+
+
+def _scan_cycle_stages(beacons_count):
+    """ Yields (stage, function) for each stage of _run_scanner_loop """
+    advertisements = _simulate_advertisements(beacons_count, SEED)
+    next_advertisements = _simulate_advertisements(beacons_count, SEED + 1)
+
+    def _dedup_table():
+        beacons_table = IBeaconTable(keep_strongest=True)
+        for adapter, mac_address, uuid, major, minor, tx_power, rssi in advertisements:
+            beacons_table.add(IBeacon(mac_address, uuid, major, minor, tx_power, rssi, adapter))
+        return beacons_table.beacons()
+
+    def _smoothing():
+        rssi_smoother = RssiSmoother()
+        for adapter, mac_address, uuid, major, minor, tx_power, rssi in advertisements:
+            rssi_smoother.add(IBeacon(mac_address, uuid, major, minor, tx_power, rssi, adapter))
+        return rssi_smoother.smooth(beacons_list)
+
+    beacons_list = _snapshot(advertisements)
+    sorted_beacons_list = sorted(beacons_list)
+    next_beacons_list = sorted(_snapshot(next_advertisements))
+    diff_engine = IBeaconDiffEngine()
+    snapshots = [sorted_beacons_list, next_beacons_list]
+
+    def _diff():
+        # alternates two snapshots so every update finds changes
+        snapshots.reverse()
+        return diff_engine.update(snapshots[0])
+
+    beacons_data_dict = services._render_beacons_data(sorted_beacons_list, sorted_beacons_list[0])
+    beacons_data_dicts = [beacons_data_dict, services._render_beacons_data(next_beacons_list, next_beacons_list[0])]
+
+    def _write_local_cache_file():
+        # alternates two payloads so every write replaces the file instead of skipping an unchanged one
+        beacons_data_dicts.reverse()
+        write_local_cache_file(filepath=FILEPATH_BENCH_CACHE, data_dict=beacons_data_dicts[0])
+
+    beacons_store = create_shared_store(SharedBeaconsStore, f"{BENCH_SHM_PREFIX}{beacons_count}", beacons_count)
+    cycle_events = IBeaconDiffEngine().update(sorted_beacons_list) + diff_engine.update(next_beacons_list)
+
+    def _publish_events():
+        for event in cycle_events:
+            event_services.publish_event(event)
+
+    yield "dedup_table", _dedup_table
+    yield "dedup_window", lambda: _snapshot(advertisements)
+    yield "smoothing", _smoothing
+    yield "sort", lambda: sorted(beacons_list)
+    yield "diff", _diff
+    yield "render_beacons_data", lambda: services._render_beacons_data(sorted_beacons_list, sorted_beacons_list[0])
+    yield "write_local_cache_file", _write_local_cache_file
+    yield "read_local_cache_file", lambda: read_local_cache_file(filepath=FILEPATH_BENCH_CACHE)
+    yield "write_shared_memory", lambda: beacons_store.write_beacons_data(beacons_data_dict)
+    yield "read_shared_memory", beacons_store.read_beacons_data
+    yield f"publish_event_x{len(cycle_events)}", _publish_events
+
+
+def _create_test_client(beacons_count):
+    """ Application with the same resources as app.py, serving beacons the fake scanner heard """
+    application = Flask(__name__)
+    flask_restful_api = Api(application)
+    Gzip(application)
+    ibeacon_add_http_resources_to_api(flask_restful_api, prefix="/ibeacon_scanner")
+    event_add_http_resources_to_api(flask_restful_api, prefix="/events")
+    services.BEACONS_DATA_SHM = f"{BENCH_SHM_PREFIX}{beacons_count}"
+    services.SCANNER_SETTINGS_SHM = f"{BENCH_SHM_PREFIX}settings"
+    services.FILEPATH_BEACONS_DATA = FILEPATH_BENCH_CACHE
+    # the long-poll is timed in the web workers, not redirected to the events stream server
+    resources.EVENTS_STREAM_PORT = 0
+    if not get_shared_store(SharedJsonStore, services.SCANNER_SETTINGS_SHM):
+        create_shared_store(SharedJsonStore, services.SCANNER_SETTINGS_SHM, services.SCANNER_SETTINGS_SHM_CAPACITY)
+    services._write_scanner_settings({'uuid_filter': "", 'scan_tick': 3, 'run_flag': True, 'fake_scan': True})
+    beacons_list = sorted(_snapshot(_simulate_advertisements(beacons_count, SEED)))
+    services._write_beacons_data(services._render_beacons_data(beacons_list, beacons_list[0]))
+    return application.test_client()
+
+
+def _http_stages(beacons_count):
+    test_client = _create_test_client(beacons_count)
+    etag = test_client.get("/ibeacon_scanner/beacons_data").headers.get("ETag")
+
+    def _get(url, **headers):
+        def _request():
+            response = test_client.get(url, headers=headers)
+            assert response.status_code in (200, 304), f"GET {url} returned {response.status_code}"
+        return _request
+
+    yield "GET beacons_data", _get("/ibeacon_scanner/beacons_data")
+    yield "GET beacons_data gzip", _get("/ibeacon_scanner/beacons_data", **{'Accept-Encoding': "gzip"})
+    yield "GET beacons_data 304", _get("/ibeacon_scanner/beacons_data", **{'If-None-Match': etag or ""})
+    yield "GET settings", _get("/ibeacon_scanner/settings")
+    yield "GET events long-poll", _get("/ibeacon_scanner/events?since=0&timeout=0")
+    yield "GET pipeline_stats", _get("/events/pipeline_stats")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(beacons_counts, repeat):
+    # events go through the real publish path, into a pipeline that discards them
+    event_services._event_pipeline = EventPipeline([_DiscardSink()], queue_size=100000)
+    event_services._event_pipeline.start()
+    results = []
+    for group, stages in (("scan_cycle", _scan_cycle_stages), ("http", _http_stages)):
+        for beacons_count in beacons_counts:
+            for stage, function in stages(beacons_count):
+                seconds = _time(function, repeat)
+                results.append({
+                    'group': group,
+                    'stage': stage,
+                    'beacons': beacons_count,
+                    'runs': repeat,
+                    'min_ms': min(seconds) * 1000,
+                    'median_ms': statistics.median(seconds) * 1000,
+                    'mean_ms': statistics.mean(seconds) * 1000,
+                    'max_ms': max(seconds) * 1000,
+                })
+                print(f"{group:>10} {stage:>24} {beacons_count:>6} beacons {results[-1]['median_ms']:>10.3f} ms")
+    return {
+        'commit': _git_commit(),
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'results': results,
+    }
+
+
+def compare_results(results, baseline):
+    baseline_medians = {
+        (result['group'], result['stage'], result['beacons']): result['median_ms'] for result in baseline['results']
+    }
+    print(f"\nChange against {baseline.get('commit')} ({baseline.get('time')}):")
+    for result in results['results']:
+        baseline_median = baseline_medians.get((result['group'], result['stage'], result['beacons']))
+        if not baseline_median:
+            continue
+        change = (result['median_ms'] / baseline_median - 1) * 100
+        print(f"{result['group']:>10} {result['stage']:>24} {result['beacons']:>6} beacons {change:>+8.1f}%")
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--beacons", default=",".join(map(str, BEACONS_COUNTS)), help="beacon counts, comma separated")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs of every stage")
+    parser.add_argument("--output", help="JSON file for the results, by default bench_suite-<commit>.json")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    args = parser.parse_args(args)
+    results = run_benchmarks([int(count) for count in args.beacons.split(",")], args.repeat)
+    output = args.output or f"bench_suite-{results['commit'] or 'unknown'}.json"
+    with open(output, 'w') as output_file:
+        json.dump(results, output_file, indent=4)
+    print(f"\nResults written to '{output}'")
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            compare_results(results, json.load(baseline_file))
+    os.remove(FILEPATH_BENCH_CACHE)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
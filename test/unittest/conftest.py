@@ -0,0 +1,15 @@
+import os
+import shutil
+import tempfile
+
+
+# config reads the environment and the settings file once imported, a copy keeps the tests from changing them
+_settings_directory = tempfile.mkdtemp(prefix="ibeacon_scanner_tests_")
+os.environ.setdefault('ENV', "test")
+os.environ.setdefault('LOG_LEVEL', "WARNING")
+os.environ['LOCAL_SETTINGS_FILE'] = shutil.copy(
+    os.path.join(os.path.dirname(__file__), "..", "..", "_service_storage", "settings.json"), _settings_directory)
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_settings_directory, ignore_errors=True)
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from ibeacon_scanner import services
+from ibeacon_scanner.diff import IBeaconDiffEngine
+from ibeacon_scanner.models import IBeacon, IBeaconTopK, IBeaconTable, IBeaconWindow
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def _beacon(number, rssi, adapter="hci0"):
+    return IBeacon(f"c0:ff:ee:00:{number >> 8:02x}:{number & 0xFF:02x}", UUID, 1, number, -59, rssi, adapter)
+
+
+class _Stage:
+    """ History, presence, positioning or uploader stage recording the beacons it gets """
+
+    skipped = 0
+
+    def __init__(self):
+        self.beacons_lists = []
+
+    def record(self, beacons_list):
+        self.beacons_lists.append(list(beacons_list))
+
+    append = update = submit = record
+
+
+def test_top_k_keeps_the_strongest():
+    rnd = random.Random(5)
+    top_k = IBeaconTopK(capacity=10)
+    rssis = {}
+    for _ in range(2000):
+        key, rssi = rnd.randrange(50), rnd.randint(-100, -40)
+        kept, evicted_key = top_k.admit(key, rssi)
+        if kept:
+            rssis[key] = rssi
+        if evicted_key is not None:
+            del rssis[evicted_key]
+        assert len(rssis) <= 10 and top_k._rssi == rssis
+        # stale heap entries are dropped before they pile up
+        assert len(top_k._heap) <= 2 * len(rssis) + 16
+    assert top_k.overflow > 0
+
+
+def test_top_k_rejects_weaker_beacons():
+    top_k = IBeaconTopK(capacity=2)
+    assert top_k.admit("a", -50) == (True, None) and top_k.admit("b", -60) == (True, None)
+    assert top_k.admit("c", -70) == (False, None)
+    assert top_k.admit("c", -55) == (True, "b")
+    # a beacon kept may weaken, the next stronger one pushes it out
+    assert top_k.admit("a", -90) == (True, None)
+    assert top_k.admit("d", -80) == (True, "a")
+    assert top_k.overflow == 3
+    assert IBeaconTopK().admit("a", -100) == (True, None)
+
+
+@pytest.mark.parametrize("beacons_table", [IBeaconTable(capacity=3), IBeaconWindow(window=60, capacity=3)])
+def test_tables_keep_the_strongest(beacons_table):
+    for number in range(10):
+        beacons_table.add(_beacon(number, -90 + number))
+    beacons_list = beacons_table.beacons() if isinstance(beacons_table, IBeaconTable) else beacons_table.snapshot()
+    assert sorted(beacon.minor for beacon in beacons_list) == [7, 8, 9]
+    assert beacons_table.overflow == 7
+
+
+def test_only_the_published_beacons_are_capped(monkeypatch):
+    published, tables, events = [], [], []
+    monkeypatch.setattr(services, '_write_beacons_data', published.append)
+    monkeypatch.setattr(services, '_write_beacons_table', tables.append)
+    monkeypatch.setattr(services, 'publish_event', events.append)
+    monkeypatch.setattr(services, 'BEACONS_LIST_CAPACITY', 3)
+    monkeypatch.setattr(services, '_publish_presence', lambda presence_tracker: None)
+    monkeypatch.setattr(services, '_publish_positions', lambda positioning_engine: None)
+    beacons_list = [_beacon(number, -90 + number) for number in range(10)]
+    stages = [_Stage() for _ in range(4)]
+    services._process_beacons_list(beacons_list, IBeaconDiffEngine(), None, *stages)
+    assert [beacon['minor'] for beacon in published[-1]['beacons_list']] == [9, 8, 7]
+    assert published[-1]['nearest_beacon']['minor'] == 9
+    assert sorted(event.data['minor'] for event in events if event.type == "IBEACON_ENTER") == [7, 8, 9]
+    # history, presence, positioning, the uploader and the table the queries are answered from get every beacon
+    assert all(len(stage.beacons_lists[-1]) == 10 for stage in stages)
+    assert len(tables[-1]) == 10
+
+
+def test_no_beacon_is_published_before_the_first_scan(monkeypatch):
+    published, tables = [], []
+    monkeypatch.setattr(services, '_write_beacons_data', published.append)
+    monkeypatch.setattr(services, '_write_beacons_table', tables.append)
+    # the stores and pipeline released on the way out belong to the test process
+    for name in ('_create_shared_stores', '_write_scanner_settings', '_run_scanner_loop',
+                 'event_stop_pipeline', 'flush_local_cache_files', 'unlink_shared_stores'):
+        monkeypatch.setattr(services, name, lambda *args, **kwargs: None)
+    services.ibeacon_init_scanner()
+    assert published == [{'nearest_beacon': None, 'beacons_list': []}]
+    assert tables == [[]]
@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask
+from flask_restful import Api
+from flask_gzip import Gzip
+
+from ibeacon_scanner import resources
+
+
+BEACONS_DATA = {
+    'nearest_beacon': None,
+    'beacons_list': [
+        {'mac_address': f"c0:ff:ee:00:00:{number:02x}", 'uuid': "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee",
+         'major': 11, 'minor': number, 'tx_power': -59, 'rssi': -40 - number} for number in range(1, 30)
+    ],
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(resources, 'ibeacon_get_beacons_data', lambda: BEACONS_DATA)
+    monkeypatch.setattr(resources, 'ibeacon_get_beacons_data_version', lambda: "7")
+    monkeypatch.setattr(resources, 'ibeacon_get_scanner_settings', lambda: {'scan_window': 1})
+    monkeypatch.setattr(resources, '_encoded_beacons_data', None)
+    application = Flask(__name__)
+    # as the service application does, responses are gzipped and not cached unless their route says otherwise
+    Gzip(application)
+
+    @application.after_request
+    def _default_cache_control(response):
+        if 'Cache-Control' not in response.headers:
+            response.headers.add('Cache-Control', 'no-store, no-cache')
+        return response
+
+    resources.ibeacon_add_http_resources_to_api(Api(application), "ibeacon_scanner")
+    return application.test_client()
+
+
+def test_beacons_data_is_sent_with_its_version_as_etag(client):
+    response = client.get("/ibeacon_scanner/beacons_data")
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"7"'
+    assert 'Content-Encoding' not in response.headers
+    assert response.json == BEACONS_DATA
+
+
+@pytest.mark.parametrize('accept_encoding', ["gzip", "deflate, gzip;q=0.5", "*", "br;q=1.0, *;q=0.1"])
+def test_gzip_beacons_data_has_its_own_etag(client, accept_encoding):
+    response = client.get("/ibeacon_scanner/beacons_data", headers={'Accept-Encoding': accept_encoding})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == "gzip"
+    assert response.headers['ETag'] == '"7-gz"'
+    assert response.headers['Vary'] == "Accept-Encoding"
+    # gzipped once, by the resource and not again by the middleware
+    assert json.loads(gzip.decompress(response.data)) == BEACONS_DATA
+
+
+@pytest.mark.parametrize('accept_encoding', ["gzip;q=0", "identity", "GZIP;q=0.0, deflate", "*;q=0", "*, gzip;q=0"])
+def test_gzip_refused_by_its_quality_is_not_sent(client, accept_encoding):
+    response = client.get("/ibeacon_scanner/beacons_data", headers={'Accept-Encoding': accept_encoding})
+    assert response.status_code == 200
+    assert 'Content-Encoding' not in response.headers
+    assert response.headers['ETag'] == '"7"'
+    assert response.json == BEACONS_DATA
+
+
+@pytest.mark.parametrize('if_none_match', ['"7"', '"7-gz"', 'W/"7"', '"3", "7-gz"', '*'])
+@pytest.mark.parametrize('accept_encoding, etag', [("gzip", '"7-gz"'), ("identity", '"7"')])
+def test_a_cached_beacons_data_is_not_sent_again(client, if_none_match, accept_encoding, etag):
+    response = client.get(
+        "/ibeacon_scanner/beacons_data", headers={'If-None-Match': if_none_match, 'Accept-Encoding': accept_encoding})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers['ETag'] == etag
+    assert response.headers['Cache-Control'] == resources.BEACONS_DATA_CACHE_CONTROL
+
+
+def test_an_outdated_beacons_data_is_sent_again(client):
+    response = client.get("/ibeacon_scanner/beacons_data", headers={'If-None-Match': '"6", "6-gz"'})
+    assert response.status_code == 200
+    assert response.json == BEACONS_DATA
+
+
+def test_only_beacons_data_is_revalidated_by_the_clients(client):
+    assert client.get("/ibeacon_scanner/beacons_data").headers['Cache-Control'] == "no-cache"
+    assert client.get("/ibeacon_scanner/settings").headers['Cache-Control'] == "no-store, no-cache"
@@ -0,0 +1,129 @@
+import os
+import random
+
+import pytest
+from flask import Flask, jsonify
+from flask_restful import Api
+
+from persistance import shared_memory
+from persistance.shared_memory import SharedBeaconsStore
+from ibeacon_scanner import resources, services
+from ibeacon_scanner.diff import IBeaconDiffEngine
+from ibeacon_scanner.models import IBeacon
+from ibeacon_scanner.query import BeaconsIndex, REORDER_RATIO, encode_cursor, decode_cursor
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def _beacon_json(number, rssi, major=11):
+    return {
+        'mac_address': f"c0:ff:ee:00:00:{number:02x}", 'uuid': UUID, 'major': major, 'minor': number,
+        'tx_power': -59, 'rssi': rssi, 'adapter': "hci0", 'adapters_rssi': {'hci0': rssi},
+    }
+
+
+BEACONS_LIST = [_beacon_json(number, -40 - number, major=11 + number % 2) for number in range(1, 8)]
+# beacons data only holds the strongest beacons, queries go through every tracked one
+PUBLISHED_BEACONS_LIST = BEACONS_LIST[:3]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    beacons_data = {'nearest_beacon': BEACONS_LIST[0], 'beacons_list': PUBLISHED_BEACONS_LIST}
+    for module in (services, resources):
+        monkeypatch.setattr(module, 'ibeacon_get_beacons_data', lambda: beacons_data)
+        monkeypatch.setattr(module, 'ibeacon_get_beacons_data_version', lambda: "1")
+    monkeypatch.setattr(services, 'ibeacon_get_beacons_table', lambda: BEACONS_LIST)
+    monkeypatch.setattr(services, 'ibeacon_get_beacons_table_version', lambda: "2")
+    monkeypatch.setattr(services, '_beacons_index', BeaconsIndex())
+    monkeypatch.setattr(resources, '_encoded_beacons_data', None)
+    application = Flask(__name__)
+    # as the service application does, errors raised by the resources are bad requests
+    application.config['PROPAGATE_EXCEPTIONS'] = True
+    application.errorhandler(Exception)(lambda e: (jsonify({'message': str(e)}), 400))
+    resources.ibeacon_add_http_resources_to_api(Api(application), "ibeacon_scanner")
+    return application.test_client()
+
+
+def test_without_query_parameters_the_whole_beacons_data_is_returned(client):
+    for url in ("/ibeacon_scanner/beacons_data", "/ibeacon_scanner/beacons_data?_=1612137600"):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert response.json['beacons_list'] == PUBLISHED_BEACONS_LIST and response.headers['ETag'] == '"1"'
+
+
+def test_unknown_parameters_of_a_query(client):
+    response = client.get("/ibeacon_scanner/beacons_data?major=11&_=1612137600")
+    assert response.status_code == 400
+    assert "'_'" in response.json['message']
+
+
+def test_query_pages(client):
+    minors, cursor = [], None
+    while 1:
+        response = client.get("/ibeacon_scanner/beacons_data", query_string=dict(
+            {'limit': 2, 'fields': "minor,rssi"}, **({'cursor': cursor} if cursor else {})))
+        assert response.status_code == 200
+        assert all(set(beacon) == {'minor', 'rssi'} for beacon in response.json['beacons'])
+        minors += [beacon['minor'] for beacon in response.json['beacons']]
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            break
+    assert minors == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_query_filters(client):
+    response = client.get("/ibeacon_scanner/beacons_data?major=12&min_rssi=-45")
+    assert [beacon['minor'] for beacon in response.json['beacons']] == [1, 3, 5]
+    assert response.json['version'] == "2" and response.json['next_cursor'] is None
+
+
+@pytest.mark.parametrize("query_string", ["limit=0", "fields=mac_address,color", "cursor=not-a-cursor"])
+def test_invalid_queries(client, query_string):
+    assert client.get(f"/ibeacon_scanner/beacons_data?{query_string}").status_code == 400
+
+
+def test_cursor_round_trip():
+    sort_key = (70, ("c0:ff:ee:00:00:01", 11, 1))
+    assert decode_cursor(encode_cursor(sort_key)) == sort_key
+    assert encode_cursor(None) is None and decode_cursor("") is None
+
+
+def test_index_follows_the_beacons_of_each_cycle():
+    rnd = random.Random(3)
+    beacons_index = BeaconsIndex()
+    for version in range(30):
+        # some cycles move a few beacons, others more than the share that sorts the index again
+        moved = rnd.choice([1, 2, 40])
+        beacons_list = [_beacon_json(number, rnd.randint(-90, -40) if number < moved else -60)
+            for number in range(rnd.randint(30, 40))] + [_beacon_json(99, -100)]
+        beacons_index.update(beacons_list, version)
+        expected = sorted(beacons_list, key=lambda beacon: (-beacon['rssi'], beacon['mac_address']))
+        beacons, next_sort_key = beacons_index.query()
+        assert beacons == expected and next_sort_key is None
+        beacons, _ = beacons_index.query(major=11, min_rssi=-60, limit=len(beacons_list) // REORDER_RATIO)
+        assert beacons == [beacon for beacon in expected if beacon['rssi'] >= -60][:len(beacons_list) // REORDER_RATIO]
+
+
+def test_queries_reach_the_beacons_left_out_of_beacons_data(monkeypatch):
+    monkeypatch.setattr(services, 'BEACONS_LIST_CAPACITY', 3)
+    monkeypatch.setattr(services, 'publish_event', lambda event: True)
+    monkeypatch.setattr(services, '_beacons_index', BeaconsIndex())
+    beacons_stores = []
+    for name, beacons_capacity in (('BEACONS_DATA_SHM', 3), ('BEACONS_TABLE_SHM', 10)):
+        shm_name = f"{getattr(services, name)}_test_{os.getpid()}"
+        monkeypatch.setattr(services, name, shm_name)
+        beacons_stores.append(SharedBeaconsStore.create(shm_name, beacons_capacity))
+        monkeypatch.setitem(shared_memory._shared_stores, shm_name, beacons_stores[-1])
+    try:
+        beacons_list = [IBeacon(beacon['mac_address'], UUID, beacon['major'], beacon['minor'], -59, beacon['rssi'], "hci0")
+            for beacon in BEACONS_LIST]
+        services._process_beacons_list(beacons_list, IBeaconDiffEngine())
+        assert [beacon['minor'] for beacon in services.ibeacon_get_beacons_data()['beacons_list']] == [1, 2, 3]
+        query = services.ibeacon_query_beacons_data(major="12", min_rssi="-46")
+        assert [beacon['minor'] for beacon in query['beacons']] == [1, 3, 5]
+        assert services.ibeacon_query_beacons_data(minor="7")['beacons'][0]['rssi'] == -47
+    finally:
+        for beacons_store in beacons_stores:
+            beacons_store.unlink()
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+from threading import Event
+
+import persistance
+from persistance import CacheFileWriter, write_local_cache_file, read_local_cache_file
+
+
+WRITE_TIMEOUT = 5
+
+
+def _record_metrics(monkeypatch):
+    counters = []
+    monkeypatch.setattr(persistance, 'metrics_inc', lambda name, *args, **kwargs: counters.append(name))
+    return counters
+
+
+def test_cache_files_are_replaced_atomically(tmp_path):
+    filepath = str(tmp_path / "storage" / "beacons_data.json")
+    write_local_cache_file(filepath=filepath, data_dict={'beacons_list': [1]})
+    with open(filepath, 'rb') as reader:
+        inode = os.fstat(reader.fileno()).st_ino
+        write_local_cache_file(filepath=filepath, data_dict={'beacons_list': [1, 2]})
+        # a reader of the previous file keeps reading it whole, the new one is a different file
+        assert json.loads(reader.read()) == {'beacons_list': [1]}
+    assert os.stat(filepath).st_ino != inode
+    assert read_local_cache_file(filepath=filepath) == {'beacons_list': [1, 2]}
+    # no temporary file is left next to it
+    assert os.listdir(tmp_path / "storage") == ["beacons_data.json"]
+
+
+def test_unchanged_cache_files_are_not_written_again(tmp_path, monkeypatch):
+    counters = _record_metrics(monkeypatch)
+    filepath = str(tmp_path / "beacons_data.json")
+    write_local_cache_file(filepath=filepath, data_dict={'beacons_list': [1]})
+    file_stat = os.stat(filepath)
+    write_local_cache_file(filepath=filepath, data_dict={'beacons_list': [1]})
+    assert counters == ["persistance_cache_file_unchanged_total"]
+    assert os.stat(filepath).st_ino == file_stat.st_ino and os.stat(filepath).st_mtime_ns == file_stat.st_mtime_ns
+
+    write_local_cache_file(filepath=filepath, data_dict={'beacons_list': [2]})
+    assert counters == ["persistance_cache_file_unchanged_total"]
+    assert read_local_cache_file(filepath=filepath) == {'beacons_list': [2]}
+
+
+def test_cache_files_changed_by_other_process_are_written_again(tmp_path, monkeypatch):
+    counters = _record_metrics(monkeypatch)
+    filepath = str(tmp_path / "beacons_data.json")
+    write_local_cache_file(filepath=filepath, data_dict={'beacons_list': [1]})
+    # other process replaces it as this one does
+    with open(f"{filepath}.other", 'w') as _file:
+        _file.write('{"beacons_list":[3]}')
+    os.replace(f"{filepath}.other", filepath)
+    # the digest of the last write matches, but the file is not the one written
+    write_local_cache_file(filepath=filepath, data_dict={'beacons_list': [1]})
+    assert counters == []
+    assert read_local_cache_file(filepath=filepath) == {'beacons_list': [1]}
+
+
+def test_writes_submitted_while_writing_are_coalesced(monkeypatch):
+    counters = _record_metrics(monkeypatch)
+    written, writing, release = [], Event(), Event()
+
+    def _write_local_cache_file(filepath, data_dict):
+        written.append((filepath, data_dict))
+        writing.set()
+        release.wait(WRITE_TIMEOUT)
+
+    monkeypatch.setattr(persistance, 'write_local_cache_file', _write_local_cache_file)
+    cache_file_writer = CacheFileWriter(interval=0.01)
+    cache_file_writer.submit("beacons_data.json", {'cycle': 1})
+    assert writing.wait(WRITE_TIMEOUT)
+    for cycle in range(2, 6):
+        cache_file_writer.submit("beacons_data.json", {'cycle': cycle})
+    cache_file_writer.submit("settings.json", {'cycle': 5})
+    release.set()
+    deadline = time.monotonic() + WRITE_TIMEOUT
+    while len(written) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # only the latest data of each file is written once the writer is back
+    assert written == [
+        ("beacons_data.json", {'cycle': 1}), ("beacons_data.json", {'cycle': 5}), ("settings.json", {'cycle': 5})]
+    assert counters == ["persistance_cache_file_coalesced_total"] * 3
+
+
+def test_flush_writes_the_pending_files_from_the_calling_thread(tmp_path, monkeypatch):
+    cache_file_writer = CacheFileWriter(interval=60)
+    written = []
+    monkeypatch.setattr(persistance, 'write_local_cache_file', lambda **kwargs: written.append(kwargs))
+    # the writer thread is busy, so only flush writes the file
+    monkeypatch.setattr(cache_file_writer, '_thread', object())
+    cache_file_writer.submit(str(tmp_path / "beacons_data.json"), {'cycle': 1})
+    cache_file_writer.flush()
+    assert written == [{'filepath': str(tmp_path / "beacons_data.json"), 'data_dict': {'cycle': 1}}]
+    cache_file_writer.flush()
+    assert len(written) == 1
@@ -0,0 +1,143 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+from beacontools import scanner as beacontools_scanner
+
+from ibeacon_scanner import services
+from ibeacon_scanner.backends import ReplayBeaconScanner
+from ibeacon_scanner.capture import CaptureWriter, CAPTURE_HEADER, read_capture_start, iter_capture_records
+from ibeacon_scanner.hci import IBeaconReportParser, encode_advertising_report
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+ADVERTISEMENTS = [
+    ("hci0", "c0:ff:ee:01:02:03", UUID, 11, 1, -59, -72),
+    ("hci2", "c0:ff:ee:04:05:06", UUID, 11, 2, -59, -80),
+    ("hci0", "c0:ff:ee:01:02:03", UUID, 11, 1, -59, -70),
+]
+
+
+@pytest.fixture
+def capture_file(tmp_path):
+    filepath = str(tmp_path / "captures" / "capture.bin")
+    capture_writer = CaptureWriter(filepath)
+    for advertisement in ADVERTISEMENTS:
+        capture_writer.write_advertisement(*advertisement)
+    capture_writer.close()
+    return filepath
+
+
+def _read_records(filepath):
+    with open(filepath, 'rb') as capture:
+        return list(iter_capture_records(capture.read()))
+
+
+def test_round_trip(capture_file):
+    parser = IBeaconReportParser()
+    records = _read_records(capture_file)
+    assert [(f"hci{adapter}", *parser.parse(packet)) for _, adapter, packet in records] == ADVERTISEMENTS
+    timestamps = [timestamp for timestamp, _, _ in records]
+    assert timestamps == sorted(timestamps)
+
+
+def test_truncated_last_record_is_ignored(capture_file):
+    with open(capture_file, 'rb') as capture:
+        capture_bytes = capture.read()
+    assert len(list(iter_capture_records(capture_bytes[:-1]))) == len(ADVERTISEMENTS) - 1
+    assert list(iter_capture_records(capture_bytes[:CAPTURE_HEADER.size + 3])) == []
+
+
+def test_append_keeps_capture_start(capture_file):
+    capture_start = read_capture_start(capture_file)
+    capture_writer = CaptureWriter(capture_file)
+    capture_writer.write_advertisement(*ADVERTISEMENTS[0])
+    capture_writer.close()
+    assert read_capture_start(capture_file) == capture_start
+    assert len(_read_records(capture_file)) == len(ADVERTISEMENTS) + 1
+
+
+def test_bad_magic(tmp_path):
+    filepath = tmp_path / "not_a_capture.bin"
+    filepath.write_bytes(b"PCAP" + bytes(CAPTURE_HEADER.size - 4))
+    with pytest.raises(ValueError):
+        read_capture_start(str(filepath))
+    with pytest.raises(ValueError):
+        CaptureWriter(str(filepath))
+
+
+def test_replay_as_fast_as_possible(capture_file):
+    replayed = []
+    replay_scanner = ReplayBeaconScanner(lambda *fields: replayed.append(fields), capture_file, UUID, speed=0)
+    replay_scanner.start()
+    deadline = time.monotonic() + 5
+    while len(replayed) < len(ADVERTISEMENTS) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    replay_scanner.stop()
+    assert replayed[:len(ADVERTISEMENTS)] == ADVERTISEMENTS
+    assert replay_scanner.dropped == 0
+
+
+def _read_advertisements(filepath):
+    parser = IBeaconReportParser()
+    return [(f"hci{adapter}", *parser.parse(packet)) for _, adapter, packet in _read_records(filepath)]
+
+
+def test_raw_hci_advertisements_are_captured_as_received(tmp_path, monkeypatch):
+    # the HCI device is replaced, the bluetooth bindings are not needed
+    monkeypatch.setattr(beacontools_scanner, 'import_module', lambda name: SimpleNamespace())
+    monkeypatch.setattr(services, 'SCAN_BACKEND', "raw_hci")
+    monkeypatch.setattr(services, 'BT_DEVICE_IDS', "0,2")
+    capture_writer = CaptureWriter(str(tmp_path / "capture.bin"))
+    scanner_backend = services._create_scanner_backend(
+        lambda *advertisement: None, capture_writer, replay_file="", fake_scan=False, uuid_filter=None)
+    packet = encode_advertising_report(*ADVERTISEMENTS[1][1:])
+    # a report without the flags AD structure, re-encoding it would add them
+    packet = packet[:2] + bytes([packet[2] - 3]) + packet[3:13] + bytes([packet[13] - 3]) + packet[17:]
+    other_packet = encode_advertising_report(*ADVERTISEMENTS[0][1:])[:17] + b"\x03\x03\xaa\xfe"
+    monitor = scanner_backend._backends[1]._monitor
+    packets = [packet, other_packet]
+
+    def _recv(size):
+        monitor.keep_going = len(packets) > 1
+        return packets.pop(0)
+
+    monitor.backend = SimpleNamespace(open_dev=lambda bt_device_id: SimpleNamespace(recv=_recv, close=lambda: None))
+    monkeypatch.setattr(monitor, 'get_hci_version', lambda: None)
+    monkeypatch.setattr(monitor, 'set_scan_parameters', lambda **kwargs: None)
+    monkeypatch.setattr(monitor, 'toggle_scan', lambda enable: None)
+    monitor.run()
+    capture_writer.close()
+    # only the advertisements passed on are captured
+    assert [(adapter, captured_packet) for _, adapter, captured_packet in _read_records(capture_writer.filepath)] == [
+        (2, packet)]
+    assert _read_advertisements(capture_writer.filepath) == [ADVERTISEMENTS[1]]
+
+
+def test_a_replay_is_not_captured_again(capture_file, tmp_path):
+    capture_writer = CaptureWriter(str(tmp_path / "recapture.bin"))
+    replayed = []
+    replay_scanner = services._create_scanner_backend(
+        lambda *fields: replayed.append(fields), capture_writer,
+        replay_file=capture_file, replay_speed=0, fake_scan=False, uuid_filter=None)
+    replay_scanner.start()
+    deadline = time.monotonic() + 5
+    while len(replayed) < len(ADVERTISEMENTS) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    replay_scanner.stop()
+    capture_writer.close()
+    assert replayed[:len(ADVERTISEMENTS)] == ADVERTISEMENTS
+    assert _read_records(capture_writer.filepath) == []
+
+
+def test_decoded_advertisements_are_captured_as_their_report(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, 'BT_DEVICE_IDS', "0")
+    monkeypatch.setattr(services, 'FAKE_SEED', 1)
+    capture_writer = CaptureWriter(str(tmp_path / "capture.bin"))
+    advertisements = []
+    fake_backend = services._create_scanner_backend(
+        lambda *advertisement: advertisements.append(advertisement), capture_writer,
+        replay_file="", fake_scan=True, uuid_filter=UUID)
+    fake_backend._backends[0].advance(1.0)
+    capture_writer.close()
+    assert advertisements and _read_advertisements(capture_writer.filepath) == advertisements
@@ -0,0 +1,82 @@
+import gzip
+import json
+import time
+
+import pytest
+
+from collector import services
+from collector.models import GlobalBeaconIndex
+from collector.uploader import ReportUploader, encode_report
+from ibeacon_scanner.models import IBeacon
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+KEY = (UUID, 11, 1)
+
+
+def _report(report_time, rssi, minor=1):
+    return encode_report([IBeacon("c0:ff:ee:00:00:01", UUID, 11, minor, -59, rssi)], report_time)
+
+
+@pytest.fixture
+def beacon_index(monkeypatch):
+    beacon_index = GlobalBeaconIndex(expiry=30)
+    monkeypatch.setattr(services, '_global_beacon_index', beacon_index)
+    return beacon_index
+
+
+def test_uploaded_batch_is_ingested(beacon_index):
+    report_uploader = ReportUploader("http://collector", "scanner-a")
+    now = time.time()
+    payload = report_uploader._encode_batch([_report(now - 1, -70), _report(now, -65, minor=2)])
+    assert services.collector_ingest_reports(payload, "gzip") == {'scanner_id': 'scanner-a', 'reports': 2, 'readings': 2}
+    beacon = services.collector_get_beacon(UUID, "11", "2")
+    assert beacon['best_scanner'] == "scanner-a" and beacon['rssi'] == -65
+    assert [beacon['minor'] for beacon in services.collector_get_beacons(major="11")] == [2, 1]
+    assert services.collector_get_scanners()['scanner-a']['readings'] == 2
+
+
+def test_scanner_clock_offset(beacon_index):
+    now = time.time()
+    # the scanner clock runs 100s behind the collector one
+    payload = json.dumps({'scanner_id': "scanner-a", 'sent_at': now - 100, 'reports': [_report(now - 101, -70)]})
+    services.collector_ingest_reports(payload.encode())
+    assert services.collector_get_beacon(UUID, 11, 1)['last_seen'] == pytest.approx(now - 1, abs=0.5)
+    assert services.collector_get_scanners()['scanner-a']['clock_offset'] == pytest.approx(100, abs=0.5)
+
+
+@pytest.mark.parametrize("payload, content_encoding", [
+    (b"{}", ""),
+    (b"[]", ""),
+    (b"not json", ""),
+    (json.dumps({'scanner_id': "scanner-a", 'reports': {}}).encode(), ""),
+    (json.dumps({'scanner_id': "scanner-a", 'reports': [{'time': 1}]}).encode(), ""),
+    (json.dumps({'scanner_id': "scanner-a", 'reports': [{'time': 1, 'beacons': [[1, 2]]}]}).encode(), ""),
+    (b"{}", "br"),
+    (gzip.compress(b" " * (services.MAX_REPORTS_BYTES + 1)), "gzip"),
+])
+def test_invalid_batches_are_rejected(beacon_index, payload, content_encoding):
+    with pytest.raises(ValueError):
+        services.collector_ingest_reports(payload, content_encoding)
+
+
+def test_best_scanner(beacon_index):
+    beacon_index.ingest("scanner-a", [_report(100, -70)], now=100)
+    beacon_index.ingest("scanner-b", [_report(101, -60)], now=101)
+    assert beacon_index.get(*KEY, now=101)['best_scanner'] == "scanner-b"
+    # the best scanner hears it weaker, the other one is better now
+    beacon_index.ingest("scanner-b", [_report(102, -80)], now=102)
+    assert beacon_index.get(*KEY, now=102)['best_scanner'] == "scanner-a"
+    # a late report of a scanner never replaces its newer reading
+    beacon_index.ingest("scanner-b", [_report(99, -40)], now=103)
+    assert beacon_index.get(*KEY, now=103)['scanners']['scanner-b']['rssi'] == -80
+
+
+def test_expired_readings(beacon_index):
+    beacon_index.ingest("scanner-a", [_report(100, -50)], now=100)
+    beacon_index.ingest("scanner-b", [_report(120, -70)], now=120)
+    # the strongest reading expired, the beacon is heard best by the scanner that still hears it
+    beacon = beacon_index.get(*KEY, now=135)
+    assert beacon['best_scanner'] == "scanner-b" and list(beacon['scanners']) == ["scanner-b"]
+    assert beacon_index.get(*KEY, now=151) is None
+    assert beacon_index.beacons(now=151) == []
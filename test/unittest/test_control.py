@@ -0,0 +1,38 @@
+import os
+import socket
+
+from ibeacon_scanner.control import ControlChannel, send_control_message
+
+
+def test_messages_reach_the_channel(tmp_path):
+    control_channel = ControlChannel(str(tmp_path / "control.sock"))
+    try:
+        assert send_control_message(control_channel.filepath, {'type': 'settings', 'settings': {'run_flag': False}})
+        assert send_control_message(control_channel.filepath, {'type': 'profile', 'kind': 'cpu'})
+        assert control_channel.receive(timeout=1) == [
+            {'type': 'settings', 'settings': {'run_flag': False}},
+            {'type': 'profile', 'kind': 'cpu'},
+        ]
+    finally:
+        control_channel.close()
+    assert not os.path.exists(control_channel.filepath)
+
+
+def test_missing_channel_is_not_available(tmp_path):
+    assert not send_control_message(str(tmp_path / "control.sock"), {'type': 'settings'})
+
+
+def test_full_channel_does_not_block(tmp_path):
+    # a bound socket nobody reads, as a hung scanner
+    filepath = str(tmp_path / "control.sock")
+    unread_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    unread_socket.bind(filepath)
+    try:
+        message = {'type': 'settings', 'settings': {'uuid_filter': "f" * 4096}}
+        sent = 0
+        while send_control_message(filepath, message):
+            sent += 1
+            assert sent < 100000
+        assert not send_control_message(filepath, message)
+    finally:
+        unread_socket.close()
@@ -0,0 +1,97 @@
+from ibeacon_scanner import services
+from ibeacon_scanner.diff import IBeaconDiffEngine
+from ibeacon_scanner.models import IBeacon
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def _beacon(minor, rssi):
+    return IBeacon(f"c0:ff:ee:00:00:{minor:02x}", UUID, 1, minor, -59, rssi, "hci0")
+
+
+def _events(diff_engine, rssis, now):
+    """ Type and minor of the events of a table with the given RSSI by minor """
+    return [
+        (event.type, event.data['minor'] if event.data else None)
+        for event in diff_engine.update([_beacon(minor, rssi) for minor, rssi in rssis.items()], now=now)
+    ]
+
+
+def test_beacons_enter_and_exit():
+    diff_engine = IBeaconDiffEngine()
+    assert _events(diff_engine, {1: -50, 2: -60}, 0) == [
+        ("IBEACON_ENTER", 1), ("IBEACON_ENTER", 2), ("IBEACON_CHANGE", 1)]
+    assert _events(diff_engine, {1: -50, 2: -60}, 1) == []
+    assert _events(diff_engine, {1: -50, 3: -70}, 2) == [("IBEACON_EXIT", 2), ("IBEACON_ENTER", 3)]
+    # the nearest beacon leaving is replaced at once, with no dwell
+    assert _events(diff_engine, {3: -70}, 3) == [("IBEACON_EXIT", 1), ("IBEACON_CHANGE", 3)]
+    assert _events(diff_engine, {}, 4) == [("IBEACON_EXIT", 3), ("IBEACON_CHANGE", None)]
+    assert diff_engine.nearest is None
+
+
+def test_beacons_move_once_their_rssi_drifts_the_threshold():
+    diff_engine = IBeaconDiffEngine(rssi_threshold=8)
+    _events(diff_engine, {1: -50}, 0)
+    assert _events(diff_engine, {1: -57}, 1) == []
+    # slow drifts add up from the last reported reading
+    assert _events(diff_engine, {1: -45}, 2) == []
+    assert _events(diff_engine, {1: -58}, 3) == [("IBEACON_MOVE", 1)]
+    assert diff_engine.update([_beacon(1, -66)], now=4)[0].data == dict(_beacon(1, -66).to_identity_json(), rssi=-66)
+    assert _events(diff_engine, {1: -60}, 5) == []
+
+
+def test_the_nearest_beacon_holds_against_weaker_than_hysteresis_challengers():
+    # moves are left out, only the nearest beacon is under test
+    diff_engine = IBeaconDiffEngine(rssi_threshold=100, nearest_hysteresis=3, nearest_dwell=2.0)
+    _events(diff_engine, {1: -50, 2: -60}, 0)
+    for now in range(1, 10):
+        assert _events(diff_engine, {1: -50, 2: -48}, now) == []
+    assert diff_engine.nearest.minor == 1
+
+
+def test_the_nearest_beacon_changes_after_the_challenger_dwells():
+    diff_engine = IBeaconDiffEngine(rssi_threshold=100, nearest_hysteresis=3, nearest_dwell=2.0)
+    _events(diff_engine, {1: -50, 2: -60}, 0)
+    assert _events(diff_engine, {1: -50, 2: -45}, 10) == []
+    assert _events(diff_engine, {1: -50, 2: -45}, 11.5) == []
+    assert _events(diff_engine, {1: -50, 2: -45}, 12) == [("IBEACON_CHANGE", 2)]
+    assert diff_engine.nearest.minor == 2
+
+
+def test_the_dwell_restarts_when_the_challenger_falls_back_or_changes():
+    diff_engine = IBeaconDiffEngine(rssi_threshold=100, nearest_hysteresis=3, nearest_dwell=2.0)
+    _events(diff_engine, {1: -50, 2: -60, 3: -60}, 0)
+    _events(diff_engine, {1: -50, 2: -45, 3: -60}, 1)
+    # the challenger drops within the hysteresis for a cycle
+    _events(diff_engine, {1: -50, 2: -49, 3: -60}, 2)
+    assert _events(diff_engine, {1: -50, 2: -45, 3: -60}, 3.5) == []
+    # other beacon takes over as the strongest challenger
+    assert _events(diff_engine, {1: -50, 2: -45, 3: -40}, 4) == []
+    assert _events(diff_engine, {1: -50, 2: -45, 3: -40}, 5.5) == []
+    assert _events(diff_engine, {1: -50, 2: -45, 3: -40}, 6) == [("IBEACON_CHANGE", 3)]
+
+
+def _published_nearest(monkeypatch, diff_engine, rssis_by_cycle):
+    published = []
+    monkeypatch.setattr(services, '_write_beacons_data', published.append)
+    monkeypatch.setattr(services, '_write_beacons_table', lambda beacons_list: None)
+    monkeypatch.setattr(services, 'publish_event', lambda event: None)
+    for rssis in rssis_by_cycle:
+        services._process_beacons_list(sorted(_beacon(minor, rssi) for minor, rssi in rssis.items()), diff_engine)
+    return [
+        (beacons_data['nearest_beacon']['minor'], beacons_data['beacons_list'][0]['minor']) for beacons_data in published
+    ]
+
+
+def test_beacons_data_publishes_the_nearest_beacon_of_the_diff_engine(monkeypatch):
+    diff_engine = IBeaconDiffEngine(nearest_hysteresis=3, nearest_dwell=60)
+    # the beacons list is by RSSI, the nearest beacon keeps its place within the hysteresis and the dwell
+    assert _published_nearest(monkeypatch, diff_engine, [{1: -50, 2: -60}, {1: -50, 2: -48}, {1: -50, 2: -40}]) == [
+        (1, 1), (1, 2), (1, 2)]
+
+
+def test_beacons_data_follows_the_nearest_beacon_once_it_changes(monkeypatch):
+    diff_engine = IBeaconDiffEngine(nearest_hysteresis=3, nearest_dwell=0)
+    assert _published_nearest(monkeypatch, diff_engine, [{1: -50, 2: -60}, {1: -50, 2: -40}]) == [(1, 1), (2, 2)]
+    assert services._render_beacons_data([], None) == {'nearest_beacon': None, 'beacons_list': []}
@@ -0,0 +1,63 @@
+import pytest
+from flask import Flask
+from flask_restful import Api
+
+from event.stream import EventHub
+from ibeacon_scanner import resources
+
+
+STREAM_HEADERS = {'Accept': 'text/event-stream'}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(resources, '_event_hub', EventHub(directory=str(tmp_path)))
+    # without a stream server the web workers serve the events themselves
+    monkeypatch.setattr(resources, 'EVENTS_STREAM_PORT', 0)
+    # the test client reads the first chunk of a stream, a keepalive when no event comes
+    monkeypatch.setattr(resources, 'EVENTS_KEEPALIVE_INTERVAL', 0.01)
+    application = Flask(__name__)
+    resources.ibeacon_add_http_resources_to_api(Api(application), "ibeacon_scanner")
+    return application.test_client()
+
+
+def test_streams_beyond_the_waiting_clients_are_refused(client):
+    streams = [
+        client.get("/ibeacon_scanner/events", headers=STREAM_HEADERS, buffered=False)
+        for _ in range(resources.EVENTS_MAX_WAITING_CLIENTS)
+    ]
+    try:
+        assert [stream.status_code for stream in streams] == [200] * resources.EVENTS_MAX_WAITING_CLIENTS
+        refused = client.get("/ibeacon_scanner/events", headers=STREAM_HEADERS, buffered=False)
+        assert refused.status_code == 503
+        assert refused.headers['Retry-After'] == str(resources.EVENTS_RETRY_AFTER)
+        # long polls do not wait either, they answer with the events already there
+        poll = client.get("/ibeacon_scanner/events?since=0&timeout=30")
+        assert poll.status_code == 200
+        assert poll.headers['Retry-After'] == str(resources.EVENTS_RETRY_AFTER)
+        assert poll.json == {'last_seq': 0, 'events': []}
+    finally:
+        streams.pop().close()
+    # a closed stream frees its thread for the next client
+    stream = client.get("/ibeacon_scanner/events", headers=STREAM_HEADERS, buffered=False)
+    assert stream.status_code == 200
+    stream.close()
+    for stream in streams:
+        stream.close()
+
+
+def test_long_poll_waits_while_a_slot_is_free(client):
+    resources._event_hub.put(1, {'type': 'IBEACON_ENTER'})
+    poll = client.get("/ibeacon_scanner/events?since=0&timeout=1")
+    assert poll.status_code == 200
+    assert 'Retry-After' not in poll.headers
+    assert poll.json == {'last_seq': 1, 'events': [{'seq': 1, 'event': {'type': 'IBEACON_ENTER'}}]}
+
+
+def test_clients_are_redirected_to_the_stream_server(client, monkeypatch):
+    monkeypatch.setattr(resources, 'EVENTS_STREAM_PORT', 5001)
+    response = client.get("/ibeacon_scanner/events?since=3", headers=STREAM_HEADERS, base_url="http://scanner:5000")
+    assert response.status_code == 307
+    assert response.headers['Location'] == "http://scanner:5001/ibeacon_scanner/events?since=3"
+    # the web workers do not listen to the events the stream server serves
+    assert resources._event_hub._thread is None
@@ -0,0 +1,62 @@
+import pytest
+import requests
+
+from event import pipeline
+from event.pipeline import EventSinkWorker
+from event.sinks import HttpSink
+
+
+class _Response(requests.Response):
+
+    def __init__(self, status_code):
+        super().__init__()
+        self.status_code = status_code
+        self.reason = "Status"
+
+
+class _Session:
+    """ Answers each post with the next status, or raises it if it is an exception """
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.posts = 0
+
+    def post(self, url, **kwargs):
+        self.posts += 1
+        status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        if isinstance(status, Exception):
+            raise status
+        return _Response(status)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(pipeline, 'RETRY_BACKOFF', 0)
+
+
+def _deliver(*statuses):
+    http_sink = HttpSink("http://webhook.local/events")
+    http_sink._session = _Session(*statuses)
+    worker = EventSinkWorker(http_sink)
+    worker._deliver([(0.0, {'type': 'IBEACON_ENTER'}), (0.0, {'type': 'IBEACON_EXIT'})])
+    return worker, http_sink._session
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 413, 422])
+def test_client_errors_are_rejected_without_retries(status):
+    worker, session = _deliver(status)
+    assert session.posts == 1
+    assert (worker.rejected, worker.failed, worker.retries, worker.delivered) == (2, 0, 0, 0)
+
+
+@pytest.mark.parametrize("status", [429, 500, 503, requests.ConnectionError("refused"), requests.Timeout("slow")])
+def test_transient_errors_are_retried(status):
+    worker, session = _deliver(status, 200)
+    assert session.posts == 2
+    assert (worker.rejected, worker.failed, worker.retries, worker.delivered) == (0, 0, 1, 2)
+
+
+def test_transient_errors_fail_after_the_last_retry():
+    worker, session = _deliver(503)
+    assert session.posts == pipeline.MAX_RETRIES + 1
+    assert (worker.rejected, worker.failed, worker.retries, worker.delivered) == (0, 2, pipeline.MAX_RETRIES, 0)
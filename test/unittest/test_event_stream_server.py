@@ -0,0 +1,128 @@
+import json
+import asyncio
+
+from event.stream import EventStreamPublisher
+from event.stream_server import EventStreamServer, EVENTS_RETRY_AFTER
+
+
+TIMEOUT = 5
+
+
+def _serve(tmp_path, client_coroutine, max_clients=1000):
+    """ Runs client_coroutine(server, publisher) against a stream server listening on a free port """
+
+    async def _run():
+        server = EventStreamServer(host="127.0.0.1", port=0, directory=str(tmp_path), max_clients=max_clients)
+        serving = asyncio.create_task(server.serve_forever())
+        while server._server is None or not server._server.is_serving():
+            await asyncio.sleep(0.01)
+        try:
+            return await asyncio.wait_for(client_coroutine(server, EventStreamPublisher(str(tmp_path))), TIMEOUT)
+        finally:
+            serving.cancel()
+            await asyncio.gather(serving, return_exceptions=True)
+
+    return asyncio.run(_run())
+
+
+async def _request(server, method="GET", path="/ibeacon_scanner/events", headers=None):
+    """ Sends the request, returns the connection and the status and lowercase headers of the response """
+    reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    header_lines = "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: scanner\r\n{header_lines}\r\n".encode())
+    status_line, *header_lines = (await reader.readuntil(b"\r\n\r\n")).decode().strip().split("\r\n")
+    response_headers = dict(
+        (name.lower(), value.strip()) for name, _, value in (line.partition(":") for line in header_lines))
+    return reader, writer, int(status_line.split(" ")[1]), response_headers
+
+
+async def _request_json(server, *args, **kwargs):
+    reader, writer, status, headers = await _request(server, *args, **kwargs)
+    body = await reader.read()
+    writer.close()
+    return status, headers, json.loads(body) if body else None
+
+
+async def _open_stream(server):
+    return await _request(server, headers={'Accept': 'text/event-stream'})
+
+
+async def _next_sse_event(reader):
+    fields = dict(line.split(": ", 1) for line in (await reader.readuntil(b"\n\n")).decode().strip().split("\n"))
+    return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+
+def test_every_stream_gets_the_published_events(tmp_path):
+    async def _clients(server, publisher):
+        streams = [await _open_stream(server) for _ in range(50)]
+        assert [status for _, _, status, _ in streams] == [200] * 50
+        assert server.waiting_clients == 50
+        publisher.publish({'type': 'IBEACON_ENTER', 'uuid': "a"})
+        events = [await _next_sse_event(reader) for reader, _, _, _ in streams]
+        for _, writer, _, _ in streams:
+            writer.close()
+        return events
+
+    assert _serve(tmp_path, _clients) == [(1, 'IBEACON_ENTER', {'type': 'IBEACON_ENTER', 'uuid': "a"})] * 50
+
+
+def test_streams_beyond_the_max_clients_are_refused(tmp_path):
+    async def _clients(server, publisher):
+        streams = [await _open_stream(server) for _ in range(2)]
+        refused = await _request_json(server, headers={'Accept': 'text/event-stream'})
+        # long polls do not wait either, they answer with the events already there
+        poll = await _request_json(server, path="/ibeacon_scanner/events?since=0&timeout=30")
+        for _, writer, _, _ in streams:
+            writer.close()
+        return refused, poll
+
+    (refused_status, refused_headers, _), (poll_status, poll_headers, poll) = _serve(tmp_path, _clients, max_clients=2)
+    assert refused_status == 503
+    assert refused_headers['retry-after'] == str(EVENTS_RETRY_AFTER)
+    assert poll_status == 200
+    assert poll_headers['retry-after'] == str(EVENTS_RETRY_AFTER)
+    assert poll == {'last_seq': 0, 'events': []}
+
+
+def test_a_stream_resumes_after_the_last_event_id(tmp_path):
+    async def _clients(server, publisher):
+        for uuid in "abc":
+            publisher.publish({'type': 'IBEACON_ENTER', 'uuid': uuid})
+        while server.event_hub.last_seq < 3:
+            await asyncio.sleep(0.01)
+        reader, writer, _, _ = await _request(
+            server, headers={'Accept': 'text/event-stream', 'Last-Event-ID': 1})
+        events = [await _next_sse_event(reader) for _ in range(2)]
+        writer.close()
+        return events
+
+    assert [(seq, event['uuid']) for seq, _, event in _serve(tmp_path, _clients)] == [(2, "b"), (3, "c")]
+
+
+def test_long_poll_waits_for_the_next_event(tmp_path):
+    async def _clients(server, publisher):
+        poll = asyncio.create_task(_request_json(server, path="/ibeacon_scanner/events?since=0&timeout=5"))
+        while server.waiting_clients < 1:
+            await asyncio.sleep(0.01)
+        publisher.publish({'type': 'IBEACON_EXIT', 'uuid': "a"})
+        return await poll
+
+    status, headers, poll = _serve(tmp_path, _clients)
+    assert status == 200
+    assert 'retry-after' not in headers
+    assert poll == {'last_seq': 1, 'events': [{'seq': 1, 'event': {'type': 'IBEACON_EXIT', 'uuid': "a"}}]}
+
+
+def test_requests_other_than_the_events_are_answered_at_once(tmp_path):
+    async def _clients(server, publisher):
+        preflight = await _request_json(server, method="OPTIONS")
+        not_found = await _request_json(server, path="/ibeacon_scanner/beacons_data")
+        not_allowed = await _request_json(server, method="POST")
+        return preflight, not_found, not_allowed
+
+    preflight, not_found, not_allowed = _serve(tmp_path, _clients)
+    assert preflight[0] == 204
+    assert preflight[1]['access-control-allow-origin'] == "*"
+    assert 'Last-Event-ID' in preflight[1]['access-control-allow-headers']
+    assert not_found[0] == 404
+    assert not_allowed[0] == 405
@@ -0,0 +1,47 @@
+from ibeacon_scanner.backends import FakeBeaconScanner
+
+
+def _run(steps=100, step=0.1, **kwargs):
+    """ Advertisements heard by a fake scanner advanced step seconds at a time """
+    advertisements = []
+    fake_scanner = FakeBeaconScanner(lambda *advertisement: advertisements.append(advertisement), **kwargs)
+    for _ in range(steps):
+        fake_scanner.advance(step)
+    return fake_scanner, advertisements
+
+
+def test_the_same_seed_repeats_the_same_run():
+    _, advertisements = _run(beacons=20, churn=1.0, packet_loss=0.1, seed=7)
+    _, same_advertisements = _run(beacons=20, churn=1.0, packet_loss=0.1, seed=7)
+    _, other_advertisements = _run(beacons=20, churn=1.0, packet_loss=0.1, seed=8)
+    assert advertisements
+    assert advertisements == same_advertisements
+    assert advertisements != other_advertisements
+
+
+def test_beacons_advertise_at_their_rate():
+    fake_scanner, advertisements = _run(beacons=5, advertisement_rate=10, seed=0)
+    # 10 seconds at 10 advertisements per second each
+    assert len(advertisements) == 500 and fake_scanner.dropped == 0
+    assert {advertisement[3] for advertisement in advertisements} == {1, 2, 3, 4, 5}
+    assert {advertisement[1] for advertisement in advertisements} == {FakeBeaconScanner.DEFAULT_UUID}
+
+
+def test_churn_replaces_its_fraction_of_the_beacons_each_minute():
+    beacons = 200
+    fake_scanner, advertisements = _run(steps=600, beacons=beacons, churn=0.5, seed=0)
+    # 200 beacons over a minute at 0.5 churn, 100 are replaced
+    replaced = fake_scanner._beacons_count - beacons
+    assert 80 <= replaced <= 120
+    assert len({advertisement[0] for advertisement in advertisements}) == beacons + replaced
+    assert len(fake_scanner._beacons) == beacons
+
+    fake_scanner, _ = _run(steps=600, beacons=beacons, churn=0.0, seed=0)
+    assert fake_scanner._beacons_count == beacons
+
+
+def test_packet_loss_drops_its_fraction_of_the_advertisements():
+    fake_scanner, advertisements = _run(beacons=100, advertisement_rate=10, packet_loss=0.2, seed=0)
+    # every advertisement sent is either heard or dropped
+    assert len(advertisements) + fake_scanner.dropped == 10000
+    assert 1800 <= fake_scanner.dropped <= 2200
@@ -0,0 +1,82 @@
+import os
+import time
+import signal
+from threading import Thread, Event
+
+import pytest
+
+import persistance
+from persistance import shared_memory
+from event import services as event_services
+from metrics import services as metrics_services
+
+
+# seconds a forked process waits for a lock before reporting it is stuck
+CHILD_LOCK_TIMEOUT = 5
+
+# locks the scanner takes after the supervisor forks it, while HTTP threads of the parent may hold them
+FORK_LOCKS = {
+    'metrics_registry': lambda: metrics_services._metrics_registry._lock,
+    'metrics_snapshots': lambda: metrics_services._metrics_snapshots_lock,
+    'cache_files': lambda: persistance._written_files_lock,
+    'cache_file_writer': lambda: persistance._cache_file_writer._condition,
+    'shared_stores': lambda: shared_memory._shared_stores_lock,
+    'event_pipeline': lambda: event_services._event_pipeline_lock,
+}
+
+
+def _fork_while_held(get_lock, child):
+    """ Forks while other thread holds the lock, returns the exit code of child() in the child, None if it hangs """
+    held, release = Event(), Event()
+
+    def _hold():
+        with get_lock():
+            held.set()
+            release.wait()
+
+    holder = Thread(target=_hold, daemon=True)
+    holder.start()
+    held.wait()
+    try:
+        pid = os.fork()
+        if pid == 0:
+            exitcode = 1
+            try:
+                exitcode = child()
+            finally:
+                os._exit(exitcode)
+        # a child stuck in the fork hooks never gets to child()
+        deadline = time.monotonic() + 2 * CHILD_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            waited_pid, status = os.waitpid(pid, os.WNOHANG)
+            if waited_pid:
+                return os.waitstatus_to_exitcode(status)
+            time.sleep(0.01)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        return None
+    finally:
+        release.set()
+        holder.join()
+
+
+@pytest.mark.parametrize('lock_name', FORK_LOCKS)
+def test_a_forked_process_does_not_inherit_a_held_lock(lock_name):
+    get_lock = FORK_LOCKS[lock_name]
+    assert _fork_while_held(get_lock, lambda: 0 if get_lock().acquire(timeout=CHILD_LOCK_TIMEOUT) else 1) == 0
+
+
+def test_a_forked_process_records_metrics_while_the_parent_held_the_metrics_lock():
+    metrics_services.metrics_register_counter("test_fork_total", "Counter of the fork test")
+    metrics_registry = metrics_services._metrics_registry
+    metrics_registry.inc("test_fork_total", 5)
+
+    def _child():
+        # the registry is used from other thread so a lock never released leaves it waiting, not the child
+        recorded = Event()
+        Thread(target=lambda: (metrics_registry.inc("test_fork_total"), recorded.set()), daemon=True).start()
+        if not recorded.wait(CHILD_LOCK_TIMEOUT):
+            return 1
+        return 0 if metrics_registry.snapshot()["test_fork_total"]['samples'] == [[{}, 1]] else 2
+
+    assert _fork_while_held(lambda: metrics_registry._lock, _child) == 0
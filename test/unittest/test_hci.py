@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+from beacontools import scanner as beacontools_scanner
+
+from ibeacon_scanner.backends import _RawHciMonitor
+from ibeacon_scanner.hci import IBeaconReportParser, encode_advertising_report, IBEACON_PREFIX, \
+    HCI_EVENT_PACKET, LE_META_EVENT, LE_EXT_ADVERTISING_REPORT
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+OTHER_UUID = "11111111-2222-3333-4444-555555555555"
+ADVERTISEMENT = ("c0:ff:ee:01:02:03", UUID, 11, 65535, -59, -72)
+
+
+def _extended_report(payload, rssi):
+    address = bytes.fromhex("c0ffee010203")[::-1]
+    report = bytes([0x10, 0x00, 0x01]) + address + bytes([0x01, 0x00, 0xFF, 0x7F, rssi & 0xFF]) + \
+        b"\x00\x00" + bytes(7) + bytes([len(payload)]) + payload
+    return bytes([HCI_EVENT_PACKET, LE_META_EVENT, len(report) + 2, LE_EXT_ADVERTISING_REPORT, 0x01]) + report
+
+
+def test_legacy_report_round_trip():
+    assert IBeaconReportParser().parse(encode_advertising_report(*ADVERTISEMENT)) == ADVERTISEMENT
+
+
+@pytest.mark.parametrize("rssi", [-127, -1, 0, 20])
+def test_rssi_sign(rssi):
+    advertisement = ADVERTISEMENT[:5] + (rssi,)
+    assert IBeaconReportParser().parse(encode_advertising_report(*advertisement)) == advertisement
+
+
+def test_report_without_flags():
+    packet = encode_advertising_report(*ADVERTISEMENT)
+    # drops the flags AD structure and fixes the lengths it was counted in
+    packet = packet[:2] + bytes([packet[2] - 3]) + packet[3:13] + bytes([packet[13] - 3]) + packet[17:]
+    assert IBeaconReportParser().parse(packet) == ADVERTISEMENT
+
+
+def test_extended_report():
+    payload = encode_advertising_report(*ADVERTISEMENT)[14:-1]
+    assert payload.startswith(b"\x02\x01\x06" + IBEACON_PREFIX)
+    assert IBeaconReportParser().parse(_extended_report(payload, -72)) == ADVERTISEMENT
+
+
+def test_uuid_filter():
+    packet = encode_advertising_report(*ADVERTISEMENT)
+    assert IBeaconReportParser(UUID.upper()).parse(packet) == ADVERTISEMENT
+    assert IBeaconReportParser(OTHER_UUID).parse(packet) is None
+
+
+@pytest.mark.parametrize("packet", [
+    b"",
+    encode_advertising_report(*ADVERTISEMENT)[:30],
+    # not an LE meta event
+    b"\x04\x0e" + encode_advertising_report(*ADVERTISEMENT)[2:],
+    # an eddystone frame in place of the iBeacon one
+    encode_advertising_report(*ADVERTISEMENT)[:17] + b"\x03\x03\xaa\xfe" + encode_advertising_report(*ADVERTISEMENT)[21:],
+])
+def test_other_frames_are_rejected(packet):
+    assert IBeaconReportParser().parse(packet) is None
+
+
+class _FakeHciSocket:
+    """ HCI socket receiving the given packets, the monitor stops after the last one """
+
+    def __init__(self, monitor, packets):
+        self._monitor = monitor
+        self._packets = list(packets)
+
+    def recv(self, size):
+        packet = self._packets.pop(0)
+        if not self._packets:
+            self._monitor.keep_going = False
+        return packet
+
+    def close(self):
+        pass
+
+
+def test_raw_hci_monitor_counts_only_the_rejected_advertisements(monkeypatch):
+    # the HCI device is replaced, the bluetooth bindings are not needed
+    monkeypatch.setattr(beacontools_scanner, 'import_module', lambda name: SimpleNamespace())
+    advertisements = []
+    monitor = _RawHciMonitor(lambda *advertisement: advertisements.append(advertisement), 0, UUID)
+    packets = [
+        encode_advertising_report(*ADVERTISEMENT),
+        # command complete of the scan parameters, and an LE connection complete
+        bytes([HCI_EVENT_PACKET, 0x0E, 0x04, 0x01, 0x0B, 0x20, 0x00]),
+        bytes([HCI_EVENT_PACKET, LE_META_EVENT, 0x13, 0x01]) + bytes(18),
+        # an iBeacon of other UUID and an eddystone frame
+        encode_advertising_report(ADVERTISEMENT[0], OTHER_UUID, *ADVERTISEMENT[2:]),
+        encode_advertising_report(*ADVERTISEMENT)[:17] + b"\x03\x03\xaa\xfe" + encode_advertising_report(*ADVERTISEMENT)[21:],
+        encode_advertising_report(*ADVERTISEMENT),
+    ]
+    monitor.backend = SimpleNamespace(open_dev=lambda bt_device_id: _FakeHciSocket(monitor, packets))
+    monkeypatch.setattr(monitor, 'get_hci_version', lambda: None)
+    monkeypatch.setattr(monitor, 'set_scan_parameters', lambda **kwargs: None)
+    monkeypatch.setattr(monitor, 'toggle_scan', lambda enable: None)
+    monitor.run()
+    assert advertisements == [ADVERTISEMENT, ADVERTISEMENT]
+    assert monitor.dropped == 2
@@ -0,0 +1,65 @@
+import sys
+import time
+from threading import Thread, Event
+
+from ibeacon_scanner.history import BeaconHistoryStore, _connect, _SCHEMA
+from ibeacon_scanner.models import IBeacon
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def _beacons_list(count, rssi=-70):
+    return [IBeacon(f"c0:ff:ee:00:00:{minor:02x}", UUID, 1, minor, -59, rssi, "hci0") for minor in range(count)]
+
+
+def test_full_queue_drops_the_oldest_readings(tmp_path):
+    history_store = BeaconHistoryStore(str(tmp_path / "history.sqlite3"), queue_size=5)
+    history_store.append(_beacons_list(3), now=1)
+    history_store.append(_beacons_list(3), now=2)
+    assert [reading[0] for reading in history_store._queue] == [1, 1, 2, 2, 2]
+    history_store.append(_beacons_list(8), now=3)
+    assert [reading[3] for reading in history_store._queue] == [3, 4, 5, 6, 7]
+
+
+def test_appends_while_the_writer_flushes(tmp_path):
+    filepath = str(tmp_path / "history.sqlite3")
+    # the queue overflows all along, so appends drop readings while the writer takes them
+    history_store = BeaconHistoryStore(filepath, queue_size=2000)
+    connection = _connect(filepath)
+    connection.executescript(_SCHEMA)
+    stop_event, errors = Event(), []
+    started_at = time.time()
+    beacons_list = _beacons_list(250)
+    def _append():
+        cycle = 0
+        try:
+            while not stop_event.is_set():
+                history_store.append(beacons_list, now=started_at + cycle / 1000)
+                cycle += 1
+        except Exception as e:
+            errors.append(e)
+    appenders = [Thread(target=_append) for _ in range(2)]
+    # threads switch often enough to append in the middle of a flush
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    for appender in appenders:
+        appender.start()
+    try:
+        for _ in range(20):
+            history_store._flush(connection)
+    except Exception as e:
+        errors.append(e)
+    finally:
+        stop_event.set()
+        for appender in appenders:
+            appender.join()
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+    history_store._flush(connection)
+    assert not history_store._queue
+    # every reading written is counted once in the aggregates
+    (written, ), = connection.execute("SELECT COUNT(*) FROM readings")
+    (aggregated, ), = connection.execute("SELECT SUM(count) FROM readings_minute")
+    connection.close()
+    assert written and aggregated == written
@@ -0,0 +1,103 @@
+import os
+import signal
+import subprocess
+
+import pytest
+
+from metrics import services as metrics_services
+from metrics.models import MetricsRegistry, COUNTER, GAUGE, HISTOGRAM, merge_metrics_snapshots, render_metrics_text
+from persistance import shared_memory
+from persistance.shared_memory import SharedJsonStore
+
+
+def _registry():
+    metrics_registry = MetricsRegistry()
+    metrics_registry.register("advertisements_total", COUNTER, "Advertisements received")
+    metrics_registry.register("beacons", GAUGE, "Beacons of the last cycle")
+    metrics_registry.register("cycle_seconds", HISTOGRAM, "Time of a cycle", buckets=(0.1, 1))
+    return metrics_registry
+
+
+def test_snapshots_of_several_processes_are_added_up():
+    scanner_registry, worker_registry = _registry(), _registry()
+    scanner_registry.inc("advertisements_total", 3, adapter="hci0", backend="raw_hci")
+    scanner_registry.inc("advertisements_total", 1, adapter="hci1", backend="raw_hci")
+    scanner_registry.set("beacons", 12)
+    scanner_registry.observe("cycle_seconds", 0.05)
+    scanner_registry.observe("cycle_seconds", 2.0)
+    # the same labels given in other order are the same sample
+    worker_registry.inc("advertisements_total", 4, backend="raw_hci", adapter="hci0")
+    worker_registry.observe("cycle_seconds", 0.5)
+    merged_snapshot = merge_metrics_snapshots([scanner_registry.snapshot(), worker_registry.snapshot()])
+    assert merged_snapshot['advertisements_total']['samples'] == {
+        (('adapter', "hci0"), ('backend', "raw_hci")): 7,
+        (('adapter', "hci1"), ('backend', "raw_hci")): 1,
+    }
+    assert merged_snapshot['beacons']['samples'] == {(): 12}
+    assert merged_snapshot['cycle_seconds']['samples'] == {(): [1, 1, 1, 2.55]}
+    assert merged_snapshot['cycle_seconds']['type'] == HISTOGRAM
+
+
+def test_merged_snapshots_are_rendered_as_prometheus_text():
+    metrics_registry = _registry()
+    metrics_registry.inc("advertisements_total", 2, adapter='hci"0"\n')
+    metrics_registry.set("beacons", 3)
+    metrics_registry.observe("cycle_seconds", 0.05)
+    metrics_registry.observe("cycle_seconds", 0.5)
+    metrics_registry.observe("cycle_seconds", 5)
+    assert render_metrics_text(merge_metrics_snapshots([metrics_registry.snapshot()])) == "\n".join([
+        "# HELP advertisements_total Advertisements received",
+        "# TYPE advertisements_total counter",
+        'advertisements_total{adapter="hci\\"0\\"\\n"} 2',
+        "# HELP beacons Beacons of the last cycle",
+        "# TYPE beacons gauge",
+        "beacons 3",
+        "# HELP cycle_seconds Time of a cycle",
+        "# TYPE cycle_seconds histogram",
+        'cycle_seconds_bucket{le="0.1"} 1',
+        'cycle_seconds_bucket{le="1"} 2',
+        'cycle_seconds_bucket{le="+Inf"} 3',
+        "cycle_seconds_sum 5.55",
+        "cycle_seconds_count 3",
+    ]) + "\n"
+
+
+def test_metrics_without_samples_are_declared():
+    assert render_metrics_text(merge_metrics_snapshots([_registry().snapshot()])).splitlines()[:2] == [
+        "# HELP advertisements_total Advertisements received",
+        "# TYPE advertisements_total counter",
+    ]
+
+
+@pytest.fixture
+def other_process():
+    process = subprocess.Popen(["sleep", "60"])
+    yield process
+    process.kill()
+    process.wait()
+
+
+def test_the_text_adds_the_snapshots_of_the_other_processes(monkeypatch, other_process):
+    # only the store of this test is attached, the live values of this process are the ones of a new registry
+    monkeypatch.setattr(shared_memory, '_shared_stores', {})
+    monkeypatch.setattr(metrics_services, '_metrics_registry', _registry())
+    metrics_services._metrics_registry.inc("advertisements_total", 2, adapter="hci0")
+    other_registry = _registry()
+    other_registry.inc("advertisements_total", 5, adapter="hci0")
+    store_name = f"{metrics_services.METRICS_SHM_PREFIX}{other_process.pid}"
+    metrics_store = SharedJsonStore.create(store_name, metrics_services.METRICS_SHM_CAPACITY)
+    try:
+        metrics_store.write_dict(other_registry.snapshot())
+        assert 'advertisements_total{adapter="hci0"} 7' in metrics_services.metrics_get_text().splitlines()
+
+        # a killed process can not unlink its store, the next read removes it
+        other_process.send_signal(signal.SIGKILL)
+        other_process.wait()
+        assert 'advertisements_total{adapter="hci0"} 2' in metrics_services.metrics_get_text().splitlines()
+        assert not os.path.exists(f"/dev/shm/{store_name}")
+    finally:
+        for attached_store in shared_memory._shared_stores.values():
+            attached_store.close()
+        metrics_store.close()
+        if os.path.exists(f"/dev/shm/{store_name}"):
+            os.remove(f"/dev/shm/{store_name}")
@@ -0,0 +1,85 @@
+import uuid
+
+from ibeacon_scanner.backends import MultiAdapterBeaconScanner
+from ibeacon_scanner.models import IBeacon, IBeaconTable, IBeaconWindow
+from persistance.shared_memory import SharedBeaconsStore
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+class _Backend:
+
+    def __init__(self, callback, adapter_id):
+        self.callback = callback
+        self.adapter_id = adapter_id
+        self.dropped = int(adapter_id[-1])
+        self.started = False
+
+    def start(self):
+        self.started = True
+        self.callback("c0:ff:ee:00:00:01", UUID, 1, 1, -59, -60 - int(self.adapter_id[-1]))
+
+    def stop(self):
+        self.started = False
+
+
+def _beacon(rssi, adapter, minor=1):
+    return IBeacon(f"c0:ff:ee:00:00:{minor:02x}", UUID, 1, minor, -59, rssi, adapter)
+
+
+def test_every_adapter_tags_its_advertisements():
+    advertisements = []
+    scanner = MultiAdapterBeaconScanner(lambda *advertisement: advertisements.append(advertisement), _Backend,
+        {"hci0": 0, "hci1": 1, "hci2": 2})
+    scanner.start()
+    assert scanner.adapter_ids == ["hci0", "hci1", "hci2"]
+    assert [advertisement[0] for advertisement in advertisements] == ["hci0", "hci1", "hci2"]
+    assert advertisements[1] == ("hci1", "c0:ff:ee:00:00:01", UUID, 1, 1, -59, -61)
+    assert scanner.dropped == 3
+    scanner.stop()
+    assert not any(backend.started for backend in scanner._backends)
+
+
+def test_table_keeps_the_strongest_reading_of_each_adapter():
+    beacons_table = IBeaconTable()
+    for rssi, adapter in ((-80, "hci0"), (-70, "hci1"), (-75, "hci0"), (-72, "hci1"), (-90, "hci2")):
+        beacons_table.add(_beacon(rssi, adapter))
+    beacon, = beacons_table.beacons()
+    assert (beacon.rssi, beacon.adapter) == (-70, "hci1")
+    assert beacon.adapters_rssi == {"hci0": -75, "hci1": -70, "hci2": -90}
+    assert beacons_table.take_received() == {"hci0": 2, "hci1": 2, "hci2": 1}
+    assert beacons_table.take_received() == {}
+
+
+def test_window_snapshots_the_best_adapter_within_the_window():
+    beacons_window = IBeaconWindow(window=3)
+    beacons_window.add(_beacon(-60, "hci0"), now=0)
+    beacons_window.add(_beacon(-75, "hci1"), now=2)
+    beacons_window.add(_beacon(-80, "hci0", minor=2), now=2)
+    beacons = {beacon.minor: beacon for beacon in beacons_window.snapshot(now=2.5)}
+    assert (beacons[1].rssi, beacons[1].adapter, beacons[1].adapters_rssi) == (-60, "hci0", {"hci0": -60, "hci1": -75})
+    # the strongest reading expired, the beacon is as strong as the adapters still hearing it
+    beacons = {beacon.minor: beacon for beacon in beacons_window.snapshot(now=4)}
+    assert (beacons[1].rssi, beacons[1].adapter, beacons[1].adapters_rssi) == (-75, "hci1", {"hci1": -75})
+    assert beacons_window.snapshot(now=10) == []
+
+
+def test_beacons_store_keeps_the_strongest_adapters_of_each_beacon():
+    beacons_store = SharedBeaconsStore.create(f"test_beacons_{uuid.uuid4().hex[:8]}", 2)
+    try:
+        adapters_rssi = {"hci0": -80, "hci1": -61, "hci2": -70, "hci3": -90, "hci4": -65}
+        beacons_list = [
+            dict(_beacon(-61, "hci1").to_json(), adapters_rssi=adapters_rssi),
+            _beacon(-70, None, minor=2).to_json(),
+            _beacon(-99, "hci0", minor=3).to_json(),
+        ]
+        beacons_store.write_beacons_data({'beacons_list': beacons_list})
+        beacons_data = beacons_store.read_beacons_data()
+        assert beacons_data['nearest_beacon'] == dict(
+            beacons_list[0], adapters_rssi={"hci1": -61, "hci4": -65, "hci2": -70, "hci0": -80})
+        # beyond the capacity of the store
+        assert [beacon['minor'] for beacon in beacons_data['beacons_list']] == [1, 2]
+        assert beacons_data['beacons_list'][1] == beacons_list[1]
+    finally:
+        beacons_store.unlink()
@@ -0,0 +1,152 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from ibeacon_scanner import positioning, services
+from ibeacon_scanner.models import IBeacon
+from ibeacon_scanner.positioning import PositioningEngine, trilaterate, calibrate_path_loss, estimate_distance
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+ANCHORS = np.array([[0.0, 0.0], [10.0, 0.0], [0.0, 10.0], [10.0, 10.0]])
+SCANNER_POSITIONS = {
+    f"hci{column}": {'x': x, 'y': y} for column, (x, y) in enumerate(ANCHORS.tolist())
+}
+TAGS = np.array([[3.0, 4.0], [7.5, 2.0], [5.0, 5.0], [9.0, 9.5]])
+
+
+def _ranges(tags, anchors=ANCHORS):
+    return np.linalg.norm(tags[:, None, :] - anchors[None, :, :], axis=2)
+
+
+def _beacon(minor, position, adapters=SCANNER_POSITIONS, tx_power=-59):
+    """ Beacon heard by the adapters with the RSSI of its distance to each of them in free space """
+    adapters_rssi = {
+        adapter: round(tx_power - 20 * np.log10(np.hypot(position[0] - scanner['x'], position[1] - scanner['y'])), 6)
+        for adapter, scanner in adapters.items()
+    }
+    return IBeacon(f"c0:ff:ee:00:00:{minor:02x}", UUID, 1, minor, tx_power, max(adapters_rssi.values()), "hci0",
+                   adapters_rssi)
+
+
+def test_trilaterate_solves_the_positions_of_exact_ranges():
+    positions, errors = trilaterate(ANCHORS, _ranges(TAGS), np.ones((len(TAGS), len(ANCHORS)), dtype=bool))
+    np.testing.assert_allclose(positions, TAGS, atol=1e-6)
+    np.testing.assert_allclose(errors, 0, atol=1e-6)
+
+
+def test_trilaterate_uses_only_the_scanners_that_heard_each_tag():
+    mask = np.array([[True, True, True, False], [False, True, True, True], [True, False, True, True], [True] * 4])
+    # a range that was not heard must not count, whatever its value
+    distances = np.where(mask, _ranges(TAGS), 1000.0)
+    positions, errors = trilaterate(ANCHORS, distances, mask)
+    np.testing.assert_allclose(positions, TAGS, atol=1e-6)
+    np.testing.assert_allclose(errors, 0, atol=1e-6)
+
+
+def test_trilaterate_refines_noisy_ranges_to_the_nearest_fit():
+    noise = np.array([[0.2, -0.3, 0.1, 0.25], [-0.1, 0.15, -0.2, 0.3], [0.3, 0.2, -0.25, -0.1], [0.1, -0.2, 0.2, -0.05]])
+    positions, errors = trilaterate(ANCHORS, _ranges(TAGS) + noise, np.ones(noise.shape, dtype=bool))
+    assert np.linalg.norm(positions - TAGS, axis=1).max() < 0.5
+    assert (errors > 0).all() and (errors < 0.3).all()
+
+
+def test_trilaterate_leaves_unsolved_the_tags_of_less_than_three_or_collinear_scanners():
+    mask = np.array([[True, True, False, False], [True] * 4])
+    positions, errors = trilaterate(ANCHORS, _ranges(TAGS[:2]), mask)
+    assert np.isnan(positions[0]).all() and np.isnan(errors[0])
+    np.testing.assert_allclose(positions[1], TAGS[1], atol=1e-6)
+
+    collinear_anchors = np.array([[0.0, 0.0], [5.0, 0.0], [10.0, 0.0]])
+    positions, errors = trilaterate(collinear_anchors, _ranges(TAGS[:1], collinear_anchors), np.ones((1, 3), dtype=bool))
+    assert np.isnan(positions).all() and np.isnan(errors).all()
+
+
+def test_trilaterate_keeps_inconsistent_ranges_within_the_margin():
+    distances = np.array([[1.0, 200.0, 1.0, 200.0]])
+    positions, _ = trilaterate(ANCHORS, distances, np.ones((1, 4), dtype=bool), margin=2.0)
+    assert (positions >= ANCHORS.min(axis=0) - 2.0).all() and (positions <= ANCHORS.max(axis=0) + 2.0).all()
+
+
+def test_calibration_recovers_the_path_loss_of_the_readings():
+    distances = np.array([0.5, 1.0, 2.0, 4.0, 8.0, 16.0])
+    tx_powers = np.full(len(distances), -59.0)
+    # readings of a scanner that hears 3 dB too low through walls
+    rssis = tx_powers - 10 * 2.7 * np.log10(distances) - 3.0
+    calibration = calibrate_path_loss(distances, rssis, tx_powers)
+    assert calibration['path_loss_exponent'] == pytest.approx(2.7)
+    assert calibration['rssi_offset'] == pytest.approx(3.0)
+    np.testing.assert_allclose(estimate_distance(rssis, tx_powers, **calibration), distances)
+
+
+def test_engine_locates_the_beacons_with_the_scanner_calibration():
+    adapters = dict(SCANNER_POSITIONS, hci3=dict(SCANNER_POSITIONS['hci3'], path_loss_exponent=3.0, rssi_offset=2.0))
+    beacon = _beacon(1, (3.0, 4.0))
+    # hci3 hears through walls, the engine must correct its reading with its own calibration
+    distance = np.hypot(7.0, 6.0)
+    beacon.adapters_rssi['hci3'] = -59 - 30 * np.log10(distance) - 2.0
+    beacon.adapters_rssi['hci9'] = -65
+    positioning_engine = PositioningEngine(adapters)
+    assert positioning_engine.update([beacon], now=100.0) == 1
+    position, = positioning_engine.snapshot()
+    assert (position['x'], position['y'], position['error']) == (3.0, 4.0, 0.0)
+    assert position['updated_at'] == 100.0
+    assert position['distances']['hci3'] == round(distance, 3)
+    # a scanner at unknown coordinates still gives a distance, with the default calibration
+    assert position['distances']['hci9'] == round(10 ** (6 / 20), 3)
+
+
+def test_beacons_beyond_the_budget_keep_their_position_and_go_first_next_cycle(monkeypatch):
+    clock = [0.0]
+    monkeypatch.setattr(positioning, 'time', SimpleNamespace(perf_counter=lambda: clock[0], time=time.time))
+    positioning_engine = PositioningEngine(SCANNER_POSITIONS, budget=0.055)
+    solve_batch = positioning_engine._solve_batch
+
+    def _solve_batch(batch, now):
+        # every beacon takes 10 milliseconds to solve
+        clock[0] += 0.01 * len(batch)
+        solve_batch(batch, now)
+
+    monkeypatch.setattr(positioning_engine, '_solve_batch', _solve_batch)
+    beacons = [_beacon(minor, (1.0 + minor, 2.0)) for minor in range(8)]
+    # the first cycle does not know yet how long a beacon takes
+    assert positioning_engine.update(beacons, now=1.0) == 8
+    assert positioning_engine.skipped == 0
+
+    assert positioning_engine.update(beacons, now=2.0) == 5
+    assert positioning_engine.skipped == 3
+    updated_at = {position['minor']: position['updated_at'] for position in positioning_engine.snapshot()}
+    assert sorted(updated_at.values()) == [1.0] * 3 + [2.0] * 5
+    assert len(positioning_engine.snapshot()) == 8
+    assert {position['minor']: position['x'] for position in positioning_engine.snapshot()} == {
+        minor: 1.0 + minor for minor in range(8)}
+
+    # the beacons left out are solved first
+    assert positioning_engine.update(beacons, now=3.0) == 5
+    assert all(position['updated_at'] == 3.0 for position in positioning_engine.snapshot()
+               if updated_at[position['minor']] == 1.0)
+
+
+def test_beacons_gone_are_forgotten():
+    positioning_engine = PositioningEngine(SCANNER_POSITIONS)
+    beacons = [_beacon(minor, (5.0, 5.0)) for minor in range(3)]
+    positioning_engine.update(beacons)
+    positioning_engine.update(beacons[1:])
+    assert sorted(position['minor'] for position in positioning_engine.snapshot()) == [1, 2]
+
+
+@pytest.mark.parametrize('scanner_positions', [{}, {'HCI0': {'X': 0, 'Y': 0}, 'HCI1': {'X': 10, 'Y': 0}}])
+def test_positioning_is_skipped_with_less_than_three_scanners(monkeypatch, scanner_positions):
+    monkeypatch.setattr(services, 'SCANNER_POSITIONS', scanner_positions)
+    assert services._create_positioning_engine() is None
+
+
+def test_positioning_runs_with_three_scanners(monkeypatch):
+    # settings keys are uppercased when loaded
+    monkeypatch.setattr(services, 'SCANNER_POSITIONS', {
+        'HCI0': {'X': 0, 'Y': 0}, 'HCI1': {'X': 10, 'Y': 0}, 'HCI2': {'X': 0, 'Y': 10}})
+    positioning_engine = services._create_positioning_engine()
+    assert positioning_engine.adapters == ["hci0", "hci1", "hci2"]
+    assert positioning_engine.budget == services.POSITIONING_BUDGET
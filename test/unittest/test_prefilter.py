@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from ibeacon_scanner.prefilter import BeaconPrefilter, parse_filter_rules, ANY_UUID, MAX_IDENTIFIER
+from ibeacon_scanner.services import _backend_uuid_filter
+
+
+UUID_A = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+UUID_B = "11111111-2222-3333-4444-555555555555"
+
+
+def _naive_match(rules, beacon_uuid, major, minor):
+    return not rules or any(
+        rule_uuid in (ANY_UUID, beacon_uuid) and major_low <= major <= major_high and minor_low <= minor <= minor_high
+        for rule_uuid, (major_low, major_high), (minor_low, minor_high) in rules)
+
+
+def test_empty_filter_accepts_everything():
+    beacon_prefilter = BeaconPrefilter("")
+    assert beacon_prefilter.match(UUID_B, 1, 1) and beacon_prefilter.uuids is None and beacon_prefilter.rejected == 0
+
+
+def test_uuids_string():
+    beacon_prefilter = BeaconPrefilter(f"{UUID_A.upper()}, {UUID_B}")
+    assert beacon_prefilter.uuids == sorted([UUID_A, UUID_B])
+    assert beacon_prefilter.match(UUID_A, 0, MAX_IDENTIFIER)
+    assert not beacon_prefilter.match("00000000-0000-0000-0000-000000000000", 1, 1)
+    assert beacon_prefilter.rejected == 1
+
+
+def test_ranges():
+    beacon_prefilter = BeaconPrefilter([
+        {'uuid': UUID_A, 'major': 11, 'minor': [10, 20]},
+        {'uuid': UUID_A, 'major': [11, 12], 'minor': [21, 30]},
+        {'major': 500},
+    ])
+    assert beacon_prefilter.uuids is None
+    assert beacon_prefilter.match(UUID_A, 11, 25) and beacon_prefilter.match(UUID_A, 12, 30)
+    assert not beacon_prefilter.match(UUID_A, 12, 15) and not beacon_prefilter.match(UUID_A, 13, 25)
+    assert beacon_prefilter.match(UUID_B, 500, 0) and not beacon_prefilter.match(UUID_B, 11, 15)
+
+
+@pytest.mark.parametrize("uuid_filter", [
+    "not-a-uuid",
+    {'uuid': UUID_A},
+    [{'uuid': UUID_A, 'mayor': 1}],
+    [{'uuid': UUID_A, 'major': [2, 1]}],
+    [{'uuid': UUID_A, 'minor': MAX_IDENTIFIER + 1}],
+    [{'uuid': UUID_A, 'major': True}],
+])
+def test_malformed_filter_keeps_current_rules(uuid_filter):
+    beacon_prefilter = BeaconPrefilter(UUID_A)
+    with pytest.raises(ValueError):
+        beacon_prefilter.update(uuid_filter)
+    assert beacon_prefilter.uuids == [UUID_A]
+
+
+def test_matches_like_every_rule_checked_one_by_one():
+    rnd = random.Random(7)
+    def _range(maximum):
+        low = rnd.randint(0, maximum)
+        return [low, rnd.randint(low, maximum)]
+    for _ in range(50):
+        uuid_filter = [
+            {'uuid': rnd.choice([UUID_A, UUID_B, None]), 'major': _range(40), 'minor': _range(40)}
+            for _ in range(rnd.randint(1, 8))
+        ]
+        rules = parse_filter_rules(uuid_filter)
+        beacon_prefilter = BeaconPrefilter(uuid_filter)
+        for _ in range(200):
+            advertisement = (rnd.choice([UUID_A, UUID_B]), rnd.randint(0, 45), rnd.randint(0, 45))
+            assert beacon_prefilter.match(*advertisement) == _naive_match(rules, *advertisement), uuid_filter
+
+
+@pytest.mark.parametrize("uuid_filter, fake_scan, backend_uuid_filter", [
+    ("", False, None),
+    (UUID_A, False, UUID_A),
+    ([{'uuid': UUID_A, 'major': 11}], False, UUID_A),
+    (f"{UUID_A},{UUID_B}", False, None),
+    # fake backends simulate beacons of the first UUID accepted
+    (f"{UUID_A},{UUID_B}", True, UUID_B),
+])
+def test_backend_uuid_filter(uuid_filter, fake_scan, backend_uuid_filter):
+    assert _backend_uuid_filter(BeaconPrefilter(uuid_filter), fake_scan) == backend_uuid_filter
@@ -0,0 +1,80 @@
+from datetime import datetime
+
+from ibeacon_scanner import presence
+from ibeacon_scanner.models import IBeacon
+from ibeacon_scanner.presence import PresenceTracker
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+# a local midnight far from daylight saving time changes
+MIDNIGHT = datetime(2026, 1, 15).timestamp()
+NOON = MIDNIGHT + 12 * 3600
+
+
+def _beacon(minor):
+    return IBeacon(f"c0:ff:ee:00:00:{minor:02x}", UUID, 1, minor, -59, -60, "hci0")
+
+
+def _presence(presence_tracker, minor, now):
+    return next(beacon_presence for beacon_presence in presence_tracker.snapshot(now) if beacon_presence['minor'] == minor)
+
+
+def test_readings_within_the_grace_period_extend_the_session():
+    presence_tracker = PresenceTracker(grace_period=30)
+    for elapsed in (0, 10, 35, 60):
+        presence_tracker.update([_beacon(1)], now=NOON + elapsed)
+    beacon_presence = _presence(presence_tracker, 1, NOON + 60)
+    assert beacon_presence['sessions'] == 1
+    assert (beacon_presence['first_seen'], beacon_presence['session_started_at']) == (NOON, NOON)
+    assert beacon_presence['dwell_seconds'] == beacon_presence['dwell_today_seconds'] == 60
+    assert beacon_presence['present']
+
+
+def test_a_dropout_longer_than_the_grace_period_starts_a_new_session():
+    presence_tracker = PresenceTracker(grace_period=30)
+    presence_tracker.update([_beacon(1), _beacon(2)], now=NOON)
+    presence_tracker.update([_beacon(1), _beacon(2)], now=NOON + 20)
+    presence_tracker.update([_beacon(1)], now=NOON + 51)
+    # beacon 1 was gone for 31 seconds, the time it was away is not dwell
+    beacon_presence = _presence(presence_tracker, 1, NOON + 51)
+    assert (beacon_presence['sessions'], beacon_presence['session_started_at']) == (2, NOON + 51)
+    assert beacon_presence['dwell_seconds'] == 20
+    # beacon 2 is present until its grace period runs out, by time alone
+    assert _presence(presence_tracker, 2, NOON + 50)['present']
+    assert not _presence(presence_tracker, 2, NOON + 51)['present']
+    assert [beacon_presence['minor'] for beacon_presence in presence_tracker.snapshot(NOON + 51)] == [1, 2]
+
+
+def test_beacons_not_seen_for_the_retention_are_forgotten(monkeypatch):
+    presence_tracker = PresenceTracker(grace_period=30, retention=3600)
+    presence_tracker.update([_beacon(1), _beacon(2)], now=NOON)
+    presence_tracker.update([_beacon(2)], now=NOON + 1800)
+    # beacons are pruned at most once per PRUNE_INTERVAL
+    presence_tracker.update([_beacon(2)], now=NOON + 3601)
+    assert len(presence_tracker.snapshot(NOON + 3601)) == 2
+    monkeypatch.setattr(presence, 'PRUNE_INTERVAL', -1)
+    presence_tracker.update([_beacon(2)], now=NOON + 3601)
+    assert [beacon_presence['minor'] for beacon_presence in presence_tracker.snapshot(NOON + 3601)] == [2]
+    # a beacon seen again after being forgotten starts over
+    presence_tracker.update([_beacon(1)], now=NOON + 3700)
+    assert _presence(presence_tracker, 1, NOON + 3700)['first_seen'] == NOON + 3700
+
+
+def test_a_visit_across_midnight_splits_its_dwell_between_the_days():
+    presence_tracker = PresenceTracker(grace_period=30)
+    for now in (MIDNIGHT - 40, MIDNIGHT - 20, MIDNIGHT + 5, MIDNIGHT + 25):
+        presence_tracker.update([_beacon(1)], now=now)
+    beacon_presence = _presence(presence_tracker, 1, MIDNIGHT + 25)
+    assert beacon_presence['sessions'] == 1
+    assert beacon_presence['dwell_seconds'] == 65
+    # only the 25 seconds after midnight are of the new day
+    assert beacon_presence['dwell_today_seconds'] == 25
+
+
+def test_the_dwell_of_an_older_day_is_not_today():
+    presence_tracker = PresenceTracker(grace_period=30)
+    presence_tracker.update([_beacon(1)], now=MIDNIGHT - 40)
+    presence_tracker.update([_beacon(1)], now=MIDNIGHT - 20)
+    assert _presence(presence_tracker, 1, MIDNIGHT - 20)['dwell_today_seconds'] == 20
+    beacon_presence = _presence(presence_tracker, 1, MIDNIGHT + 3600)
+    assert (beacon_presence['dwell_seconds'], beacon_presence['dwell_today_seconds']) == (20, 0.0)
@@ -0,0 +1,156 @@
+import os
+import time
+import tracemalloc
+from threading import Event
+
+import pytest
+from flask import Flask, jsonify
+from flask_restful import Api
+
+from ibeacon_scanner import services, resources
+from ibeacon_scanner.control import ControlChannel
+from ibeacon_scanner.profiling import PROFILE_CPU, PROFILE_MEMORY, profile_cpu, trace_memory
+
+
+PROFILE_TIMEOUT = 5
+
+
+def test_a_cpu_profile_counts_the_stacks_of_every_thread(tmp_path):
+    filepaths = profile_cpu(str(tmp_path / "profiles"), 0.1, interval=0.005)
+    assert [os.path.basename(filepath).split("-")[0] for filepath in filepaths] == [PROFILE_CPU]
+    with open(filepaths[0]) as folded_file:
+        folded_lines = folded_file.read().splitlines()
+    # the thread asleep in profile_cpu is sampled, the sampler itself is not
+    assert any(line.startswith("MainThread;") and "profile_cpu (profiling.py:" in line for line in folded_lines)
+    assert not any(line.startswith("stack_sampler;") for line in folded_lines)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in folded_lines)
+
+
+def test_a_memory_profile_writes_its_statistics_and_snapshot(tmp_path):
+    filepaths = trace_memory(str(tmp_path / "profiles"), 0.01)
+    assert [os.path.splitext(filepath)[1] for filepath in filepaths] == [".txt", ".tracemalloc"]
+    with open(filepaths[0]) as stats_file:
+        assert stats_file.readline().startswith("Traced during 0.01s:")
+    assert isinstance(tracemalloc.Snapshot.load(filepaths[1]), tracemalloc.Snapshot)
+    # nothing is traced once the profile ends
+    assert not tracemalloc.is_tracing()
+
+
+@pytest.fixture
+def control_channel(tmp_path, monkeypatch):
+    control_channel = ControlChannel(str(tmp_path / "control.sock"))
+    monkeypatch.setattr(services, 'FILEPATH_CONTROL_SOCKET', control_channel.filepath)
+    yield control_channel
+    control_channel.close()
+
+
+def test_a_profile_request_reaches_the_scanner_process(control_channel):
+    assert services.ibeacon_start_profile(PROFILE_MEMORY, 2.5)
+    assert services.ibeacon_start_profile()
+    assert control_channel.receive(timeout=1) == [
+        {'type': 'profile', 'kind': PROFILE_MEMORY, 'duration': 2.5},
+        {'type': 'profile', 'kind': PROFILE_CPU, 'duration': services.PROFILE_DURATION},
+    ]
+
+
+@pytest.mark.parametrize('kind, duration', [
+    ("heap", 1), (PROFILE_CPU, 0), (PROFILE_CPU, -1), (PROFILE_CPU, True), (PROFILE_CPU, "10"),
+    (PROFILE_CPU, services.MAX_PROFILE_DURATION + 1),
+])
+def test_profile_parameters_are_validated(control_channel, kind, duration):
+    with pytest.raises(ValueError):
+        services.ibeacon_start_profile(kind, duration)
+    assert control_channel.receive(timeout=0.01) == []
+
+
+def test_no_profile_is_requested_while_the_scanner_is_not_running(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, 'FILEPATH_CONTROL_SOCKET', str(tmp_path / "control.sock"))
+    assert not services.ibeacon_start_profile(PROFILE_CPU, 1)
+
+
+@pytest.fixture
+def blocked_profiles(tmp_path, monkeypatch):
+    """ Profiles started by the scanner process run until release is set """
+    started, release = [], Event()
+
+    def _profile(kind):
+        def _run(directory, duration, *args):
+            started.append((kind, duration))
+            release.wait(PROFILE_TIMEOUT)
+            return []
+        return _run
+
+    monkeypatch.setattr(services, 'DIRECTORY_PROFILES', str(tmp_path))
+    monkeypatch.setattr(services, '_running_profiles', set())
+    monkeypatch.setattr(services, 'profile_cpu', _profile(PROFILE_CPU))
+    monkeypatch.setattr(services, 'trace_memory', _profile(PROFILE_MEMORY))
+    yield started, release
+    release.set()
+
+
+def _wait_for(condition):
+    deadline = time.monotonic() + PROFILE_TIMEOUT
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def test_a_profile_is_rejected_while_one_of_its_kind_runs(blocked_profiles):
+    started, release = blocked_profiles
+    services._start_profile(PROFILE_CPU, 10)
+    _wait_for(lambda: started == [(PROFILE_CPU, 10)])
+    services._start_profile(PROFILE_CPU, 20)
+    # a profile of the other kind runs alongside
+    services._start_profile(PROFILE_MEMORY, 30)
+    _wait_for(lambda: len(started) == 2)
+    assert started == [(PROFILE_CPU, 10), (PROFILE_MEMORY, 30)]
+    assert services._running_profiles == {PROFILE_CPU, PROFILE_MEMORY}
+
+    release.set()
+    _wait_for(lambda: not services._running_profiles)
+    services._start_profile(PROFILE_CPU, 40)
+    _wait_for(lambda: len(started) == 3)
+    assert started[2] == (PROFILE_CPU, 40)
+
+
+def test_control_messages_cap_the_profile_duration(blocked_profiles):
+    started, _ = blocked_profiles
+    services._apply_control_message({}, {'type': 'profile', 'kind': PROFILE_CPU, 'duration': 10 ** 6})
+    services._apply_control_message({}, {'type': 'profile', 'kind': "heap"})
+    _wait_for(lambda: started)
+    assert started == [(PROFILE_CPU, services.MAX_PROFILE_DURATION)]
+
+
+def test_only_the_newest_profiles_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(services, 'DIRECTORY_PROFILES', str(tmp_path))
+    monkeypatch.setattr(services, 'MAX_PROFILE_FILES', 2)
+    for number in range(4):
+        filepath = tmp_path / f"cpu-{number}.folded"
+        filepath.write_text("MainThread 1\n")
+        os.utime(filepath, (number, number))
+    services._remove_old_profiles()
+    assert [profile['filename'] for profile in services.ibeacon_get_profiles()] == ["cpu-3.folded", "cpu-2.folded"]
+
+
+@pytest.fixture
+def client(control_channel):
+    application = Flask(__name__)
+    # as the service application does, errors raised by the resources are bad requests
+    application.config['PROPAGATE_EXCEPTIONS'] = True
+    application.errorhandler(Exception)(lambda e: (jsonify({'message': str(e)}), 400))
+    resources.ibeacon_add_http_resources_to_api(Api(application), "ibeacon_scanner")
+    return application.test_client()
+
+
+def test_profiles_are_requested_over_http(client, control_channel, monkeypatch):
+    response = client.post("/ibeacon_scanner/profile", json={'kind': PROFILE_MEMORY, 'duration': 5})
+    assert response.status_code == 202
+    assert response.json == {'status': 'profiling', 'kind': PROFILE_MEMORY, 'duration': 5}
+    assert control_channel.receive(timeout=1) == [{'type': 'profile', 'kind': PROFILE_MEMORY, 'duration': 5}]
+
+    response = client.post("/ibeacon_scanner/profile", json={'duration': services.MAX_PROFILE_DURATION + 1})
+    assert response.status_code == 400
+    assert str(services.MAX_PROFILE_DURATION) in response.json['message']
+
+    monkeypatch.setattr(services, 'FILEPATH_CONTROL_SOCKET', f"{control_channel.filepath}.missing")
+    assert client.post("/ibeacon_scanner/profile").status_code == 503
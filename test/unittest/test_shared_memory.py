@@ -0,0 +1,142 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from persistance import shared_memory
+from persistance.shared_memory import SharedJsonStore, SharedBeaconsStore, _SEQ, _SEQ_OFFSET, _READ_RETRIES
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+@pytest.fixture
+def store_name(request):
+    # stores of the test must not meet the ones of a scanner running on the host
+    name = f"ibeacon_test_{request.node.name[:40]}_{os.getpid()}"
+    yield name
+    try:
+        shared_memory._unlink_segment(shared_memory._open_segment(name))
+    except FileNotFoundError:
+        pass
+
+
+def _begin_write(shared_store):
+    """ Leaves the sequence counter odd, as a writer does while it copies the payload """
+    seq = shared_store.version()
+    _SEQ.pack_into(shared_store._shm.buf, _SEQ_OFFSET, seq + 1)
+    return seq
+
+
+def _patch_sleep(monkeypatch, sleep):
+    """ Calls sleep between the retries of a read instead of yielding the processor """
+    monkeypatch.setattr(shared_memory, 'time', SimpleNamespace(sleep=sleep, monotonic=shared_memory.time.monotonic))
+
+
+def test_a_written_payload_is_read_by_other_attachment(store_name):
+    owner_store = SharedJsonStore.create(store_name, 1024)
+    reader_store = SharedJsonStore.attach(store_name)
+    try:
+        version = owner_store.version()
+        assert version % 2 == 0
+        assert reader_store.read_dict() == {}
+        owner_store.write_dict({'run_flag': True, 'scan_tick': 3})
+        assert reader_store.read_dict() == {'run_flag': True, 'scan_tick': 3}
+        assert reader_store.version() == version + 2
+        assert reader_store.read() == (version + 2, b'{"run_flag":true,"scan_tick":3}')
+        with pytest.raises(ValueError):
+            owner_store.write(b"x" * 1025)
+    finally:
+        reader_store.close()
+        owner_store.unlink()
+
+
+def test_beacons_are_read_back_as_written(store_name):
+    beacons_list = [{
+        'mac_address': f"c0:ff:ee:00:00:{minor:02x}", 'uuid': UUID, 'major': 11, 'minor': minor,
+        'tx_power': -59, 'rssi': -40 - minor, 'adapter': "hci1",
+        'adapters_rssi': {f"hci{adapter}": -40 - minor - adapter for adapter in range(6)},
+    } for minor in range(4)]
+    beacons_store = SharedBeaconsStore.create(store_name, 3)
+    try:
+        beacons_store.write_beacons_data({'beacons_list': beacons_list})
+        beacons_data = beacons_store.read_beacons_data()
+        # truncated to the store capacity, and to the strongest adapters of each beacon
+        assert beacons_data['beacons_list'] == [
+            dict(beacon, adapters_rssi={f"hci{adapter}": -40 - beacon['minor'] - adapter for adapter in range(4)})
+            for beacon in beacons_list[:3]
+        ]
+        assert beacons_data['nearest_beacon'] == beacons_data['beacons_list'][0]
+    finally:
+        beacons_store.unlink()
+
+
+def test_a_read_during_a_write_retries_until_the_write_ends(store_name, monkeypatch):
+    shared_store = SharedJsonStore.create(store_name, 1024)
+    try:
+        shared_store.write_dict({'scan_tick': 3})
+        seq = _begin_write(shared_store)
+        retries = []
+
+        def _sleep(seconds):
+            # the writer finishes while the reader waits for its third retry
+            retries.append(seconds)
+            if len(retries) == 3:
+                shared_store._shm.buf[shared_memory._HEADER.size + 13] = ord("5")
+                _SEQ.pack_into(shared_store._shm.buf, _SEQ_OFFSET, seq + 2)
+
+        _patch_sleep(monkeypatch, _sleep)
+        assert shared_store.read_dict() == {'scan_tick': 5}
+        assert len(retries) == 3
+    finally:
+        shared_store.unlink()
+
+
+def test_a_read_gives_up_on_a_writer_that_never_ends(store_name, monkeypatch):
+    shared_store = SharedJsonStore.create(store_name, 1024)
+    try:
+        _begin_write(shared_store)
+        retries = []
+        _patch_sleep(monkeypatch, retries.append)
+        assert shared_store.read() is None
+        assert shared_store.read_dict() is None
+        assert len(retries) == 2 * _READ_RETRIES
+    finally:
+        shared_store.unlink()
+
+
+def test_a_closed_store_refuses_writes(store_name):
+    owner_store = SharedJsonStore.create(store_name, 1024)
+    reader_store = SharedJsonStore.attach(store_name)
+    reader_store.close()
+    assert reader_store.closed
+    with pytest.raises(ValueError):
+        reader_store.write_dict({'scan_tick': 3})
+    owner_store.unlink()
+    assert owner_store.closed
+    with pytest.raises(ValueError):
+        owner_store.write_dict({'scan_tick': 3})
+
+
+def test_readers_see_the_store_closed_once_its_owner_unlinks_or_replaces_it(store_name, monkeypatch):
+    monkeypatch.setattr(shared_memory, '_REATTACH_CHECK_INTERVAL', 0)
+    owner_store = SharedJsonStore.create(store_name, 1024)
+    reader_store = SharedJsonStore.attach(store_name)
+    assert not reader_store.closed
+    owner_store.unlink()
+    assert reader_store.closed
+    reader_store.close()
+
+    # a killed owner leaves its segment unmarked, the next one replaces it under the same name
+    stale_store = SharedJsonStore.create(store_name, 1024)
+    reader_store = SharedJsonStore.attach(store_name)
+    new_store = SharedJsonStore.create(store_name, 1024)
+    new_reader_store = SharedJsonStore.attach(store_name)
+    try:
+        assert not stale_store._closed and reader_store.closed
+        assert not new_reader_store.closed
+    finally:
+        new_reader_store.close()
+        reader_store.close()
+        stale_store.close()
+        new_store.unlink()
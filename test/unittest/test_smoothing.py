@@ -0,0 +1,94 @@
+import pytest
+
+from ibeacon_scanner import services
+from ibeacon_scanner.diff import IBeaconDiffEngine
+from ibeacon_scanner.models import IBeacon
+from ibeacon_scanner.prefilter import BeaconPrefilter
+from ibeacon_scanner.smoothing import RssiSmoother
+
+
+UUID = "ffffffff-bbbb-cccc-dddd-eeeeeeeeeeee"
+MAC_ADDRESS = "c0:ff:ee:00:00:01"
+
+
+class _Backend:
+    """ Scanner backend handing the readings of each scan to the scanner callback """
+
+    adapter_ids = ["hci0"]
+    dropped = 0
+
+    def __init__(self, callback, readings):
+        self.callback = callback
+        self.readings = readings
+
+    def start(self):
+        for rssi in self.readings:
+            self.callback("hci0", MAC_ADDRESS, UUID, 1, 1, -59, rssi)
+
+    def stop(self):
+        pass
+
+
+class _ControlChannel:
+
+    def wait(self, timeout=None):
+        return False
+
+
+@pytest.fixture
+def published(monkeypatch):
+    """ Beacons data written by the scanner, events are not published """
+    beacons_data = []
+    monkeypatch.setattr(services, '_write_beacons_data', beacons_data.append)
+    monkeypatch.setattr(services, '_write_beacons_table', lambda beacons_list: None)
+    monkeypatch.setattr(services, 'publish_event', lambda event: True)
+    return beacons_data
+
+
+def _published_rssi(published):
+    return [beacon['rssi'] for beacon in published[-1]['beacons_list']]
+
+
+def _ema(samples, alpha):
+    weights = [(1 - alpha) ** age for age in range(len(samples) - 1, -1, -1)]
+    return round(sum(sample * weight for sample, weight in zip(samples, weights)) / sum(weights))
+
+
+def test_scans_by_tick_smooth_every_cycle(published, monkeypatch):
+    rssi_smoother = RssiSmoother(method="ema", ema_alpha=0.5)
+    diff_engine = IBeaconDiffEngine()
+    samples = [-80, -60, -70, -50]
+    monkeypatch.setattr(services, '_create_scanner_backend', lambda callback, *args, **kwargs: _Backend(callback, []))
+    tick_scan = services._create_tick_scan(BeaconPrefilter(), uuid_filter=None)
+    for tick, rssi in enumerate(samples):
+        tick_scan['scanner_backend'].readings = [rssi]
+        beacons_list = services._scan_beacons(_ControlChannel(), tick_scan, rssi_smoother, scan_tick=1)
+        services._process_beacons_list(beacons_list, diff_engine, rssi_smoother)
+        assert _published_rssi(published) == [_ema(samples[:tick + 1], 0.5)]
+    # a single reading of the last tick would have published -50
+    assert _published_rssi(published) == [-59]
+
+
+def test_continuous_scans_smooth_every_reading(published, monkeypatch):
+    rssi_smoother = RssiSmoother(method="ema", ema_alpha=0.5)
+    samples = [-80, -60, -70, -50]
+    monkeypatch.setattr(
+        services, '_create_scanner_backend', lambda callback, *args, **kwargs: _Backend(callback, samples))
+    _, beacons_window = services._start_continuous_scan(
+        rssi_smoother, BeaconPrefilter(), scan_window=60, replay_file="")
+    services._process_beacons_list(beacons_window.snapshot(), IBeaconDiffEngine(), rssi_smoother)
+    assert _published_rssi(published) == [_ema(samples, 0.5)]
+
+
+def test_beacons_without_samples_keep_their_raw_rssi():
+    # the window got the first reading of the second beacon before the smoother did
+    rssi_smoother = RssiSmoother(method="median")
+    sampled_beacon = IBeacon(MAC_ADDRESS, UUID, 1, 1, -59, -70)
+    for rssi in (-70, -90, -72):
+        rssi_smoother.add(IBeacon(MAC_ADDRESS, UUID, 1, 1, -59, rssi))
+    new_beacon = IBeacon("c0:ff:ee:00:00:02", UUID, 1, 2, -59, -65)
+    smoothed_beacons_list = rssi_smoother.smooth([new_beacon, sampled_beacon])
+    assert [(beacon.minor, beacon.rssi) for beacon in smoothed_beacons_list] == [(2, -65), (1, -72)]
+    # its next reading starts its samples
+    rssi_smoother.add(IBeacon("c0:ff:ee:00:00:02", UUID, 1, 2, -59, -67))
+    assert [beacon.rssi for beacon in rssi_smoother.smooth([new_beacon])] == [-67]
@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import signal
+import shutil
+
+import pytest
+from flask import Flask
+from flask_restful import Api
+
+import config
+from event import services as event_services
+from metrics.services import METRICS_SHM_PREFIX
+from ibeacon_scanner import resources, services
+from ibeacon_scanner.supervisor import ScannerSupervisor
+
+
+RESTART_TIMEOUT = 20
+POLL_INTERVAL = 0.05
+
+
+def _wait_for(condition, timeout=RESTART_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "the scanner did not get there in time"
+        time.sleep(POLL_INTERVAL)
+
+
+def _running(scanner_supervisor, previous_pid=None):
+    """ True once a scanner other than previous_pid beats, its settings are written by then """
+    process = scanner_supervisor.process
+    return (process is not None and process.pid != previous_pid and process.is_alive()
+            and scanner_supervisor.heartbeat.beat_at > scanner_supervisor.launched_at)
+
+
+@pytest.fixture
+def scanner_supervisor(monkeypatch, tmp_path):
+    # the scanner of this test must not meet the stores and files of other scanners of the host
+    suffix = f"_test_{os.getpid()}"
+    for name in ('SCANNER_SETTINGS_SHM', 'BEACONS_DATA_SHM', 'BEACONS_TABLE_SHM', 'PRESENCE_DATA_SHM', 'POSITIONS_DATA_SHM'):
+        monkeypatch.setattr(services, name, getattr(services, name) + suffix)
+    monkeypatch.setattr(event_services, 'EVENT_PIPELINE_STATS_SHM', event_services.EVENT_PIPELINE_STATS_SHM + suffix)
+    monkeypatch.setattr(event_services, 'EVENT_SINKS', "log")
+    for name in ('FILEPATH_SCANNER_SETTINGS_LOCK', 'FILEPATH_CONTROL_SOCKET', 'FILEPATH_SCANNER_LOCK'):
+        monkeypatch.setattr(services, name, str(tmp_path / os.path.basename(getattr(services, name))))
+    # a scan by tick would take SCAN_TICK seconds before the first beacons
+    settings_filepath = shutil.copy(config.LOCAL_SETTINGS_FILE, tmp_path / "settings.json")
+    monkeypatch.setattr(config, 'LOCAL_SETTINGS_FILE', str(settings_filepath))
+    config.config_write(continuous_scan=True, fake_scan=True, run_flag=True)
+    scanner_supervisor = ScannerSupervisor(
+        services.ibeacon_init_scanner, services.FILEPATH_SCANNER_LOCK, min_backoff=0.1, stop_timeout=5)
+    scanner_supervisor.start()
+    try:
+        yield scanner_supervisor
+    finally:
+        scanner_supervisor.stop()
+
+
+@pytest.fixture
+def client():
+    application = Flask(__name__)
+    resources.ibeacon_add_http_resources_to_api(Api(application), "ibeacon_scanner")
+    return application.test_client()
+
+
+@pytest.mark.parametrize('signum', [signal.SIGKILL, signal.SIGTERM], ids=["SIGKILL", "SIGTERM"])
+def test_settings_changed_at_runtime_survive_a_restart_of_the_scanner(scanner_supervisor, client, signum):
+    _wait_for(lambda: _running(scanner_supervisor))
+    assert client.put("/ibeacon_scanner/settings", json={'scan_window': 7}).status_code == 200
+    assert client.post("/ibeacon_scanner/stop").status_code == 200
+    assert json.loads(open(config.LOCAL_SETTINGS_FILE).read())['SCAN_WINDOW'] == 7
+    previous_pid = scanner_supervisor.process.pid
+
+    os.kill(previous_pid, signum)
+    _wait_for(lambda: _running(scanner_supervisor, previous_pid))
+    # a killed scanner leaves its metrics behind until the next metrics read removes them
+    metrics_filepath = f"/dev/shm/{METRICS_SHM_PREFIX}{previous_pid}"
+    if os.path.exists(metrics_filepath):
+        os.remove(metrics_filepath)
+
+    scanner_settings = services.ibeacon_get_scanner_settings()
+    assert scanner_settings['scan_window'] == 7
+    assert scanner_settings['run_flag'] is False
+    assert scanner_supervisor.restarts == 1
+
+
+def test_a_scanner_stopped_by_the_supervisor_releases_its_stores(scanner_supervisor):
+    _wait_for(lambda: _running(scanner_supervisor))
+    scanner_supervisor.stop()
+    assert not scanner_supervisor.process.is_alive()
+    assert scanner_supervisor.process.exitcode == 0
+    for name in (services.SCANNER_SETTINGS_SHM, services.BEACONS_DATA_SHM, event_services.EVENT_PIPELINE_STATS_SHM):
+        assert not os.path.exists(f"/dev/shm/{name}")
+    assert not os.path.exists(services.FILEPATH_CONTROL_SOCKET)
@@ -0,0 +1,36 @@
+import time
+
+from ibeacon_scanner import services
+from ibeacon_scanner.prefilter import BeaconPrefilter
+
+
+SCANNER_SETTINGS = {
+    'uuid_filter': None,
+    'scan_tick': 0.2,
+    'fake_scan': True,
+    'replay_file': "",
+    'replay_speed': 1.0,
+    'capture_file': "",
+}
+
+
+class _ControlChannel:
+
+    def wait(self, timeout=None):
+        time.sleep(timeout)
+        return False
+
+
+def test_fake_backend_is_reused_across_ticks():
+    assert services._tick_scan_reusable(**SCANNER_SETTINGS)
+    tick_scan = services._create_tick_scan(BeaconPrefilter(), **SCANNER_SETTINGS)
+    scanner_backend = tick_scan['scanner_backend']
+    ticks = [services._scan_beacons(_ControlChannel(), tick_scan, **SCANNER_SETTINGS) for _ in range(3)]
+    assert tick_scan['scanner_backend'] is scanner_backend
+    # each tick fills its own table with the same simulated beacons
+    assert [len(beacons_list) for beacons_list in ticks] == [services.FAKE_BEACONS] * 3
+    assert tick_scan['reported_dropped'] == scanner_backend.dropped
+
+
+def test_hci_backends_are_rebuilt_each_tick():
+    assert not services._tick_scan_reusable(**dict(SCANNER_SETTINGS, fake_scan=False))